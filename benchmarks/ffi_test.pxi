@@ -1,5 +1,14 @@
+;; 1M calls through the FFI, one passing and returning ints, then printf with a string argument
+
+(def c-abs (ffi-fn libc "abs" [CInt] CInt))
+
 (loop [x 0]
-  (if (= x 10000)
+  (if (= x 1000000)
+    x
+    (recur (+ x (c-abs -1)))))
+
+(loop [x 0]
+  (if (= x 1000000)
     x
     (do (printf ".")
         (recur (inc x)))))
@@ -0,0 +1,75 @@
+(require pixie.http.server :as http)
+(require pixie.net :as net)
+(require pixie.async :as async)
+(require pixie.uv :as uv)
+(require pixie.streams :refer :all)
+
+;; Loopback load test for pixie.http.server. Every client sends its requests one after the
+;; other over a single keep-alive connection, the latency of each request is measured with
+;; uv_hrtime. Reports requests per second and latency percentiles.
+
+(def port 40480)
+(def clients 32)
+(def requests-per-client 1000)
+
+(def request (string->buffer "GET / HTTP/1.1\r\nHost: localhost\r\n\r\n"))
+(def response-size (count "HTTP/1.1 200 OK\r\nContent-Length: 5\r\n\r\nhello"))
+
+(defn read-response [conn buf]
+  (loop [left response-size]
+    (when (pos? left)
+      (let [n (read conn buf (buffer-capacity buf))]
+        (assert (pos? n) "Connection closed early")
+        (recur (- left n))))))
+
+(defn run-client []
+  (let [conn (net/tcp-connect "127.0.0.1" port :no-delay true)
+        buf (buffer 4096)]
+    (loop [i 0
+           latencies []]
+      (if (< i requests-per-client)
+        (let [start (uv/uv_hrtime)]
+          (write conn request)
+          (read-response conn buf)
+          (recur (inc i) (conj latencies (- (uv/uv_hrtime) start))))
+        (do (dispose! conn)
+            (dispose! buf)
+            latencies)))))
+
+(defn merge-sorted [xs ys]
+  (loop [xs (seq xs)
+         ys (seq ys)
+         out []]
+    (cond
+      (nil? xs) (into out ys)
+      (nil? ys) (into out xs)
+      (<= (first xs) (first ys)) (recur (next xs) ys (conj out (first xs)))
+      :else (recur xs (next ys) (conj out (first ys))))))
+
+(defn sort-latencies [v]
+  (if (< (count v) 2)
+    v
+    (let [mid (quot (count v) 2)]
+      (merge-sorted (sort-latencies (vec (take mid v)))
+                    (sort-latencies (vec (drop mid v)))))))
+
+(defn percentile [sorted p]
+  (nth sorted (quot (* (dec (count sorted)) p) 100)))
+
+(defn micros [ns]
+  (/ (float ns) 1000))
+
+(let [server (http/serve "127.0.0.1" port (fn [_] {:body "hello"}))
+      start (uv/uv_hrtime)
+      results (vec (map (fn [_] (async/future (run-client)))
+                        (range clients)))
+      latencies (reduce (fn [acc result] (into acc @result)) [] results)
+      elapsed (- (uv/uv_hrtime) start)
+      sorted (sort-latencies latencies)]
+  (dispose! server)
+  (println "requests:" (count sorted) "clients:" clients)
+  (println "requests/s:" (/ (* (float (count sorted)) 1000000000) elapsed))
+  (println "latency us p50:" (micros (percentile sorted 50))
+           "p90:" (micros (percentile sorted 90))
+           "p99:" (micros (percentile sorted 99))
+           "max:" (micros (last sorted))))
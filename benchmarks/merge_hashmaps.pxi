@@ -0,0 +1,9 @@
+;; Merges two 100k entry maps that share all but a handful of entries.
+;; The shared subtrees are reused by the structural merge.
+
+(def base (reduce #(assoc %1 %2 %2) {} (range 100000)))
+(def a (assoc base :a 1))
+(def b (assoc base :b 2))
+
+(dotimes [x 10000]
+  (assert (= 100002 (count (merge a b)))))
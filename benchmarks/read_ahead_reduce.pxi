@@ -0,0 +1,15 @@
+(require pixie.io :as io)
+
+;; Sums the bytes of a 100MB file through a transducer. With :read-ahead the next
+;; reads are in flight while the current buffer is reduced.
+
+(def file-name "/tmp/pixie-read-ahead.bin")
+
+(io/run-command (str "head -c 104857600 /dev/zero | tr '\\000' 'a' > " file-name))
+
+(let [f (io/open-read file-name :buffer-size (* 256 1024) :read-ahead 2)]
+  (assert (= (* 97 104857600)
+             (transduce (comp (map inc) (map dec))
+                        +
+                        f)))
+  (dispose! f))
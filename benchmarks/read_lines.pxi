@@ -0,0 +1,16 @@
+(require pixie.io :as io)
+
+;; Counts the lines and characters of a 100MB file of 100 byte lines. read-line
+;; scans a 64KB buffer for newlines instead of reading a byte at a time.
+
+(def file-name "/tmp/pixie-read-lines.txt")
+
+(io/run-command (str "yes " (apply str (repeat 99 "x"))
+                     " | head -n 1048576 > " file-name))
+
+(let [f (io/open-read file-name)]
+  (assert (= (* 99 1048576)
+             (reduce (fn [acc line] (+ acc (count line)))
+                     0
+                     (io/line-seq f))))
+  (dispose! f))
@@ -0,0 +1,7 @@
+;; Builds a 1M element vector of doubles and sums it. The reduce with + adds the
+;; unboxed doubles directly.
+
+(def v (into (vector-of :double) (range 1000000)))
+
+(dotimes [x 100]
+  (assert (= 499999500000.0 (reduce + 0.0 v))))
@@ -107,6 +107,7 @@ return 0;
   [{:keys [size]} _]
   (cond
    (= size 8) 'pixie.stdlib/CDouble
+   (= size 4) 'pixie.stdlib/CFloat
    :else (assert False "unknown type")))
 
 (defmethod edn-to-ctype :void
@@ -178,21 +179,113 @@ return 0;
      ~(callback-type of-type false)))
 
 
-(defn run-infer [config cmds]
-  (io/spit "/tmp/tmp.cpp" (str (start-string)
-                               (apply str (map emit-infer-code
-                                               cmds))
-                               (end-string)))
-  (println @load-paths)
-  (let [cmd-str (str "c++ "
-                     (apply str (interpose " " pixie.platform/c-flags))
-                     "  /tmp/tmp.cpp "
-                     (apply str (map (fn [x] ( str " -I " x " "))
-                                     @load-paths))
-                     (apply str " " (interpose " " (:cxx-flags *config*)))
-                     " -o /tmp/a.out && /tmp/a.out")
+(def mkdtemp (ffi-fn libc "mkdtemp" [CVoidP] CVoidP))
+(def rename (ffi-fn libc "rename" [CCharP CCharP] CInt))
+(def mkdir (ffi-fn libc "mkdir" [CCharP CInt] CInt))
+(def rmdir (ffi-fn libc "rmdir" [CCharP] CInt))
+(def unlink (ffi-fn libc "unlink" [CCharP] CInt))
+
+;; Set by the --ffi-cache command line option, before the stdlib is loaded
+(when (undefined? (var *cache-dir*))
+  (def *cache-dir* nil))
+(set-dynamic! (var *cache-dir*))
+
+(defn cache-dir
+  "Returns the directory inference results are cached in: the --ffi-cache option if given,
+  otherwise pixie/ffi in $XDG_CACHE_HOME or ~/.cache. Returns nil, and nothing is cached, if
+  there is no home directory."
+  []
+  (or *cache-dir*
+      (when-let [base (or (getenv "XDG_CACHE_HOME")
+                          (when-let [home (getenv "HOME")]
+                            (str home "/.cache")))]
+        (str base "/pixie/ffi"))))
+
+(defn- make-temp-dir []
+  (let [template (str (or (getenv "TMPDIR") "/tmp") "/pixie-ffi-XXXXXX")
+        n (count template)
+        src (string->buffer template)
+        buf (buffer (inc n))]
+    (buffer-copy! src 0 buf 0 n)
+    (pixie.ffi/pack! buf n CUInt8 0)
+    (dispose! src)
+    (assert (mkdtemp buf) (str "Couldn't create a temporary directory from " template))
+    (let [dir (buffer->string buf 0 n)]
+      (dispose! buf)
+      dir)))
+
+(defn- make-dirs
+  ;; Creates dir and any missing parent directories, like mkdir -p
+  [dir]
+  (reduce (fn [parent part]
+            (let [path (str parent "/" part)]
+              ;; fails with EEXIST for the directories that are already there
+              (mkdir path 493) ; 0755
+              path))
+          (if (pixie.string.internal/starts-with dir "/") "" ".")
+          (filter (fn [part] (pos? (count part)))
+                  (pixie.string.internal/split dir "/"))))
+
+(defn- remove-temp-dir
+  ;; Removes the files infer leaves in tmp-dir, then the directory itself
+  [tmp-dir]
+  (unlink (str tmp-dir "/infer.cpp"))
+  (unlink (str tmp-dir "/infer"))
+  (rmdir tmp-dir))
+
+(defn- read-cached
+  ;; Returns the cached inference result for key, nil if there is none or the entry was
+  ;; written for a different key with the same hash
+  [file key]
+  (try
+    (let [[cached-key result] (read-string (io/slurp file))]
+      (when (= cached-key key)
+        result))
+    (catch _ nil)))
+
+(defn- write-cached
+  ;; Writes to a temporary file first and renames it in place, so concurrent loads never
+  ;; read a partial entry
+  [dir file key output tmp-dir]
+  (make-dirs dir)
+  (let [tmp-file (str file "." (last (pixie.string.internal/split tmp-dir "/")))]
+    (io/spit tmp-file (str "[" (pr-str key) "\n" output "]"))
+    (rename tmp-file file)))
+
+(defn- infer
+  ;; Compiles and runs the inference source in a fresh temporary directory, caching the
+  ;; output when cache-file is given
+  [source flags key dir cache-file]
+  (let [tmp-dir (make-temp-dir)
+        cmd-str (str "c++ " tmp-dir "/infer.cpp " flags
+                     " -o " tmp-dir "/infer && " tmp-dir "/infer")
+        _ (io/spit (str tmp-dir "/infer.cpp") source)
         _ (println cmd-str)
-        result (read-string (io/run-command cmd-str))
+        output (io/run-command cmd-str)
+        result (read-string output)]
+    (when (and cache-file (vector? result))
+      (write-cached dir cache-file key output tmp-dir))
+    (remove-temp-dir tmp-dir)
+    result))
+
+(defn run-infer [config cmds]
+  (let [source (str (start-string)
+                    (apply str (map emit-infer-code
+                                    cmds))
+                    (end-string))
+        flags (str (apply str (interpose " " pixie.platform/c-flags))
+                   (apply str (map (fn [x] ( str " -I " x " "))
+                                   @load-paths))
+                   (apply str " " (interpose " " (:cxx-flags *config*))))
+        ;; The flags and the source decide the output. The full key is stored next to the
+        ;; output and compared on read, so a hash collision is only a cache miss
+        key (str flags "\n" source)
+        dir (cache-dir)
+        cache-file (when dir
+                     (str dir "/" (hash key) ".edn"))
+        result (or (when cache-file
+                     (read-cached cache-file key))
+                   (infer source flags key dir cache-file))
         gen (vec (map generate-code cmds result))]
     `(do ~@gen)))
 
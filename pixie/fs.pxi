@@ -1,6 +1,9 @@
 (ns pixie.fs
   (require pixie.path :as path)
-  (require pixie.string :as string))
+  (require pixie.string :as string)
+  (require pixie.stacklets :as st)
+  (require pixie.uv :as uv)
+  (require pixie.ffi :as ffi))
 
 
 (defprotocol IFSPath
@@ -57,8 +60,8 @@
     "Recursivley returns all directories underneath"))
 
 (defn rel-path [a b]
-  (let [paths-a (string/split (abs a) "/")
-        paths-b (string/split (abs b) "/")
+  (let [paths-a (path/-components (path a))
+        paths-b (path/-components (path b))
         ;; Get the common root of the two paths and the bits that diverge
         [common diff-a diff-b] (loop [ra paths-a rb paths-b common []]
                                  (let [ca (first ra)
@@ -97,20 +100,27 @@
     (path/-exists? pathz))
 
   (basename [this]
-    (last (string/split (abs this) "/")))
+    (path/-basename pathz))
+
+  (size [this]
+    (path/-size pathz))
 
   IFile
   ;; TODO: Sort out regex or make strings partitionable. So we can split at
   ;; #".".
   (extension [this]
-    (last (string/split (abs this) ".")))
+    (let [name (path/-basename pathz)
+          dot (string/index-of name ".")]
+      (if (neg? dot)
+        ""
+        (last (string/split name ".")))))
 
   (extension? [this ext]
     (string/ends-with? (abs this) ext))
 
   IObject
   (-hash [this]
-    (hash (abs this)))
+    (path/-hash pathz))
 
   (-eq [this other]
     (if (instance? File other)
@@ -139,30 +149,27 @@
     (path/-exists? pathz))
 
   (basename [this]
-    (last (string/split (abs this) "/")))
+    (path/-basename pathz))
+
+  (size [this]
+    (path/-size pathz))
 
   IDir
   (list [this]
     (vec (map fspath (path/-list-dir pathz))))
 
   (walk [this]
-    (transduce (map #(if (path/-file? %)
-                       (->File %)
-                       (->Dir  %)))
-               conj
-               pathz))
+    (into [] (walker this)))
 
   (walk-files [this]
-    (filter #(instance? File %)
-            (walk this)))
+    (into [] (walker this :type :files)))
 
   (walk-dirs [this]
-    (filter #(instance? Dir %)
-            (walk this)))
+    (into [] (walker this :type :dirs)))
 
   IObject
   (-hash [this]
-    (hash (abs this)))
+    (path/-hash pathz))
 
   (-eq [this other]
     (if (instance? Dir other)
@@ -177,6 +184,36 @@
 
 ;; (deftype Fifo [pathz])
 
+(defn- entry->fspath [p]
+  (if (= (path/-kind p) :dir)
+    (->Dir p)
+    (->File p)))
+
+(deftype Walker [root max-depth kinds globs extensions]
+  IReduce
+  (-reduce [this f init]
+    (reduce (fn [acc p]
+              (f acc (entry->fspath p)))
+            init
+            (path/-walk (path root) max-depth kinds globs extensions))))
+
+(defn walker
+  "Returns a reducible of the Files and Dirs below dir, parents before their children. Entries
+  are typed from the directory listing, so only symlinks are stat'ed, and reducing stops as soon
+  as the reducing function returns a reduced value. Symlinked dirs are returned but not walked.
+
+  Options: :max-depth the number of levels to walk, 1 being the entries of dir itself, :type
+  :files or :dirs to only return those, :glob a pattern or a vector of patterns the basename
+  must match, where * matches any characters and ? a single one, and :extensions a vector of
+  file extensions to keep."
+  [dir & options]
+  (let [options (apply hashmap options)]
+    (->Walker dir
+              (:max-depth options)
+              (:type options)
+              (:glob options)
+              (:extensions options))))
+
 (defn file
   "Returns a file if the path is a file or does not exist. If a different filesystem object exists at the path an error will be thrown."
   [x]
@@ -205,3 +242,205 @@
        :else (throw (str "No file or directory at path: " x)))))
 
 
+
+(defn set-stat-cache-ttl!
+  "Keeps the results of exists?, size and the file/dir checks for ms milliseconds instead of
+  asking the OS every time. Files written through pixie.io are dropped from the cache as they
+  are written. 0, the default, turns the cache off."
+  [ms]
+  (path/-set-stat-ttl! ms))
+
+
+
+;; Watching
+
+(def DEFAULT-DEBOUNCE 100)
+
+;; handles maps every watched absolute path to [handle callback]. Changed paths collect in
+;; pending and every change restarts the debounce timer. Once it fires the pending paths go
+;; to the dispatch loop parked in dispatch-k, or wait for it, with ready? set, while
+;; on-change is still running.
+(deftype Watcher [on-change poll-ms recursive? debounce handles timer timer-cb
+                  pending ready? dispatch-k closed?]
+  IDisposable
+  (-dispose! [this]
+    (when (not closed?)
+      (set-field! this :closed? true)
+      (doseq [[_ [handle cb]] handles]
+        (if poll-ms
+          (uv/uv_fs_poll_stop handle)
+          (uv/uv_fs_event_stop handle))
+        (uv/uv_close handle st/close_cb)
+        (-dispose! cb))
+      (set-field! this :handles {})
+      (uv/uv_timer_stop timer)
+      (uv/uv_close timer st/close_cb)
+      (-dispose! timer-cb)
+      (when-let [k dispatch-k]
+        (set-field! this :dispatch-k nil)
+        (st/-run-later (partial st/run-and-process k nil))))))
+
+(defn- abs-path [x]
+  (if (satisfies? IFSPath x)
+    (abs x)
+    (path/-abs (path/-path x))))
+
+(defn- changed! [watcher p]
+  (when (not (get-field watcher :closed?))
+    (path/-invalidate-stat! p)
+    (set-field! watcher :pending (conj (get-field watcher :pending) p))
+    (uv/uv_timer_start (get-field watcher :timer)
+                       (get-field watcher :timer-cb)
+                       (get-field watcher :debounce)
+                       0)))
+
+(defn- take-pending! [watcher]
+  (let [changes (get-field watcher :pending)]
+    (set-field! watcher :pending #{})
+    (set-field! watcher :ready? false)
+    changes))
+
+(defn- unwatch! [watcher p]
+  ;; Stops watching p and everything below it
+  (let [prefix (str p "/")]
+    (doseq [[watched [handle cb]] (get-field watcher :handles)]
+      (when (or (= watched p) (string/starts-with? watched prefix))
+        (if (get-field watcher :poll-ms)
+          (uv/uv_fs_poll_stop handle)
+          (uv/uv_fs_event_stop handle))
+        (uv/uv_close handle st/close_cb)
+        (-dispose! cb)
+        (set-field! watcher :handles (dissoc (get-field watcher :handles) watched))))))
+
+(declare refresh!)
+
+(defn- event-cb [watcher p dir?]
+  (ffi/ffi-prep-callback uv/uv_fs_event_cb
+                         (fn [_ filename events status]
+                           (try
+                             (if (neg? status)
+                               (println (str "UV Error: " (uv/uv_err_name status)))
+                               (let [changed (if (and dir? filename)
+                                               (str p "/" filename)
+                                               p)]
+                                 (changed! watcher changed)
+                                 (refresh! watcher changed)))
+                             (catch e (println e))))))
+
+(defn- poll-cb [watcher p]
+  (ffi/ffi-prep-callback uv/uv_fs_poll_cb
+                         (fn [_ status prev curr]
+                           (try
+                             (changed! watcher p)
+                             (refresh! watcher p)
+                             (catch e (println e))))))
+
+(defn- watch-path!
+  ;; Starts watching p, returns true unless it was already watched or vanished meanwhile
+  [watcher p]
+  (when (and (not (get-field watcher :closed?))
+             (not (contains? (get-field watcher :handles) p)))
+    (let [poll-ms (get-field watcher :poll-ms)
+          [handle cb result] (if poll-ms
+                               (let [handle (uv/uv_fs_poll_t)
+                                     cb (poll-cb watcher p)]
+                                 (uv/throw-on-error (uv/uv_fs_poll_init (uv/uv_default_loop) handle))
+                                 [handle cb (uv/uv_fs_poll_start handle cb p poll-ms)])
+                               (let [handle (uv/uv_fs_event_t)
+                                     cb (event-cb watcher p (path/-dir? (path/-path p)))]
+                                 (uv/throw-on-error (uv/uv_fs_event_init (uv/uv_default_loop) handle))
+                                 [handle cb (uv/uv_fs_event_start handle cb p 0)]))]
+      (if (neg? result)
+        (do (uv/uv_close handle st/close_cb)
+            (-dispose! cb)
+            (when (not= result uv/UV_ENOENT)
+              (uv/throw-on-error result))
+            false)
+        (do (set-field! watcher :handles (assoc (get-field watcher :handles) p [handle cb]))
+            true)))))
+
+(defn- watch-tree!
+  ;; Watches root and, when recursive, everything below it: only dirs with events, every
+  ;; file and dir when polling. report is :all to report every path found as changed, :new
+  ;; for only the ones not watched yet or nil.
+  [watcher root report]
+  (let [root-path (path/-path root)]
+    (watch-path! watcher root)
+    (when (path/-dir? root-path)
+      (let [poll? (get-field watcher :poll-ms)]
+        (reduce (fn [_ entry]
+                  (let [p (abs entry)
+                        added? (when (or poll? (instance? Dir entry))
+                                 (watch-path! watcher p))]
+                    (when (or (= report :all)
+                              (and added? (= report :new)))
+                      (changed! watcher p))))
+                nil
+                (->Walker (->Dir root-path)
+                          (if (get-field watcher :recursive?) nil 1)
+                          nil nil nil))))))
+
+(defn- refresh!
+  ;; Follows the tree after p changed: new dirs get watched, deleted paths dropped
+  [watcher p]
+  (let [p-path (path/-path p)]
+    (cond
+      (path/-dir? p-path)
+      (if (contains? (get-field watcher :handles) p)
+        (when (get-field watcher :poll-ms)
+          (watch-tree! watcher p :new))
+        (when (get-field watcher :recursive?)
+          (watch-tree! watcher p :all)))
+
+      (not (path/-exists? p-path))
+      (unwatch! watcher p))))
+
+(defn- dispatch-loop [watcher]
+  (loop []
+    (let [changes (if (get-field watcher :ready?)
+                    (take-pending! watcher)
+                    (st/call-cc (fn [k]
+                                  (set-field! watcher :dispatch-k k))))]
+      (when (and changes (not (get-field watcher :closed?)))
+        (try
+          ((get-field watcher :on-change) changes)
+          (catch e (println e)))
+        (recur)))))
+
+(defn watch
+  "Watches paths, a path or a collection of them, each a string, File or Dir, and calls
+  on-change with the set of absolute paths that changed. Directories are watched along with
+  everything below them, new directories are picked up as they appear. Changes are debounced,
+  on-change runs in its own stacklet once no change came in for :debounce milliseconds (100 by
+  default), changes made while it runs are delivered with the next call. Returns a watcher,
+  dispose it to stop watching.
+
+  Changes are reported by the OS through uv_fs_event by default. Options: :debounce, :poll ms
+  to stat every path each ms milliseconds with uv_fs_poll instead, for filesystems that do not
+  report changes such as network mounts, and :recursive false to only watch the given paths
+  and the entries of the given directories."
+  [paths on-change & options]
+  (let [options (apply hashmap options)
+        roots (if (or (string? paths) (satisfies? IFSPath paths))
+                [paths]
+                paths)
+        timer (uv/uv_timer_t)
+        watcher (->Watcher on-change
+                           (:poll options)
+                           (get options :recursive true)
+                           (get options :debounce DEFAULT-DEBOUNCE)
+                           {} timer nil #{} false nil false)]
+    (set-field! watcher :timer-cb
+                (ffi/ffi-prep-callback uv/uv_timer_cb
+                                       (fn [_]
+                                         (try
+                                           (if-let [k (get-field watcher :dispatch-k)]
+                                             (do (set-field! watcher :dispatch-k nil)
+                                                 (st/run-and-process k (take-pending! watcher)))
+                                             (set-field! watcher :ready? true))
+                                           (catch e (println e))))))
+    (uv/throw-on-error (uv/uv_timer_init (uv/uv_default_loop) timer))
+    (doseq [root roots]
+      (watch-tree! watcher (abs-path root) nil))
+    (st/spawn (dispatch-loop watcher))
+    watcher))
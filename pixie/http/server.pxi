@@ -0,0 +1,279 @@
+(ns pixie.http.server
+  (require pixie.streams :refer :all)
+  (require pixie.net :as net)
+  (require pixie.string :as s))
+
+(def READ-SIZE (* 16 1024))
+(def MAX-HEAD-SIZE (* 64 1024))
+(def DEFAULT-MAX-BODY-SIZE (* 8 1024 1024))
+
+(def reasons
+  {100 "Continue"
+   200 "OK"
+   201 "Created"
+   202 "Accepted"
+   204 "No Content"
+   301 "Moved Permanently"
+   302 "Found"
+   304 "Not Modified"
+   400 "Bad Request"
+   401 "Unauthorized"
+   403 "Forbidden"
+   404 "Not Found"
+   405 "Method Not Allowed"
+   413 "Payload Too Large"
+   431 "Request Header Fields Too Large"
+   500 "Internal Server Error"
+   501 "Not Implemented"
+   503 "Service Unavailable"})
+
+;; Bytes start to end of buf have been received on conn but not parsed yet. Reads go into
+;; scratch and are appended to buf, the parsed prefix is dropped by moving the rest to the front.
+;; Only request and header lines are decoded, the rest of the parsing works on the bytes.
+(deftype RequestReader [conn buf start end scratch max-body-size])
+
+(defn- buffered [rdr]
+  (- (get-field rdr :end) (get-field rdr :start)))
+
+(defn- compact! [rdr]
+  (let [start (get-field rdr :start)]
+    (when (pos? start)
+      (let [buf (get-field rdr :buf)
+            n (buffered rdr)]
+        (buffer-copy! buf start buf 0 n)
+        (set-buffer-count! buf n)
+        (set-field! rdr :start 0)
+        (set-field! rdr :end n)))))
+
+(defn- ensure-capacity! [rdr size]
+  (let [buf (get-field rdr :buf)]
+    (when (< (buffer-capacity buf) size)
+      (let [grown (checkout-buffer size)
+            end (get-field rdr :end)]
+        (buffer-copy! buf 0 grown 0 end)
+        (set-buffer-count! grown end)
+        (return-buffer! buf)
+        (set-field! rdr :buf grown)))))
+
+(defn- fill! [rdr]
+  ;; Appends the next chunk read from the connection, returns false at the end of the input
+  (compact! rdr)
+  (let [scratch (get-field rdr :scratch)
+        n (read (get-field rdr :conn) scratch (buffer-capacity scratch))]
+    (when (pos? n)
+      (let [end (get-field rdr :end)]
+        (ensure-capacity! rdr (+ end n))
+        (buffer-copy! scratch 0 (get-field rdr :buf) end n)
+        (set-field! rdr :end (+ end n))
+        (set-buffer-count! (get-field rdr :buf) (+ end n))))
+    (pos? n)))
+
+(defn- fill-until! [rdr n]
+  (loop []
+    (cond
+      (>= (buffered rdr) n) true
+      (fill! rdr) (recur)
+      :else false)))
+
+(defn- head-lines
+  ;; Returns [lines body-start] once the whole head of a request is buffered, nil before that.
+  ;; Blank lines in front of a request are skipped.
+  [rdr]
+  (let [buf (get-field rdr :buf)]
+    (loop [pos (get-field rdr :start)
+           lines []]
+      (let [lf (buffer-index-of buf pos 10)]
+        (when (>= lf 0)
+          (let [eol (if (and (> lf pos) (= (nth buf (dec lf)) 13))
+                      (dec lf)
+                      lf)]
+            (cond
+              (not= eol pos) (recur (inc lf) (conj lines (buffer->string buf pos eol)))
+              (empty? lines) (recur (inc lf) lines)
+              :else [lines (inc lf)])))))))
+
+(defn- parse-request-line [line]
+  (let [parts (s/split line " ")]
+    (when (and (= (count parts) 3)
+               (s/starts-with? (nth parts 2) "HTTP/"))
+      (let [[method target version] parts
+            q (s/index-of target "?")]
+        {:method method
+         :uri (if (neg? q) target (s/substring target 0 q))
+         :query (when (>= q 0) (s/substring target (inc q)))
+         :version version}))))
+
+(defn- parse-headers
+  ;; Header names are lower-cased, the values of repeated headers are joined with commas
+  [lines]
+  (reduce (fn [headers line]
+            (let [colon (s/index-of line ":")]
+              (if (pos? colon)
+                (let [name (s/lower-case (s/substring line 0 colon))
+                      value (s/trim (s/substring line (inc colon)))]
+                  (assoc headers name (if-let [prev (get headers name)]
+                                        (str prev ", " value)
+                                        value)))
+                (reduced nil))))
+          {}
+          lines))
+
+(defn- parse-length [s]
+  (when (< 0 (count s) 19)
+    (reduce (fn [n ch]
+              (let [digit (- (int ch) 48)]
+                (if (<= 0 digit 9)
+                  (+ (* n 10) digit)
+                  (reduced nil))))
+            0
+            s)))
+
+(defn- read-request
+  ;; Returns the next request on the connection, nil at the end of the input, or {:error status}
+  ;; for a request that can't be handled
+  [rdr]
+  (loop []
+    (if-let [head (head-lines rdr)]
+      (let [[lines body-start] head
+            request (parse-request-line (first lines))
+            headers (parse-headers (next lines))
+            length (if-let [value (get headers "content-length")]
+                     (parse-length value)
+                     0)]
+        (cond
+          (or (nil? request) (nil? headers) (nil? length)) {:error 400}
+          (get headers "transfer-encoding") {:error 501}
+          (> length (get-field rdr :max-body-size)) {:error 413}
+          :else
+          (let [body-offset (- body-start (get-field rdr :start))]
+            (when (and (pos? length)
+                       (< (buffered rdr) (+ body-offset length))
+                       (= (s/lower-case (get headers "expect" "")) "100-continue"))
+              (write-all (get-field rdr :conn) ["HTTP/1.1 100 Continue\r\n\r\n"]))
+            (when (fill-until! rdr (+ body-offset length))
+              (let [body-start (+ (get-field rdr :start) body-offset)
+                    body-end (+ body-start length)]
+                (set-field! rdr :start body-end)
+                (assoc request
+                       :headers headers
+                       :body (when (pos? length)
+                               (buffer->string (get-field rdr :buf) body-start body-end))))))))
+      (cond
+        (>= (buffered rdr) MAX-HEAD-SIZE) {:error 431}
+        (fill! rdr) (recur)
+        :else nil))))
+
+(defn- keep-alive? [request]
+  (let [connection (s/lower-case (get-in request [:headers "connection"] ""))]
+    (if (= (:version request) "HTTP/1.0")
+      (= connection "keep-alive")
+      (not= connection "close"))))
+
+(defn- hex [n]
+  (let [digit (str (nth "0123456789abcdef" (rem n 16)))]
+    (if (< n 16)
+      digit
+      (str (hex (quot n 16)) digit))))
+
+(defn- header-line [[k v]]
+  (str (name k) ": " v "\r\n"))
+
+(defn- head-string [request status headers framing keep-alive?]
+  (str "HTTP/1.1 " status " " (get reasons status "Unknown") "\r\n"
+       (transduce (map header-line) string-builder headers)
+       framing
+       (cond
+         (not keep-alive?) "Connection: close\r\n"
+         (= (:version request) "HTTP/1.0") "Connection: keep-alive\r\n"
+         :else "")
+       "\r\n"))
+
+(defn- write-chunk [conn piece]
+  (let [buf (if (string? piece) (string->buffer piece) piece)
+        n (count buf)]
+    (when (pos? n)
+      (write-all conn [(str (hex n) "\r\n") buf "\r\n"]))
+    (when (string? piece)
+      (dispose! buf))))
+
+(defn- write-response
+  ;; Returns true if the connection can be kept open
+  [conn request response keep-alive?]
+  (let [status (get response :status 200)
+        headers (get response :headers {})
+        body (get response :body)
+        send-body? (not= (:method request) "HEAD")
+        fixed? (or (nil? body) (string? body) (instance? Buffer body))
+        chunked? (and (not fixed?) (not= (:version request) "HTTP/1.0"))
+        keep-alive? (and keep-alive? (or fixed? chunked?))]
+    (cond
+      fixed?
+      (let [buf (if (string? body) (string->buffer body) body)
+            head (head-string request status headers
+                              (str "Content-Length: " (if buf (count buf) 0) "\r\n")
+                              keep-alive?)]
+        (write-all conn (if (and buf send-body?) [head buf] [head]))
+        (when (string? body)
+          (dispose! buf)))
+
+      chunked?
+      (do (write-all conn [(head-string request status headers "Transfer-Encoding: chunked\r\n" keep-alive?)])
+          (when send-body?
+            (doseq [piece body]
+              (write-chunk conn piece))
+            (write-all conn ["0\r\n\r\n"])))
+
+      ;; HTTP/1.0 clients don't know chunked encoding, the end of the body is the end of the connection
+      :else
+      (do (write-all conn [(head-string request status headers "" false)])
+          (when send-body?
+            (write-all conn body))))
+    keep-alive?))
+
+(defn- error-response [status]
+  {:status status
+   :headers {"Content-Type" "text/plain"}
+   :body (get reasons status)})
+
+(defn- serve-connection [handler options conn]
+  (let [rdr (->RequestReader conn (checkout-buffer READ-SIZE) 0 0 (checkout-buffer READ-SIZE)
+                             (get options :max-body-size DEFAULT-MAX-BODY-SIZE))]
+    (try
+      (loop []
+        (when-let [request (read-request rdr)]
+          (if-let [status (:error request)]
+            (write-response conn {} (error-response status) false)
+            (let [response (try
+                             (handler request)
+                             (catch e
+                               (println e)
+                               (error-response 500)))]
+              (when (write-response conn request response (keep-alive? request))
+                (recur))))))
+      (catch e
+        (println e))
+      (finally
+        (return-buffer! (get-field rdr :buf))
+        (return-buffer! (get-field rdr :scratch))))))
+
+(defn serve
+  {:doc "Serves HTTP/1.1 on port of the IPv4 address host. Connections are kept alive and
+         pipelined requests are answered in order. handler is called with a request map of
+         :method, :uri, :query, :version, :headers (lower-cased names to values) and :body (the
+         request body decoded as UTF-8, or nil) and returns a response map of :status (default
+         200), :headers and :body. A nil, String or Buffer body is sent with a Content-Length,
+         any other seqable body is sent chunked, one chunk per String or Buffer in it.
+         Dispose the returned server to stop listening.
+
+         Options: :max-body-size in bytes, larger requests are answered with a 413, plus the
+         options of pixie.net/tcp-server. :no-delay defaults to true."
+   :added "0.1"}
+  [host port handler & options]
+  (let [options (apply hashmap options)]
+    (net/tcp-server host port
+                    (fn [conn]
+                      (serve-connection handler options conn))
+                    :backlog (get options :backlog net/DEFAULT-BACKLOG)
+                    :keep-alive (:keep-alive options)
+                    :no-delay (get options :no-delay true)
+                    :write-high-water (get options :write-high-water net/DEFAULT-WRITE-HIGH-WATER))))
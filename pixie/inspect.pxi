@@ -0,0 +1,14 @@
+(ns pixie.inspect
+  (require pixie.inspect.internal :as ii))
+
+(defn footprint
+  {:doc "Estimates the memory held by x. Every object reachable from x is counted once, even if
+it is shared by several parts of x.
+
+Returns a map of :bytes, :objects, :types (the number of objects of each type) and
+:shared-bytes, the part of :bytes that is also reachable from baseline. Comparing a
+collection with an older version of itself shows how much structure the two share."
+   :signatures [[x] [x baseline]]
+   :added "0.1"}
+  ([x] (ii/footprint x nil))
+  ([x baseline] (ii/footprint x baseline)))
@@ -13,44 +13,55 @@
 
 
 
-(def DEFAULT-BUFFER-SIZE 1024)
+(def DEFAULT-BUFFER-SIZE (* 64 1024))
 
-(deftype FileStream [fp]
+(defn- fread-into [fp buffer]
+  (let [read-count (fread buffer 1 (buffer-capacity buffer) fp)]
+    (set-buffer-count! buffer read-count)
+    read-count))
+
+(defn- line-reader [stream]
+  (when (nil? (get-field stream :reader))
+    (let [fp (get-field stream :fp)]
+      (set-field! stream :reader (fill-reader (fn [buf] (fread-into fp buf))
+                                              (get-field stream :buffer-size)))))
+  (get-field stream :reader))
+
+(deftype FileStream [fp reader buffer-size]
   IInputStream
   (read [this buffer len]
     (assert (<= (buffer-capacity buffer) len)
             "Not enough capacity in the buffer")
-    (let [read-count (fread buffer 1 len fp)]
-      (set-buffer-count! buffer read-count)
-      read-count))
+    (if reader
+      (read reader buffer len)
+      (fread-into fp buffer)))
   (read-byte [this]
     (fgetc buffer))
+  ILineReader
+  (-read-line [this]
+    (-read-line (line-reader this)))
   IDisposable
   (-dispose! [this]
+    (when reader
+      (dispose! reader))
     (fclose fp))
   IReduce
   (-reduce [this f init]
-    (let [buf (buffer DEFAULT-BUFFER-SIZE)
-          rrf (preserving-reduced f)]
-      (loop [acc init]
-        (let [read-count (read this buf DEFAULT-BUFFER-SIZE)]
-          (if (> read-count 0)
-            (let [result (reduce rrf acc buf)]
-              (if (not (reduced? result))
-                (recur result)
-                @result))
-            acc))))))
+    (reduce-stream this f init buffer-size)))
 
 (defn open-read
-  {:doc "Open a file for reading, returning a IInputStream"
+  {:doc "Open a file for reading, returning a IInputStream. Takes a :buffer-size option, the
+         number of bytes to read at a time when reducing or reading lines."
    :added "0.1"}
-  [filename]
+  [filename & options]
   (assert (string? filename) "Filename must be a string")
-  (->FileStream (fopen filename "r")))
+  (let [options (apply hashmap options)]
+    (->FileStream (fopen filename "r")
+                  nil
+                  (get options :buffer-size DEFAULT-BUFFER-SIZE))))
 
-(defn read-line
-  "Read one line from input-stream for each invocation.
-   nil when all lines have been read"
+(defn- read-line-bytewise
+  ;; Reads a line from an IInputStream that can't read lines itself, one byte per read
   [input-stream]
   (let [line-feed (into #{} (map int [\newline \return]))
         buf (buffer 1)]
@@ -64,9 +75,18 @@
 
           :else (apply str (map char acc)))))))
 
+(defn read-line
+  "Read one line from input-stream for each invocation.
+   nil when all lines have been read. ILineReaders read whole lines at a time, other
+   IInputStreams are read one byte per call, wrap them with buffered-reader instead"
+  [input-stream]
+  (if (satisfies? ILineReader input-stream)
+    (-read-line input-stream)
+    (read-line-bytewise input-stream)))
+
 (defn line-seq
   "Returns the lines of text from input-stream as a lazy sequence of strings.
-   input-stream must implement IInputStream"
+   input-stream must implement ILineReader or IInputStream"
   [input-stream]
   (when-let [line (read-line input-stream)]
     (cons line (lazy-seq (line-seq input-stream)))))
@@ -79,6 +99,12 @@
   IOutputStream
   (write [this buffer]
     (fwrite buffer 1 (count buffer) fp))
+  IGatheringOutputStream
+  (-write-all [this sources]
+    ;; stdio already batches the writes
+    (gather-batches sources (fn [buffers]
+                              (doseq [buffer buffers]
+                                (fwrite buffer 1 (count buffer) fp)))))
   IDisposable
   (-dispose! [this]
     (fclose fp)))
@@ -95,45 +121,62 @@
            (+ cnt written)))))))
 
 
-(defn spit [filename val]
-  (transduce (map int)
-             (file-output-rf filename)
-             (str val)))
-
-(defn slurp [filename]
-  (let [c (->FileStream (fopen filename "r"))
-        result (transduce
-                (map char)
-                string-builder
-                c)]
-    (dispose! c)
-    result))
+(def SLURP-CHUNK-SIZE (* 64 1024))
 
-(deftype ProcessInputStream [fp]
+(defn spit
+  {:doc "Writes (str val) to filename as UTF-8, replacing the contents of the file"
+   :added "0.1"}
+  [filename val]
+  (let [fp (fopen filename "w")
+        buf (string->buffer (str val))]
+    (assert fp (str "Couldn't open " filename))
+    (fwrite buf 1 (count buf) fp)
+    (dispose! buf)
+    (fclose fp)
+    nil))
+
+(defn slurp
+  {:doc "Reads the whole file and decodes it from UTF-8 into a string"
+   :added "0.1"}
+  [filename]
+  (let [fp (fopen filename "r")]
+    (assert fp (str "Couldn't open " filename))
+    (loop [buf (checkout-buffer SLURP-CHUNK-SIZE)
+           used 0]
+      (if (= used (buffer-capacity buf))
+        (let [grown (checkout-buffer (* 2 used))]
+          (buffer-copy! buf 0 grown 0 used)
+          (return-buffer! buf)
+          (recur grown used))
+        (let [read-count (fread (pixie.ffi/ptr-add buf used) 1 (- (buffer-capacity buf) used) fp)]
+          (if (pos? read-count)
+            (recur buf (+ used read-count))
+            (let [result (buffer->string buf 0 used)]
+              (return-buffer! buf)
+              (fclose fp)
+              result)))))))
+
+(deftype ProcessInputStream [fp reader buffer-size]
   IInputStream
   (read [this buffer len]
     (assert (<= (buffer-capacity buffer) len)
             "Not enough capacity in the buffer")
-    (let [read-count (fread buffer 1 len fp)]
-      (set-buffer-count! buffer read-count)
-      read-count))
+    (if reader
+      (read reader buffer len)
+      (fread-into fp buffer)))
   (read-byte [this]
     (fgetc fp))
+  ILineReader
+  (-read-line [this]
+    (-read-line (line-reader this)))
   IDisposable
   (-dispose! [this]
+    (when reader
+      (dispose! reader))
     (pclose fp))
   IReduce
   (-reduce [this f init]
-    (let [buf (buffer DEFAULT-BUFFER-SIZE)
-          rrf (preserving-reduced f)]
-      (loop [acc init]
-        (let [read-count (read this buf DEFAULT-BUFFER-SIZE)]
-          (if (> read-count 0)
-            (let [result (reduce rrf acc buf)]
-              (if (not (reduced? result))
-                (recur result)
-                @result))
-            acc))))))
+    (reduce-stream this f init buffer-size)))
 
 
 (defn popen-read
@@ -141,11 +184,11 @@
    :added "0.1"}
   [command]
   (assert (string? command) "Command must be a string")
-  (->ProcessInputStream (popen command "r")))
+  (->ProcessInputStream (popen command "r") nil DEFAULT-BUFFER-SIZE))
 
 
 (defn run-command [command]
-  (let [c (->ProcessInputStream (popen command "r"))
+  (let [c (->ProcessInputStream (popen command "r") nil DEFAULT-BUFFER-SIZE)
         result (transduce
                  (map char)
                  string-builder
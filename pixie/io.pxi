@@ -4,7 +4,9 @@
   (require pixie.uv :as uv)
   (require pixie.stacklets :as st)
   (require pixie.ffi :as ffi)
-  (require pixie.ffi-infer :as ffi-infer))
+  (require pixie.ffi-infer :as ffi-infer)
+  (require pixie.path :as path)
+  (require pixie.io.internal :as ioi))
 
 (defmacro defuvfsfn [nm args return]
   `(defn ~nm ~args
@@ -29,50 +31,170 @@
 (defuvfsfn fs_write [file bufs nbufs offset] :result)
 (defuvfsfn fs_close [file] :result)
 
+(defn- dirent-type [type]
+  (cond
+    (= type uv/UV_DIRENT_FILE) :file
+    (= type uv/UV_DIRENT_DIR) :dir
+    (= type uv/UV_DIRENT_LINK) :link
+    :else :other))
 
-(def DEFAULT-BUFFER-SIZE 1024)
+(defn- scandir-entries
+  ;; Collects the [name type] pairs of a completed uv_fs_scandir, or returns its error
+  [req]
+  (if (neg? (:result req))
+    (:result req)
+    (let [ent (uv/uv_dirent_t)]
+      (loop [entries []]
+        (if (neg? (uv/uv_fs_scandir_next req ent))
+          (do (dispose! ent)
+              entries)
+          ;; name is the first member of uv_dirent_t
+          (recur (conj entries [(ffi/unpack ent 0 CCharP) (dirent-type (:type ent))])))))))
 
-(deftype FileStream [fp offset uvbuf]
+(defuvfsfn fs_scandir [path flags] scandir-entries)
+
+
+(def DEFAULT-BUFFER-SIZE (* 64 1024))
+
+(defn- read-file-at [stream buffer start]
+  (let [uvbuf (get-field stream :uvbuf)
+        offset (get-field stream :offset)
+        _ (uv/buf-base uvbuf (ffi/ptr-add buffer start))
+        _ (uv/buf-len uvbuf (- (buffer-capacity buffer) start))
+        read-count (fs_read (get-field stream :fp) uvbuf 1 offset)]
+    (assert (not (neg? read-count)) "Read Error")
+    (set-field! stream :offset (+ offset read-count))
+    read-count))
+
+(defn- read-file [stream buffer]
+  (let [read-count (read-file-at stream buffer 0)]
+    (set-buffer-count! buffer read-count)
+    read-count))
+
+(deftype PendingRead [buffer uvbuf req cb k result done?])
+
+(defn- start-read
+  "Issues a uv_fs_read of buffer at offset without parking the current stacklet.
+   await-read returns the read count once it completes."
+  [fp buffer offset]
+  (let [uvbuf (uv/uv_buf_t)
+        req (uv/uv_fs_t)
+        pending (->PendingRead buffer uvbuf req nil nil 0 false)]
+    (set-field! pending :cb (ffi/ffi-prep-callback uv/uv_fs_cb
+                                                  (fn [_]
+                                                    (try
+                                                      (set-field! pending :result (:result req))
+                                                      (set-field! pending :done? true)
+                                                      (uv/uv_fs_req_cleanup req)
+                                                      (-dispose! (get-field pending :cb))
+                                                      (when-let [k (get-field pending :k)]
+                                                        (st/run-and-process k (get-field pending :result)))
+                                                      (catch e (println e))))))
+    (uv/buf-base uvbuf buffer)
+    (uv/buf-len uvbuf (buffer-capacity buffer))
+    (assert (not (neg? (uv/uv_fs_read (uv/uv_default_loop) req fp uvbuf 1 offset (get-field pending :cb))))
+            "Read Error")
+    pending))
+
+(defn- await-read [pending]
+  (let [result (if (get-field pending :done?)
+                 (get-field pending :result)
+                 (st/call-cc (fn [k] (set-field! pending :k k))))]
+    (dispose! (get-field pending :uvbuf))
+    (dispose! (get-field pending :req))
+    (assert (not (neg? result)) "Read Error")
+    (set-buffer-count! (get-field pending :buffer) result)
+    result))
+
+(defn- drain-reads [pending]
+  (reduce (fn [_ p]
+            (await-read p)
+            (return-buffer! (get-field p :buffer)))
+          nil
+          pending))
+
+(defn- reduce-ahead
+  "Reduces over the file while keeping depth reads in flight, so libuv's thread pool reads the
+   next buffers while f works on the current one."
+  [stream f init depth]
+  (let [rrf (preserving-reduced f)
+        fp (get-field stream :fp)
+        size (get-field stream :buffer-size)]
+    (loop [pending (queue)
+           next-offset (get-field stream :offset)
+           acc init]
+      (if (<= (count pending) depth)
+        (let [p (start-read fp (checkout-buffer size) next-offset)]
+          (recur (conj pending p)
+                 (+ next-offset (buffer-capacity (get-field p :buffer)))
+                 acc))
+        (let [p (peek pending)
+              pending (pop pending)
+              buf (get-field p :buffer)
+              read-count (await-read p)
+              result (if (pos? read-count)
+                       (reduce rrf acc buf)
+                       acc)]
+          (return-buffer! buf)
+          (set-field! stream :offset (+ (get-field stream :offset) read-count))
+          (cond
+            (reduced? result) (do (drain-reads pending)
+                                  @result)
+
+            (= read-count (buffer-capacity buf)) (recur pending next-offset result)
+
+            ;; A short read, the reads issued after it started at the wrong offset
+            :else (do (drain-reads pending)
+                      (if (pos? read-count)
+                        (recur (queue) (get-field stream :offset) result)
+                        result))))))))
+
+(deftype FileStream [fp offset uvbuf reader buffer-size read-ahead]
   IInputStream
   (read [this buffer len]
     (assert (<= (buffer-capacity buffer) len)
             "Not enough capacity in the buffer")
-    (let [_ (pixie.ffi/set! uvbuf :base buffer)
-          _ (pixie.ffi/set! uvbuf :len (buffer-capacity buffer))
-          read-count (fs_read fp uvbuf 1 offset)]
-      (assert (not (neg? read-count)) "Read Error")
-      (set-field! this :offset (+ offset read-count))
-      (set-buffer-count! buffer read-count)
-      read-count))
+    (if reader
+      (read reader buffer len)
+      (read-file this buffer)))
+  ILineReader
+  (-read-line [this]
+    (when (nil? reader)
+      (set-field! this :reader (fill-reader (fn [buf] (read-file this buf))
+                                            buffer-size)))
+    (-read-line reader))
   IDisposable
   (-dispose! [this]
+    (when reader
+      (dispose! reader))
     (dispose! uvbuf)
     (fs_close fp))
   IReduce
   (-reduce [this f init]
-    (let [buf (buffer DEFAULT-BUFFER-SIZE)
-          rrf (preserving-reduced f)]
-      (loop [acc init]
-        (let [read-count (read this buf DEFAULT-BUFFER-SIZE)]
-          (if (> read-count 0)
-            (let [result (reduce rrf acc buf)]
-              (if (not (reduced? result))
-                (recur result)
-                @result))
-            acc))))))
+    (if (and (pos? read-ahead)
+             (nil? reader))
+      (reduce-ahead this f init read-ahead)
+      (reduce-stream this f init buffer-size))))
 
 
 (defn open-read
-  {:doc "Open a file for reading, returning a IInputStream"
+  {:doc "Open a file for reading, returning a IInputStream. Takes a :buffer-size option, the
+         number of bytes to read at a time when reducing or reading lines, and a :read-ahead
+         option, the number of reads reduce keeps in flight while the current buffer is reduced."
    :added "0.1"}
-  [filename]
+  [filename & options]
   (assert (string? filename) "Filename must be a string")
-  (->FileStream (fs_open filename uv/O_RDONLY 0) 0 (uv/uv_buf_t)))
+  (let [options (apply hashmap options)]
+    (->FileStream (fs_open filename uv/O_RDONLY 0)
+                  0
+                  (uv/uv_buf_t)
+                  nil
+                  (get options :buffer-size DEFAULT-BUFFER-SIZE)
+                  (get options :read-ahead 0))))
 
 
-(defn read-line
-  "Read one line from input-stream for each invocation.
-   nil when all lines have been read"
+(defn- read-line-bytewise
+  ;; Reads a line from an IInputStream that can't read lines itself, one byte per read
   [input-stream]
   (let [line-feed (into #{} (map int [\newline \return]))
         buf (buffer 1)]
@@ -86,29 +208,76 @@
 
           :else (apply str (map char acc)))))))
 
+(defn read-line
+  "Read one line from input-stream for each invocation.
+   nil when all lines have been read. ILineReaders read whole lines at a time, other
+   IInputStreams are read one byte per call, wrap them with buffered-reader instead"
+  [input-stream]
+  (if (satisfies? ILineReader input-stream)
+    (-read-line input-stream)
+    (read-line-bytewise input-stream)))
+
 (defn line-seq
   "Returns the lines of text from input-stream as a lazy sequence of strings.
-   input-stream must implement IInputStream"
+   input-stream must implement ILineReader or IInputStream"
   [input-stream]
   (when-let [line (read-line input-stream)]
     (cons line (lazy-seq (line-seq input-stream)))))
 
-(deftype FileOutputStream [fp offset uvbuf]
+(defn- write-gathered
+  "Writes the buffers with one uv_fs_write, starting over from the first unwritten byte
+   after a partial write."
+  [stream buffers]
+  (let [n (count buffers)
+        sz (ffi/struct-size uv/uv_buf_t)
+        iovecs (checkout-buffer (* n sz))]
+    (loop [first-buf 0
+           skip 0]
+      (when (< first-buf n)
+        (dotimes [i (- n first-buf)]
+          (let [buf (nth buffers (+ first-buf i))
+                start (if (zero? i) skip 0)
+                iov (ffi/cast (ffi/ptr-add iovecs (* i sz)) uv/uv_buf_t)]
+            (uv/buf-base iov (ffi/ptr-add buf start))
+            (uv/buf-len iov (- (count buf) start))))
+        (let [offset (get-field stream :offset)
+              write-count (fs_write (get-field stream :fp) iovecs (- n first-buf) offset)]
+          (when (neg? write-count)
+            (return-buffer! iovecs)
+            (throw (uv/uv_err_name write-count)))
+          (set-field! stream :offset (+ offset write-count))
+          (let [[idx left] (loop [idx first-buf
+                                  left (+ skip write-count)]
+                             (if (and (< idx n)
+                                      (>= left (count (nth buffers idx))))
+                               (recur (inc idx) (- left (count (nth buffers idx))))
+                               [idx left]))]
+            (recur idx left)))))
+    (return-buffer! iovecs)
+    nil))
+
+(deftype FileOutputStream [fp offset uvbuf buffer-size filename]
+  IGatheringOutputStream
+  (-write-all [this sources]
+    (gather-batches sources (fn [buffers]
+                              (write-gathered this buffers))))
   IOutputStream
   (write [this buffer]
     (loop [buffer-offset 0]
-      (let [_ (pixie.ffi/set! uvbuf :base (ffi/ptr-add buffer buffer-offset))
-            _ (pixie.ffi/set! uvbuf :len (- (count buffer) buffer-offset))
+      (let [_ (uv/buf-base uvbuf (ffi/ptr-add buffer buffer-offset))
+            _ (uv/buf-len uvbuf (- (count buffer) buffer-offset))
             write-count (fs_write fp uvbuf 1 offset)]
         (when (neg? write-count)
-          (throw (uv/uv_err_name read-count)))
+          (throw (uv/uv_err_name write-count)))
         (set-field! this :offset (+ offset write-count))
         (if (< (+ buffer-offset write-count) (count buffer))
           (recur (+ buffer-offset write-count))
           write-count))))
   IDisposable
   (-dispose! [this]
-    (fclose fp)))
+    (dispose! uvbuf)
+    (fs_close fp)
+    (path/-invalidate-stat! filename)))
 
 (deftype BufferedOutputStream [downstream idx buffer]
   IByteOutputStream
@@ -122,10 +291,11 @@
   IDisposable
   (-dispose! [this]
     (set-buffer-count! buffer idx)
-    (write downstream buffer)))
+    (write downstream buffer)
+    (return-buffer! buffer)))
 
 (defn buffered-output-stream [downstream size]
-  (->BufferedOutputStream downstream 0 (buffer size)))
+  (->BufferedOutputStream downstream 0 (checkout-buffer size)))
 
 
 (defn throw-on-error [result]
@@ -134,70 +304,163 @@
   result)
 
 (defn open-write
-  {:doc "Open a file for reading, returning a IInputStream"
+  {:doc "Open a file for writing, returning a IOutputStream. Takes a :buffer-size option, the
+         size of the buffer used when writing the file a byte at a time."
    :added "0.1"}
-  [filename]
+  [filename & options]
   (assert (string? filename) "Filename must be a string")
-  (->FileOutputStream (throw-on-error (fs_open filename
-                                               (bit-or uv/O_WRONLY uv/O_CREAT)
-                                               uv/S_IRWXU))
-                      0
-                      (uv/uv_buf_t)))
+  (let [options (apply hashmap options)
+        fp (throw-on-error (fs_open filename
+                                    (bit-or uv/O_WRONLY
+                                            (bit-or uv/O_CREAT uv/O_TRUNC))
+                                    uv/S_IRWXU))]
+    (path/-invalidate-stat! filename)
+    (->FileOutputStream fp
+                        0
+                        (uv/uv_buf_t)
+                        (get options :buffer-size DEFAULT-BUFFER-SIZE)
+                        filename)))
 
 
-(defn file-output-rf [filename]
-  (let [fp (buffered-output-stream (open-write filename)
-                                   DEFAULT-BUFFER-SIZE)]
+(defn file-output-rf [filename & options]
+  (let [out (apply open-write filename options)
+        fp (buffered-output-stream out (get-field out :buffer-size))]
     (fn ([] 0)
-      ([_] (dispose! fp))
+      ([_]
+       (dispose! fp)
+       (dispose! out))
       ([_ chr]
        (assert (integer? chr))
        (write-byte fp chr)
        nil))))
 
 
-(defn spit [filename val]
-  (transduce (map int)
-             (file-output-rf filename)
-             (str val)))
+(def SLURP-CHUNK-SIZE (* 64 1024))
 
-(defn slurp [filename]
-  (let [c (open-read filename)
-        result (transduce
-                (map char)
-                string-builder
-                c)]
-    (dispose! c)
-    result))
+(defn spit
+  {:doc "Writes (str val) to filename as UTF-8, replacing the contents of the file"
+   :added "0.1"}
+  [filename val]
+  (let [out (open-write filename)
+        buf (string->buffer (str val))]
+    (write out buf)
+    (dispose! buf)
+    (dispose! out)))
 
-(defn run-command [command]
-  (st/apply-blocking io-blocking/run-command command))
+(defn slurp
+  {:doc "Reads the whole file and decodes it from UTF-8 into a string"
+   :added "0.1"}
+  [filename]
+  (let [c (open-read filename)]
+    (loop [buf (checkout-buffer SLURP-CHUNK-SIZE)
+           used 0]
+      (if (= used (buffer-capacity buf))
+        (let [grown (checkout-buffer (* 2 used))]
+          (buffer-copy! buf 0 grown 0 used)
+          (return-buffer! buf)
+          (recur grown used))
+        (let [read-count (read-file-at c buf used)]
+          (if (pos? read-count)
+            (recur buf (+ used read-count))
+            (let [result (buffer->string buf 0 used)]
+              (return-buffer! buf)
+              (dispose! c)
+              result)))))))
 
-(comment
+(defn mmap-file
+  {:doc "Maps filename into memory read only. The result is counted, indexed and reducible over
+         the bytes of the file, without copying them into buffers. Dispose it to unmap the file."
+   :added "0.1"}
+  [filename]
+  (assert (string? filename) "Filename must be a string")
+  (ioi/mmap-file filename))
 
-  (defn tcp-server [ip port on-connection]
-    (assert (string? ip) "Ip should be a string")
-    (assert (integer? port) "Port should be a int")
-    (let [server (uv/uv_tcp_t)
-          bind-addr (uv/sockaddr_in)
-          _ (uv/throw-on-error (uv/uv_ip4_addr ip port bind-addr))
-          on-new-connetion (atom nil)]
-      (reset! on-new-connetion
-              (ffi/ffi-prep-callback
-               uv/uv_connection_cb
-               (fn [server status]
-                 (when (not (= status -1))
-                   (println "Got Client!!!!!!!")))))
-      (uv/uv_tcp_init (uv/uv_default_loop) server)
-      (uv/uv_tcp_bind server bind-addr 0)
-      (uv/throw-on-error (uv/uv_listen server 128 @on-new-connetion))
-      (st/yield-control))))
+(defn mmap-slice
+  {:doc "Returns the bytes of a mapped file from start to end, sharing the mapping."
+   :added "0.1"}
+  ([m start]
+   (ioi/mmap-slice m start (count m)))
+  ([m start end]
+   (ioi/mmap-slice m start end)))
 
-(comment
-  (st/apply-blocking println "FROM OTHER THREAD <---!!!!!")
+(defn mmap-pointer
+  {:doc "Returns a CVoidP to the first byte of a mapped file or slice, for passing to ffi
+         functions. It's only valid until the mapping is disposed, and must not be disposed itself."
+   :added "0.1"}
+  [m]
+  (ioi/mmap-pointer m))
 
+(extend -iterator MappedFile
+        (fn [m]
+          (dotimes [x (count m)]
+            (yield (nth m x nil)))))
+
+(defn list-dir
+  {:doc "Returns the entries of the directory at path as [name type] pairs, type being one of
+         :file, :dir, :link or :other. The directory is read with uv_fs_scandir, parking the
+         current stacklet instead of blocking the thread."
+   :added "0.1"}
+  [path]
+  (let [result (fs_scandir path 0)]
+    (if (integer? result)
+      (throw (str "UV Error: " (uv/uv_err_name result)))
+      result)))
+
+(defn- walk-dir-reduce [root max-depth f init]
+  (loop [stack [[root 0]]
+         acc init]
+    (if (zero? (count stack))
+      acc
+      (let [[dir depth] (peek stack)
+            listing (fs_scandir dir 0)
+            descend? (or (nil? max-depth) (< (inc depth) max-depth))
+            [acc subdirs] (loop [entries (when (vector? listing) (seq listing))
+                                 acc acc
+                                 subdirs []]
+                            (if (or (nil? entries) (reduced? acc))
+                              [acc subdirs]
+                              (let [[name type] (first entries)
+                                    path (str dir "/" name)]
+                                (recur (next entries)
+                                       (f acc [path type])
+                                       (if (and descend? (= type :dir))
+                                         (conj subdirs [path (inc depth)])
+                                         subdirs)))))]
+        (if (reduced? acc)
+          @acc
+          (recur (reduce (fn [stack i]
+                           (conj stack (nth subdirs i)))
+                         (pop stack)
+                         (range (dec (count subdirs)) -1 -1))
+                 acc))))))
+
+(deftype DirWalk [root max-depth]
+  IReduce
+  (-reduce [this f init]
+    (walk-dir-reduce root max-depth f init)))
+
+(defn walk-dir
+  {:doc "Returns a reducible of [path type] pairs for everything below the directory at path,
+         parents before their children, with types as in list-dir. Links are not followed and
+         dirs that can't be read are skipped. Every directory is read with uv_fs_scandir, so
+         reducing parks the current stacklet instead of blocking, and stops as soon as the
+         reducing function returns a reduced value.
+
+         Options: :max-depth the number of levels to walk, 1 being the entries of path itself."
+   :added "0.1"}
+  [path & options]
+  (->DirWalk path (:max-depth (apply hashmap options))))
+
+(defn run-command
+  {:doc "Runs command with /bin/sh and returns its output. The process is spawned through
+         libuv, so no thread is tied up while it runs."
+   :added "0.1"}
+  [command]
+  ;; pixie.process brings in pixie.net and pixie.async, only load it once a command is run
+  (load-ns 'pixie.process)
+  (let [run @(resolve-in (the-ns 'pixie.process) 'run)]
+    (:out (run ["/bin/sh" "-c" command] :stdin :inherit :stderr :inherit))))
 
-  (tcp-server "0.0.0.0" 4242 nil))
 (comment
   (defmacro make-readline-async []
     `(let [libname ~(ffi-infer/compile-library {:prefix "pixie.io.readline"
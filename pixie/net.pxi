@@ -0,0 +1,241 @@
+(ns pixie.net
+  (require pixie.streams :refer :all)
+  (require pixie.stacklets :as st)
+  (require pixie.uv :as uv)
+  (require pixie.ffi :as ffi))
+
+(def DEFAULT-BACKLOG 128)
+(def DEFAULT-WRITE-HIGH-WATER (* 1024 1024))
+
+(defn- resume-later [k val]
+  (st/-run-later (partial st/run-and-process k val)))
+
+(defn- configure-tcp [handle options]
+  (when-let [delay (:keep-alive options)]
+    (uv/throw-on-error (uv/uv_tcp_keepalive handle 1 delay)))
+  (when (:no-delay options)
+    (uv/throw-on-error (uv/uv_tcp_nodelay handle 1))))
+
+(defn- park-until-drained [stream target]
+  (when (> (get-field stream :pending-bytes) target)
+    (st/call-cc (fn [k]
+                  (set-field! stream :drain-to target)
+                  (set-field! stream :drain-k k)))))
+
+;; Reads park the stacklet and start reading from the handle straight into the caller's
+;; buffer, reading stops again as soon as some data has arrived. Writes copy the buffer and
+;; return right away, unless more than high-water bytes are still waiting to be sent, then
+;; the writer parks until the queue drops under low-water.
+(deftype UVStream [handle alloc-cb read-cb write-cb read-buf read-k
+                   writes pending-bytes high-water low-water drain-to drain-k
+                   write-error closed?]
+  IInputStream
+  (read [this buffer len]
+    (assert (<= (buffer-capacity buffer) len)
+            "Not enough capacity in the buffer")
+    (assert (not closed?) "UVStream is closed")
+    (set-field! this :read-buf buffer)
+    (let [nread (st/call-cc (fn [k]
+                              (set-field! this :read-k k)
+                              (let [result (uv/uv_read_start handle alloc-cb read-cb)]
+                                (when (neg? result)
+                                  (set-field! this :read-k nil)
+                                  (resume-later k result)))))]
+      (set-field! this :read-buf nil)
+      (cond
+        (= nread uv/UV_EOF) (do (set-buffer-count! buffer 0)
+                                0)
+        (neg? nread) (throw (str "UV Error: " (uv/uv_err_name nread)))
+        :else (do (set-buffer-count! buffer nread)
+                  nread))))
+  IOutputStream
+  (write [this buffer]
+    (assert (not closed?) "UVStream is closed")
+    (when write-error
+      (throw (str "UV Error: " (uv/uv_err_name write-error))))
+    (let [n (count buffer)
+          owned (checkout-buffer (if (pos? n) n 1))
+          req (uv/uv_write_t)
+          uvbuf (ffi/struct uv/uv_buf_t {:base owned :len n})]
+      (buffer-copy! buffer 0 owned 0 n)
+      (set-field! this :writes (conj writes [req owned n]))
+      (set-field! this :pending-bytes (+ pending-bytes n))
+      (uv/throw-on-error (uv/uv_write req handle uvbuf 1 write-cb))
+      (dispose! uvbuf)
+      (when (> (get-field this :pending-bytes) high-water)
+        (park-until-drained this low-water))
+      n))
+  IFlushableStream
+  (flush [this]
+    (park-until-drained this 0))
+  IDisposable
+  (-dispose! [this]
+    (when (not closed?)
+      (park-until-drained this 0)
+      (set-field! this :closed? true)
+      (uv/uv_close handle st/close_cb)
+      (-dispose! alloc-cb)
+      (-dispose! read-cb)
+      (-dispose! write-cb))))
+
+(defn uv-stream
+  {:doc "Wraps handle, a connected libuv stream such as a TCP socket or a pipe, in a stream
+         implementing IInputStream, IOutputStream and IFlushableStream. Disposing the stream
+         closes the handle. Takes the :write-high-water option of tcp-connect."
+   :added "0.1"}
+  [handle options]
+  (let [high-water (get options :write-high-water DEFAULT-WRITE-HIGH-WATER)
+        stream (->UVStream handle nil nil nil nil nil
+                           (queue) 0 high-water (quot high-water 2) 0 nil
+                           nil false)]
+    (set-field! stream :alloc-cb
+                (ffi/ffi-prep-callback uv/uv_alloc_cb
+                                       (fn [_ suggested-size buf]
+                                         (try
+                                           (let [uvbuf (ffi/cast buf uv/uv_buf_t)
+                                                 read-buf (get-field stream :read-buf)]
+                                             (uv/buf-base uvbuf read-buf)
+                                             (uv/buf-len uvbuf (buffer-capacity read-buf)))
+                                           (catch e (println e))))))
+    (set-field! stream :read-cb
+                (ffi/ffi-prep-callback uv/uv_read_cb
+                                       (fn [_ nread buf]
+                                         (try
+                                           (when (not (zero? nread))
+                                             (uv/uv_read_stop handle)
+                                             (let [k (get-field stream :read-k)]
+                                               (set-field! stream :read-k nil)
+                                               (st/run-and-process k nread)))
+                                           (catch e (println e))))))
+    (set-field! stream :write-cb
+                (ffi/ffi-prep-callback uv/uv_write_cb
+                                       (fn [_ status]
+                                         (try
+                                           ;; libuv completes the writes of a stream in order
+                                           (let [[req owned n] (peek (get-field stream :writes))]
+                                             (set-field! stream :writes (pop (get-field stream :writes)))
+                                             (dispose! req)
+                                             (return-buffer! owned)
+                                             (set-field! stream :pending-bytes (- (get-field stream :pending-bytes) n))
+                                             (when (neg? status)
+                                               (set-field! stream :write-error status))
+                                             (let [k (get-field stream :drain-k)]
+                                               (when (and k
+                                                          (or (neg? status)
+                                                              (<= (get-field stream :pending-bytes)
+                                                                  (get-field stream :drain-to))))
+                                                 (set-field! stream :drain-k nil)
+                                                 (st/run-and-process k nil))))
+                                           (catch e (println e))))))
+    stream))
+
+(defn tcp-connect
+  {:doc "Connects to port on the IPv4 address host, parking the current stacklet until the
+         connection is made. Returns a stream implementing IInputStream and IOutputStream.
+
+         Options: :keep-alive seconds of idle time before keep-alive probes are sent, :no-delay
+         to disable Nagle's algorithm, and :write-high-water, the number of unsent bytes at which
+         write parks until half of them have been sent."
+   :added "0.1"}
+  [host port & options]
+  (assert (string? host) "Host should be a string")
+  (assert (integer? port) "Port should be a int")
+  (let [options (apply hashmap options)
+        handle (uv/uv_tcp_t)
+        addr (uv/sockaddr_in)
+        req (uv/uv_connect_t)
+        cb (atom nil)]
+    (uv/throw-on-error (uv/uv_ip4_addr host port addr))
+    (uv/throw-on-error (uv/uv_tcp_init (uv/uv_default_loop) handle))
+    (let [status (st/call-cc (fn [k]
+                               (reset! cb (ffi/ffi-prep-callback uv/uv_connect_cb
+                                                                 (fn [_ status]
+                                                                   (try
+                                                                     (st/run-and-process k status)
+                                                                     (-dispose! @cb)
+                                                                     (catch e (println e))))))
+                               (let [result (uv/uv_tcp_connect req handle addr @cb)]
+                                 (when (neg? result)
+                                   (-dispose! @cb)
+                                   (resume-later k result)))))]
+      (dispose! req)
+      (dispose! addr)
+      (when (neg? status)
+        (uv/uv_close handle st/close_cb)
+        (throw (str "UV Error: " (uv/uv_err_name status))))
+      (configure-tcp handle options)
+      (uv-stream handle options))))
+
+
+(deftype TCPServer [handle connection-cb accept-k pending on-connection options closed?]
+  IDisposable
+  (-dispose! [this]
+    (when (not closed?)
+      (set-field! this :closed? true)
+      (uv/uv_close handle st/close_cb)
+      (-dispose! connection-cb)
+      (when-let [k accept-k]
+        (set-field! this :accept-k nil)
+        (resume-later k nil)))))
+
+(defn- accept-connection [server]
+  (let [client (uv/uv_tcp_t)
+        options (get-field server :options)]
+    (uv/throw-on-error (uv/uv_tcp_init (uv/uv_default_loop) client))
+    (if (neg? (uv/uv_accept (get-field server :handle) client))
+      (uv/uv_close client st/close_cb)
+      (let [conn (uv-stream client options)
+            on-connection (get-field server :on-connection)]
+        (configure-tcp client options)
+        (st/spawn (try
+                    (on-connection conn)
+                    (catch e (println e)))
+                  (dispose! conn))))))
+
+(defn- accept-loop [server]
+  (loop []
+    (let [status (if (pos? (get-field server :pending))
+                   (do (set-field! server :pending (dec (get-field server :pending)))
+                       0)
+                   (st/call-cc (fn [k]
+                                 (set-field! server :accept-k k))))]
+      (when (not (get-field server :closed?))
+        (if (neg? status)
+          (println (str "UV Error: " (uv/uv_err_name status)))
+          (accept-connection server))
+        (recur)))))
+
+(defn tcp-server
+  {:doc "Listens on port of the IPv4 address host. Every connection gets a stream implementing
+         IInputStream and IOutputStream, and on-connection is called with it in a new stacklet.
+         The stream is disposed once on-connection returns. Dispose the returned server to stop
+         listening.
+
+         Options: :backlog, the number of connections waiting to be accepted, plus the options
+         of tcp-connect, applied to every connection."
+   :added "0.1"}
+  [host port on-connection & options]
+  (assert (string? host) "Host should be a string")
+  (assert (integer? port) "Port should be a int")
+  (let [options (apply hashmap options)
+        handle (uv/uv_tcp_t)
+        addr (uv/sockaddr_in)
+        server (->TCPServer handle nil nil 0 on-connection options false)]
+    (uv/throw-on-error (uv/uv_ip4_addr host port addr))
+    (uv/throw-on-error (uv/uv_tcp_init (uv/uv_default_loop) handle))
+    (uv/throw-on-error (uv/uv_tcp_bind handle addr 0))
+    (dispose! addr)
+    (set-field! server :connection-cb
+                (ffi/ffi-prep-callback uv/uv_connection_cb
+                                       (fn [_ status]
+                                         (try
+                                           (if-let [k (get-field server :accept-k)]
+                                             (do (set-field! server :accept-k nil)
+                                                 (st/run-and-process k status))
+                                             (set-field! server :pending (inc (get-field server :pending))))
+                                           (catch e (println e))))))
+    (uv/throw-on-error (uv/uv_listen handle
+                                     (get options :backlog DEFAULT-BACKLOG)
+                                     (get-field server :connection-cb)))
+    (st/spawn (accept-loop server))
+    server))
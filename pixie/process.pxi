@@ -0,0 +1,184 @@
+(ns pixie.process
+  (require pixie.streams :refer :all)
+  (require pixie.stacklets :as st)
+  (require pixie.async :as async)
+  (require pixie.net :as net)
+  (require pixie.uv :as uv)
+  (require pixie.ffi :as ffi))
+
+(def SIGTERM 15)
+(def SIGKILL 9)
+
+;; handle is an atom of the uv_process_t, nil once the process has exited and the handle is closed
+(defrecord Process [pid stdin stdout stderr exit handle])
+
+(defn- c-string-array
+  ;; Returns [array strings], a NULL terminated char* array and the C strings it points to
+  [strings]
+  (let [ptr-size (ffi/c-sizeof CVoidP)
+        strings (vec (map ffi/prep-string strings))
+        array (buffer (* ptr-size (inc (count strings))))]
+    (dotimes [i (count strings)]
+      (ffi/pack! array (* i ptr-size) CVoidP (nth strings i)))
+    (ffi/pack! array (* (count strings) ptr-size) CVoidP nil)
+    [array strings]))
+
+(defn- dispose-c-string-array [[array strings]]
+  (doseq [s strings]
+    (dispose! s))
+  (dispose! array))
+
+(defn- stdio-pipe
+  ;; Returns [flags handle] for the child's fd, handle is nil unless a pipe is created
+  [fd mode]
+  (cond
+    (= mode :pipe)
+    (let [pipe (uv/uv_pipe_t)]
+      (uv/throw-on-error (uv/uv_pipe_init (uv/uv_default_loop) pipe 0))
+      [(bit-or uv/UV_CREATE_PIPE (if (zero? fd) uv/UV_READABLE_PIPE uv/UV_WRITABLE_PIPE))
+       pipe])
+    (= mode :inherit) [uv/UV_INHERIT_FD nil]
+    (= mode :ignore) [uv/UV_IGNORE nil]
+    :else (throw (str "Unknown stdio mode " mode ", expected :pipe, :inherit or :ignore"))))
+
+(defn- stdio-containers [pipes]
+  (let [size (ffi/struct-size uv/uv_stdio_container_t)
+        containers (buffer (* size (count pipes)))]
+    (dotimes [fd (count pipes)]
+      (let [[flags pipe] (nth pipes fd)
+            container (ffi/cast (ffi/ptr-add containers (* fd size)) uv/uv_stdio_container_t)]
+        (ffi/set! container :flags flags)
+        (if pipe
+          (ffi/set! container :data.stream pipe)
+          (ffi/set! container :data.fd fd))))
+    containers))
+
+(defn spawn
+  {:doc "Starts command, a vector of a program and its arguments, without blocking a thread.
+         The program is looked up on the PATH. Returns a Process record of :pid, :stdin,
+         :stdout, :stderr and :exit. The piped streams implement IInputStream and
+         IOutputStream and park the calling stacklet, dispose them once done, disposing :stdin
+         closes the input of the process. :exit is a promise of the exit status, which is 128
+         plus the signal number if the process was killed by a signal.
+
+         Options: :cwd, :env a map that replaces the environment of the process, and :stdin,
+         :stdout and :stderr, each one of :pipe (the default), :inherit or :ignore."
+   :examples [["(require pixie.process :as p)"]
+              ["@(:exit (p/spawn [\"true\"] :stdout :ignore :stderr :ignore))" nil 0]]
+   :added "0.1"}
+  [command & options]
+  (assert (and (vector? command) (pos? (count command))) "Command should be a non empty vector")
+  (let [options (apply hashmap options)
+        pipes [(stdio-pipe 0 (get options :stdin :pipe))
+               (stdio-pipe 1 (get options :stdout :pipe))
+               (stdio-pipe 2 (get options :stderr :pipe))]
+        containers (stdio-containers pipes)
+        args (c-string-array (map str command))
+        env (when-let [env (:env options)]
+              (c-string-array (map (fn [[k v]] (str (name k) "=" v)) env)))
+        cwd (when-let [cwd (:cwd options)]
+              (ffi/prep-string cwd))
+        handle (uv/uv_process_t)
+        process-options (uv/uv_process_options_t)
+        running (atom handle)
+        exit (async/promise)
+        exit-cb (atom nil)]
+    (reset! exit-cb (ffi/ffi-prep-callback uv/uv_exit_cb
+                                           (fn [_ status signal]
+                                             (try
+                                               (reset! running nil)
+                                               (exit (if (pos? signal)
+                                                       (+ 128 signal)
+                                                       status))
+                                               (uv/uv_close handle st/close_cb)
+                                               (-dispose! @exit-cb)
+                                               (catch e (println e))))))
+    (pixie.ffi/set! process-options :exit_cb @exit-cb)
+    (pixie.ffi/set! process-options :file (nth (second args) 0))
+    (pixie.ffi/set! process-options :args (first args))
+    (pixie.ffi/set! process-options :env (first env))
+    (pixie.ffi/set! process-options :cwd cwd)
+    (pixie.ffi/set! process-options :flags 0)
+    (pixie.ffi/set! process-options :stdio_count (count pipes))
+    (pixie.ffi/set! process-options :stdio containers)
+    (pixie.ffi/set! process-options :uid 0)
+    (pixie.ffi/set! process-options :gid 0)
+    ;; an inherited stdout or stderr should see our pending output first
+    (flush-out)
+    (let [result (uv/uv_spawn (uv/uv_default_loop) handle process-options)]
+      ;; libuv copies what it needs, the options can go right away
+      (dispose! process-options)
+      (dispose! containers)
+      (dispose-c-string-array args)
+      (when env
+        (dispose-c-string-array env))
+      (when cwd
+        (dispose! cwd))
+      (when (neg? result)
+        (-dispose! @exit-cb)
+        (uv/uv_close handle st/close_cb)
+        (doseq [[_ pipe] pipes]
+          (when pipe
+            (uv/uv_close pipe st/close_cb)))
+        (throw (str "UV Error: " (uv/uv_err_name result))))
+      (let [[stdin stdout stderr] (map (fn [[_ pipe]]
+                                         (when pipe
+                                           (net/uv-stream pipe {})))
+                                       pipes)]
+        (->Process (:pid handle) stdin stdout stderr exit running)))))
+
+(defn kill
+  {:doc "Sends signal, SIGTERM by default, to a process started with spawn. Does nothing once
+         the process has exited."
+   :added "0.1"}
+  ([process]
+   (kill process SIGTERM))
+  ([process signal]
+   (when-let [handle @(:handle process)]
+     (uv/throw-on-error (uv/uv_process_kill handle signal)))
+   nil))
+
+(defn- read-fully
+  ;; Reads in until its end and decodes the bytes as UTF-8
+  [in]
+  (let [chunk (checkout-buffer 4096)]
+    (loop [acc (checkout-buffer 4096)
+           used 0]
+      (let [n (read in chunk (buffer-capacity chunk))]
+        (if (pos? n)
+          (let [acc (if (> (+ used n) (buffer-capacity acc))
+                      (let [grown (checkout-buffer (* 2 (+ used n)))]
+                        (buffer-copy! acc 0 grown 0 used)
+                        (return-buffer! acc)
+                        grown)
+                      acc)]
+            (buffer-copy! chunk 0 acc used n)
+            (recur acc (+ used n)))
+          (let [s (buffer->string acc 0 used)]
+            (return-buffer! acc)
+            (return-buffer! chunk)
+            s))))))
+
+(defn run
+  {:doc "Runs command like spawn and waits for it to exit. Returns a map of :exit, the exit
+         status, and :out and :err, the output of the process decoded as UTF-8 (nil unless
+         piped). Takes the options of spawn, :stdin defaults to :ignore."
+   :examples [["(require pixie.process :as p)"]
+              ["(p/run [\"echo\" \"hi\"])" nil {:exit 0 :out "hi\n" :err ""}]]
+   :added "0.1"}
+  [command & options]
+  (let [process (apply spawn command :stdin :ignore options)
+        err (when-let [stderr (:stderr process)]
+              (async/future
+                (let [s (read-fully stderr)]
+                  (dispose! stderr)
+                  s)))
+        out (when-let [stdout (:stdout process)]
+              (let [s (read-fully stdout)]
+                (dispose! stdout)
+                s))]
+    (when-let [stdin (:stdin process)]
+      (dispose! stdin))
+    {:exit @(:exit process)
+     :out out
+     :err (when err @err)}))
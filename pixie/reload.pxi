@@ -0,0 +1,110 @@
+(ns pixie.reload
+  (require pixie.fs :as fs)
+  (require pixie.path :as path)
+  (require pixie.string :as string)
+  (require pixie.reload.internal :as ri))
+
+;; load-ns remembers the file of every namespace it loads and the namespaces each one
+;; requires, ri/ns-files and ri/ns-requires hand those out.
+
+(defn- dependents
+  ;; Returns a map of every namespace to the set of namespaces that require it
+  [requires]
+  (reduce (fn [acc [ns required]]
+            (reduce (fn [acc dep]
+                      (assoc acc dep (conj (get acc dep #{}) ns)))
+                    acc
+                    required))
+          {}
+          requires))
+
+(defn- with-dependents
+  ;; Returns the set of nss and every namespace that requires one of them, directly or not
+  [nss requires]
+  (let [by-dep (dependents requires)]
+    (loop [todo (vec nss)
+           found #{}]
+      (if (zero? (count todo))
+        found
+        (let [ns (nth todo (dec (count todo)))
+              todo (pop todo)]
+          (if (contains? found ns)
+            (recur todo found)
+            (recur (into todo (get by-dep ns)) (conj found ns))))))))
+
+(defn- load-order
+  ;; Orders nss so every namespace comes after the ones it requires
+  [nss requires]
+  (let [visited (atom #{})
+        order (atom [])]
+    (doseq [ns nss]
+      ((fn visit [ns]
+         (when (and (contains? nss ns)
+                    (not (contains? @visited ns)))
+           (swap! visited conj ns)
+           (doseq [dep (get requires ns)]
+             (visit dep))
+           (swap! order conj ns)))
+       ns))
+    @order))
+
+(defn reload-ns
+  "Loads the file of ns again. The file is recompiled when it has a .pxic cache, so the cache
+  is refreshed rather than loaded stale."
+  [ns]
+  (let [file (get (ri/ns-files) ns)]
+    (assert file (str "No file is known for namespace " ns ", it was not loaded with require"))
+    (if (path/-file? (path/-path (str file "c")))
+      (compile-file file)
+      (load-file file))
+    ns))
+
+(defn reload-files
+  "Reloads the namespaces defined in files, a collection of paths, along with every namespace
+  depending on them, each after the namespaces it requires. Files that do not belong to a
+  loaded namespace are ignored. Returns a vector of the reloaded namespace symbols."
+  [files]
+  (let [ns-files (ri/ns-files)
+        changed (reduce (fn [acc f]
+                          (conj acc (path/-abs (path/-path (str f)))))
+                        #{}
+                        files)
+        nss (reduce (fn [acc [ns file]]
+                      (if (contains? changed file)
+                        (conj acc ns)
+                        acc))
+                    []
+                    ns-files)
+        requires (ri/ns-requires)
+        ;; namespaces like user, or tests loaded with load-file, require others but have no
+        ;; file of their own to reload
+        reloadable (reduce (fn [acc ns]
+                             (if (contains? ns-files ns)
+                               (conj acc ns)
+                               acc))
+                           #{}
+                           (with-dependents nss requires))
+        order (load-order reloadable requires)]
+    (doseq [ns order]
+      (reload-ns ns))
+    order))
+
+(defn watch
+  "Watches the files of the namespaces loaded so far and reloads the ones that change, with
+  their dependents, as reload-files does. on-reload, if not nil, is called with the vector of
+  reloaded namespaces, errors while reloading are printed. Returns a watcher, dispose it to
+  stop. Takes the options of pixie.fs/watch."
+  [on-reload & options]
+  (let [dirs (distinct (map (fn [[_ file]]
+                              (string/join "/" (butlast (string/split file "/"))))
+                            (ri/ns-files)))]
+    (apply fs/watch
+           (vec dirs)
+           (fn [changes]
+             (let [reloaded (reload-files (filter (fn [f]
+                                                    (string/ends-with? f ".pxi"))
+                                                  changes))]
+               (when (and on-reload (pos? (count reloaded)))
+                 (on-reload reloaded))))
+           :recursive false
+           options)))
@@ -13,6 +13,7 @@
                          (let [prompt (if (= 0 pixie.stdlib/*reading-form*)
                                         (str (name pixie.stdlib/*ns*) " => ")
                                         "")
+                               _ (flush-out)
                                line (st/apply-blocking readline prompt)]
                            (if line
                              (str line "\n")
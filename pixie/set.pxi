@@ -0,0 +1,55 @@
+(ns pixie.set
+  (require pixie.set.internal :as si))
+
+(defn- hash-set? [s]
+  (instance? PersistentHashSet s))
+
+(defn union
+  {:doc "Returns a set containing the elements of all the given sets."
+   :signatures [[] [s] [s1 s2] [s1 s2 & sets]]
+   :added "0.1"}
+  ([] #{})
+  ([s] s)
+  ([s1 s2]
+   (if (and (hash-set? s1) (hash-set? s2))
+     (si/union s1 s2)
+     (reduce conj s1 s2)))
+  ([s1 s2 & sets]
+   (reduce union (union s1 s2) sets)))
+
+(defn intersection
+  {:doc "Returns a set containing the elements found in every one of the given sets."
+   :signatures [[s] [s1 s2] [s1 s2 & sets]]
+   :added "0.1"}
+  ([s] s)
+  ([s1 s2]
+   (if (and (hash-set? s1) (hash-set? s2))
+     (si/intersection s1 s2)
+     (reduce (fn [acc x]
+               (if (contains? s2 x) acc (disj acc x)))
+             s1
+             s1)))
+  ([s1 s2 & sets]
+   (reduce intersection (intersection s1 s2) sets)))
+
+(defn difference
+  {:doc "Returns a set containing the elements of the first set that are not found in any of the others."
+   :signatures [[s] [s1 s2] [s1 s2 & sets]]
+   :added "0.1"}
+  ([s] s)
+  ([s1 s2]
+   (if (and (hash-set? s1) (hash-set? s2))
+     (si/difference s1 s2)
+     (reduce disj s1 s2)))
+  ([s1 s2 & sets]
+   (reduce difference (difference s1 s2) sets)))
+
+(defn subset?
+  {:doc "Returns true if every element of s1 is also found in s2."
+   :signatures [[s1 s2]]
+   :added "0.1"}
+  [s1 s2]
+  (if (and (hash-set? s1) (hash-set? s2))
+    (si/subset s1 s2)
+    (and (<= (count s1) (count s2))
+         (every? #(contains? s2 %) s1))))
@@ -4,7 +4,7 @@
 (def libc (ffi-library pixie.platform/lib-c-name))
 
 
-(def exit (ffi-fn libc "exit" [CInt] CInt))
+(def -exit (ffi-fn libc "exit" [CInt] CInt))
 (def puts (ffi-fn libc "puts" [CCharP] CInt))
 
 
@@ -94,6 +94,13 @@
     pop
     ([coll] (-pop coll))))
 
+(def peek
+  (fn ^{:doc "Returns the element pop would remove from a stack, or nil if it is empty."
+        :signatures [[coll]]
+        :added "0.1"}
+    peek
+    ([coll] (-peek coll))))
+
 (def push
   (fn ^{:doc "Push an element on to a stack."
         :signatures [[] [coll] [coll item] [coll item & args]]
@@ -174,6 +181,13 @@
 (def reduce (fn [rf init col]
               (-reduce col rf init)))
 
+(def reduce-kv (fn ^{:doc "Reduces an associative collection, calling f with the accumulator, key and value of each entry."
+                     :signatures [[f init coll]]
+                     :added "0.1"}
+                 reduce-kv
+                 [f init coll]
+                 (-reduce-kv coll f init)))
+
 (def into (fn ^{:doc "Add the elements of `from` to the collection `to`."
                 :signatures [[to from]]
                 :added "0.1"}
@@ -312,47 +326,72 @@
     ([state itm] (update-hash-unordered! state itm))))
 
 
-(extend -str PersistentVector
-  (fn [v]
-    (apply str "[" (conj (transduce (interpose " ") conj v) "]"))))
-(extend -repr PersistentVector
-  (fn [v]
-    (apply str "[" (conj (transduce (comp (map -repr) (interpose " ")) conj v) "]"))))
-
-(extend -str Cons
-  (fn [v]
-    (apply str "(" (conj (transduce (interpose " ") conj v) ")"))))
-(extend -repr Cons
-  (fn [v]
-    (apply str "(" (conj (transduce (comp (map -repr) (interpose " ")) conj v) ")"))))
+;; Collections print themselves into an IPrintWriter one fragment at a time, -str and -repr
+;; collect that output in a StringBuilder instead of joining the strings of every element.
+(def print-coll
+  (fn print-coll
+    ;; Writes the items of coll to w with print, between open and close and separated by spaces
+    [coll w print open close]
+    (-write-str w open)
+    (reduce (fn [sep? x]
+              (if sep?
+                (-write-str w " "))
+              (print x w)
+              true)
+            false
+            coll)
+    (-write-str w close)))
+
+(def print-to-string
+  (fn print-to-string
+    ;; Returns what print writes for x
+    [print x]
+    (let [sb (-string-builder)]
+      (print x sb)
+      (-str sb))))
+
+(extend -print-str PersistentVector (fn [v w] (print-coll v w -print-str "[" "]")))
+(extend -print-repr PersistentVector (fn [v w] (print-coll v w -print-repr "[" "]")))
+(extend -str PersistentVector (fn [v] (print-to-string -print-str v)))
+(extend -repr PersistentVector (fn [v] (print-to-string -print-repr v)))
+
+(extend -print-str Cons (fn [v w] (print-coll v w -print-str "(" ")")))
+(extend -print-repr Cons (fn [v w] (print-coll v w -print-repr "(" ")")))
+(extend -str Cons (fn [v] (print-to-string -print-str v)))
+(extend -repr Cons (fn [v] (print-to-string -print-repr v)))
 
 (extend -hash Cons
         (fn [v]
           (transduce ordered-hash-reducing-fn v)))
 
-(extend -str PersistentList
-  (fn [v]
-    (apply str "(" (conj (transduce (interpose " ") conj v) ")"))))
-(extend -repr PersistentList
-  (fn [v]
-    (apply str "(" (conj (transduce (comp (map -repr) (interpose " ")) conj v) ")"))))
+(extend -print-str PersistentList (fn [v w] (print-coll v w -print-str "(" ")")))
+(extend -print-repr PersistentList (fn [v w] (print-coll v w -print-repr "(" ")")))
+(extend -str PersistentList (fn [v] (print-to-string -print-str v)))
+(extend -repr PersistentList (fn [v] (print-to-string -print-repr v)))
 
 (extend -hash PersistentList
   (fn [v]
     (transduce ordered-hash-reducing-fn v)))
 
 
-(extend -str LazySeq
-  (fn [v]
-    (apply str "(" (conj (transduce (interpose " ") conj v) ")"))))
-(extend -repr LazySeq
-  (fn [v]
-    (apply str "(" (conj (transduce (comp (map -repr) (interpose " ")) conj v) ")"))))
+(extend -print-str LazySeq (fn [v w] (print-coll v w -print-str "(" ")")))
+(extend -print-repr LazySeq (fn [v w] (print-coll v w -print-repr "(" ")")))
+(extend -str LazySeq (fn [v] (print-to-string -print-str v)))
+(extend -repr LazySeq (fn [v] (print-to-string -print-repr v)))
 
 (extend -hash PersistentVector
   (fn [v]
     (transduce ordered-hash-reducing-fn v)))
 
+(extend -hash PersistentQueue
+  (fn [v]
+    (transduce ordered-hash-reducing-fn v)))
+
+(extend -print-str PersistentQueue (fn [v w] (print-coll v w -print-str "#queue [" "]")))
+(extend -print-repr PersistentQueue (fn [v w] (print-coll v w -print-repr "#queue [" "]")))
+(extend -str PersistentQueue (fn [v] (print-to-string -print-str v)))
+(extend -repr PersistentQueue (fn [v] (print-to-string -print-repr v)))
+
 (extend -hash PersistentHashSet
   (fn [v]
     (transduce ordered-hash-reducing-fn v)))
@@ -891,17 +930,22 @@ Stops if it finds such an element."
 
 (extend -reduce MapEntry indexed-reduce)
 
-(extend -str MapEntry
-  (fn [v]
-    (apply str "[" (conj (transduce (interpose " ") conj v) "]"))))
-(extend -repr MapEntry
-  (fn [v]
-    (apply str "[" (conj (transduce (comp (map -repr) (interpose " ")) conj v) "]"))))
+(extend -print-str MapEntry (fn [v w] (print-coll v w -print-str "[" "]")))
+(extend -print-repr MapEntry (fn [v w] (print-coll v w -print-repr "[" "]")))
+(extend -str MapEntry (fn [v] (print-to-string -print-str v)))
+(extend -repr MapEntry (fn [v] (print-to-string -print-repr v)))
 
 (extend -hash MapEntry
   (fn [v]
     (transduce ordered-hash-reducing-fn v)))
 
+(defn- kv-reducible?
+  ;; True for maps, records and nil. Vectors reduce-kv by index, keys and vals treat them as
+  ;; a collection of entries instead.
+  [m]
+  (and (satisfies? IKVReduce m)
+       (not (satisfies? IVector m))))
+
 (defn keys
   {:doc "If called with no arguments returns a transducer that will extract the key from each map entry. If passed
    a collection, will assume that it is a hashmap and return a vector of all keys from the collection."
@@ -909,7 +953,9 @@ Stops if it finds such an element."
    :added "0.1"}
   ([] (map key))
   ([m]
-     (transduce (map key) conj! m)))
+     (if (kv-reducible? m)
+       (persistent! (-reduce-kv m (fn [acc k _] (conj! acc k)) (transient [])))
+       (transduce (map key) conj! m))))
 
 (defn vals
   {:doc "If called with no arguments returns a transducer that will extract the key from each map entry. If passed
@@ -918,33 +964,49 @@ Stops if it finds such an element."
    :added "0.1"}
   ([] (map val))
   ([m]
-     (transduce (map val) conj! m)))
+     (if (kv-reducible? m)
+       (persistent! (-reduce-kv m (fn [acc _ v] (conj! acc v)) (transient [])))
+       (transduce (map val) conj! m))))
 
 (extend -seq PersistentHashMap
         (fn [m]
           (reduce conj nil m)))
 
-(extend -str PersistentHashMap
-        (fn [v]
-          (let [entry->str (map (fn [e] (vector (key e) " " (val e))))]
-            (apply str "{" (conj (transduce (comp entry->str (interpose [", "]) cat) conj v) "}")))))
-(extend -repr PersistentHashMap
-        (fn [v]
-          (let [entry->str (map (fn [e] (vector (-repr (key e)) " " (-repr (val e)))))]
-            (apply str "{" (conj (transduce (comp entry->str (interpose [", "]) cat) conj v) "}")))))
+(def print-map
+  (fn print-map
+    ;; Writes the entries of m to w with print, as {k v, k v}
+    [m w print]
+    (-write-str w "{")
+    (reduce-kv (fn [sep? k v]
+                 (if sep?
+                   (-write-str w ", "))
+                 (print k w)
+                 (-write-str w " ")
+                 (print v w)
+                 true)
+               false
+               m)
+    (-write-str w "}")))
+
+(extend -print-str PersistentHashMap (fn [m w] (print-map m w -print-str)))
+(extend -print-repr PersistentHashMap (fn [m w] (print-map m w -print-repr)))
+(extend -str PersistentHashMap (fn [m] (print-to-string -print-str m)))
+(extend -repr PersistentHashMap (fn [m] (print-to-string -print-repr m)))
 
 (extend -hash PersistentHashMap
-        (fn [v]
-          (transduce cat unordered-hash-reducing-fn v)))
+        (fn [m]
+          (finish-hash-state
+           (-reduce-kv m
+                       (fn [state k v]
+                         (update-hash-unordered! (update-hash-unordered! state k) v))
+                       (new-hash-state)))))
 
 (extend -seq PersistentHashSet (fn [self] (seq (iterator self))))
 
-(extend -str PersistentHashSet
-        (fn [s]
-          (apply str "#{" (conj (transduce (interpose " ") conj s) "}"))))
-(extend -repr PersistentHashSet
-        (fn [s]
-          (apply str "#{" (conj (transduce (comp (map -repr) (interpose " ")) conj s) "}"))))
+(extend -print-str PersistentHashSet (fn [v w] (print-coll v w -print-str "#{" "}")))
+(extend -print-repr PersistentHashSet (fn [v w] (print-coll v w -print-repr "#{" "}")))
+(extend -str PersistentHashSet (fn [v] (print-to-string -print-str v)))
+(extend -repr PersistentHashSet (fn [v] (print-to-string -print-repr v)))
 
 (extend -empty Cons (fn [_] '()))
 (extend -empty LazySeq (fn [_] '()))
@@ -1205,45 +1267,80 @@ and implements IAssociative, ILookup and IObject."
                                             `(= (. self ~field) (. other ~field)))
                                           fields)))
                         `(-hash [self]
-                                (throw "not implemented"))]
+                                (throw "not implemented"))
+                        'IKVReduce
+                        `(-reduce-kv [self f init]
+                                     (reduce #(f %1 %2 (. self %2)) init ~fields))]
         deftype-decl `(deftype ~nm ~fields ~@default-bodies ~@body)]
     `(do ~type-from-map
          ~deftype-decl)))
 
+(defn- write-args
+  ;; Writes each of args to w with print, separated by spaces
+  [w print args]
+  (reduce (fn [sep? arg]
+            (when sep?
+              (-write-str w " "))
+            (print arg w)
+            true)
+          false
+          args))
+
 (defn print
-  {:doc "Prints the arguments, seperated by spaces."
+  {:doc "Prints the arguments to *out*, seperated by spaces."
    :added "0.1"}
   [& args]
-  (printf (transduce (interpose " ") str args))
+  (write-args *out* -print-str args)
   nil)
 
 (defn println
-  {:doc "Prints the arguments, separated by spaces, with a newline at the end."
+  {:doc "Prints the arguments to *out*, separated by spaces, with a newline at the end."
    :added "0.1"}
   [& args]
-  (puts (transduce (interpose " ") str args))
+  (let [w *out*]
+    (write-args w -print-str args)
+    (-write-str w "\n"))
   nil)
 
 (defn pr-str
   {:doc "Formats the arguments using -repr, separated by spaces, returning a string."
    :added "0.1"}
   [& args]
-  (transduce (comp (map -repr) (interpose " ")) str args))
+  (let [sb (-string-builder)]
+    (write-args sb -print-repr args)
+    (-str sb)))
 
 (defn pr
-  {:doc "Prints the arguments using -repr, separated by spaces."
+  {:doc "Prints the arguments to *out* using -repr, separated by spaces."
    :added "0.1"}
   [& args]
-  (printf (apply pr-str args))
+  (write-args *out* -print-repr args)
   nil)
 
 (defn prn
-  {:doc "Prints the arguments using -repr, separated by spaces, with a newline at the end."
+  {:doc "Prints the arguments to *out* using -repr, separated by spaces, with a newline at the end."
    :added "0.1"}
   [& args]
-  (puts (apply pr-str args))
+  (let [w *out*]
+    (write-args w -print-repr args)
+    (-write-str w "\n"))
+  nil)
+
+(defn flush-out
+  {:doc "Writes out anything *out* and *err* are holding on to. Done before exiting and before
+         reading from the terminal, call it to show partial lines sooner."
+   :added "0.1"}
+  []
+  (-flush-stdio)
   nil)
 
+(defn exit
+  {:doc "Writes out anything *out* and *err* are holding on to and exits the process with code."
+   :added "0.1"}
+  [code]
+  (-flush-stdio)
+  (-exit code))
+
 (defn repeat
   ([x]
      (cons x (lazy-seq* (fn [] (repeat x)))))
@@ -1329,6 +1426,36 @@ The new value is thus `(apply f current-value-of-atom args)`."
   [a f & args]
   (reset! a (apply f @a args)))
 
+(defn ring-buffer
+  {:doc "Creates a mutable, bounded FIFO buffer holding at most size elements. It is safe
+to share between threads."
+   :signatures [[size]]
+   :added "0.1"}
+  [size]
+  (-ring-buffer size))
+
+(defn ring-buffer-offer!
+  {:doc "Adds x to the end of the ring buffer. Returns false if the buffer is full."
+   :signatures [[rb x]]
+   :added "0.1"}
+  [rb x]
+  (-ring-buffer-offer! rb x))
+
+(defn ring-buffer-poll!
+  {:doc "Removes and returns the oldest element of the ring buffer, or not-found (nil by
+default) if it is empty."
+   :signatures [[rb] [rb not-found]]
+   :added "0.1"}
+  ([rb] (-ring-buffer-poll! rb nil))
+  ([rb not-found] (-ring-buffer-poll! rb not-found)))
+
+(defn ring-buffer-full?
+  {:doc "Returns true if the ring buffer can't take any more elements."
+   :signatures [[rb]]
+   :added "0.1"}
+  [rb]
+  (= (count rb) (-ring-buffer-capacity rb)))
+
 (defn nil? [x]
   (identical? x nil))
 
@@ -1376,6 +1503,28 @@ The new value is thus `(apply f current-value-of-atom args)`."
           (dotimes [x (count v)]
             (yield (nth v x nil)))))
 
+;; Primitive vectors created by vector-of
+(foreach [tp [IntVector DoubleVector ByteVector]]
+  (extend -print-str tp (fn [v w] (print-coll v w -print-str "[" "]")))
+  (extend -print-repr tp (fn [v w] (print-coll v w -print-repr "[" "]")))
+  (extend -str tp (fn [v] (print-to-string -print-str v)))
+  (extend -repr tp (fn [v] (print-to-string -print-repr v)))
+  (extend -hash tp
+    (fn [v]
+      (transduce ordered-hash-reducing-fn v)))
+  (extend -iterator tp
+    (fn [v]
+      (dotimes [x (count v)]
+        (yield (nth v x nil)))))
+  (extend -seq tp
+    (fn vector-of-seq
+      ([v] (vector-of-seq v 0))
+      ([v x]
+       (if (= x (count v))
+         nil
+         (cons (nth v x) (lazy-seq* (fn [] (vector-of-seq v (+ x 1)))))))))
+  (extend -invoke tp (fn [v i] (nth v i))))
+
 (extend -iterator Array
         (fn [v]
           (dotimes [x (count v)]
@@ -1780,15 +1929,12 @@ For more information, see http://clojure.org/special_forms#binding-forms"}
           (cond
            (not (map? other)) false
            (not= (count self) (count other)) false
-           :else (reduce (fn
-                           ([_] true)
-                           ([_ entry]
-                              (let [other-val (get other (key entry) unknown)]
-                                (if (not= other-val (val entry))
-                                  (reduced false)
-                                  true))))
-                         true
-                         self))))
+           :else (-reduce-kv self
+                             (fn [_ k v]
+                               (if (not= (get other k unknown) v)
+                                 (reduced false)
+                                 true))
+                             true))))
 
 (extend -reduce ShallowContinuation
         (fn [k f init]
@@ -1931,13 +2077,29 @@ user => (refer 'pixie.string :exclude '(substring))"
    (empty? maps) nil
    (= (count maps) 1) (first maps)
    :else (let [merge2 (fn [m1 m2]
-                        (reduce (fn [res e]
-                                  (let [k (key e) v (val e)]
-                                    (if (contains? m1 k)
-                                      (assoc res k (f (get m1 k) v))
-                                      (assoc res k v))))
-                                (or m1 {})
-                                m2))]
+                        (let [merge-kv (fn [res k v]
+                                         (if (contains? m1 k)
+                                           (assoc res k (f (get m1 k) v))
+                                           (assoc res k v)))]
+                          (cond
+                            (and (instance? PersistentHashMap m1)
+                                 (instance? PersistentHashMap m2))
+                            (-merge-with f m1 m2)
+
+                            ;; like merge, a vector is a single [k v] entry rather than a
+                            ;; collection keyed by index
+                            (satisfies? IVector m2)
+                            (do (assert (= (count m2) 2) "Vector arguments to merge-with must be [k v] pairs")
+                                (merge-kv (or m1 {}) (nth m2 0) (nth m2 1)))
+
+                            (satisfies? IKVReduce m2)
+                            (reduce-kv merge-kv (or m1 {}) m2)
+
+                            :else
+                            (reduce (fn [res e]
+                                      (merge-kv res (key e) (val e)))
+                                    (or m1 {})
+                                    m2))))]
            (reduce merge2 (first maps) (next maps)))))
 
 (defn every?
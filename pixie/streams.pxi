@@ -11,3 +11,221 @@
 
 (defprotocol IByteOutputStream
   (write-byte [this byte]))
+
+(defprotocol ILineReader
+  (-read-line [this] "Reads the next line, without its line terminator, returns nil at the end of the stream"))
+
+
+(def DEFAULT-READER-BUFFER-SIZE (* 64 1024))
+
+(defn- append-line-bytes [reader from start end]
+  (let [line-buf (get-field reader :line-buf)
+        line-len (get-field reader :line-len)
+        needed (+ line-len (- end start))
+        line-buf (if (> needed (buffer-capacity line-buf))
+                   (let [grown (buffer (* 2 needed))]
+                     (buffer-copy! line-buf 0 grown 0 line-len)
+                     (dispose! line-buf)
+                     (set-field! reader :line-buf grown)
+                     grown)
+                   line-buf)]
+    (buffer-copy! from start line-buf line-len (- end start))
+    (set-field! reader :line-len needed)))
+
+(defn- take-line [reader]
+  (let [line-buf (get-field reader :line-buf)
+        line-len (get-field reader :line-len)]
+    (set-field! reader :line-len 0)
+    (if (and (pos? line-len)
+             (= (nth line-buf (dec line-len)) 13))
+      (buffer->string line-buf 0 (dec line-len))
+      (buffer->string line-buf 0 line-len))))
+
+(deftype BufferedReader [fill buf pos line-buf line-len]
+  ILineReader
+  (-read-line [this]
+    (loop []
+      (if (>= pos (count buf))
+        (if (pos? (let [f fill] (f buf)))
+          (do (set-field! this :pos 0)
+              (recur))
+          (when (pos? line-len)
+            (take-line this)))
+        (let [idx (buffer-index-of buf pos 10)]
+          (if (neg? idx)
+            (do (append-line-bytes this buf pos (count buf))
+                (set-field! this :pos (count buf))
+                (recur))
+            (let [start pos]
+              (set-field! this :pos (inc idx))
+              (if (zero? line-len)
+                (buffer->string buf start (if (and (> idx start)
+                                                   (= (nth buf (dec idx)) 13))
+                                            (dec idx)
+                                            idx))
+                (do (append-line-bytes this buf start idx)
+                    (take-line this)))))))))
+  IInputStream
+  (read [this buffer len]
+    (let [pending (- (count buf) pos)]
+      (if (pos? pending)
+        (let [n (if (< pending (buffer-capacity buffer))
+                  pending
+                  (buffer-capacity buffer))]
+          (buffer-copy! buf pos buffer 0 n)
+          (set-buffer-count! buffer n)
+          (set-field! this :pos (+ pos n))
+          n)
+        (let [f fill]
+          (f buffer)))))
+  IDisposable
+  (-dispose! [this]
+    (return-buffer! buf)
+    (dispose! line-buf)))
+
+(defn fill-reader
+  {:doc "Creates a BufferedReader of the given buffer size. fill is called with a buffer to refill, and should return the
+         number of bytes it read into it, zero at the end of the stream."
+   :added "0.1"}
+  [fill size]
+  (->BufferedReader fill
+                    (checkout-buffer size)
+                    0
+                    (buffer 256)
+                    0))
+
+(defn buffered-reader
+  {:doc "Wraps an IInputStream in a BufferedReader that reads size bytes at a time, and scans the
+         buffer for line ends with -read-line. Disposing the reader doesn't dispose the stream."
+   :added "0.1"}
+  ([input-stream]
+   (buffered-reader input-stream DEFAULT-READER-BUFFER-SIZE))
+  ([input-stream size]
+   (fill-reader (fn [buf]
+                  (read input-stream buf (buffer-capacity buf)))
+                size)))
+
+
+(def MAX-SCAN-BUFFER-SIZE (* 1024 1024))
+
+(defn reduce-stream
+  {:doc "Reduces f over the bytes of an IInputStream, reading buffer-size bytes at a time. While
+         reads keep filling the buffer it is swapped for one twice the size, up to
+         MAX-SCAN-BUFFER-SIZE, so long sequential scans make fewer reads. Buffers come from the
+         buffer pool."
+   :added "0.1"}
+  [stream f init buffer-size]
+  (let [rrf (preserving-reduced f)]
+    (loop [buf (checkout-buffer buffer-size)
+           acc init]
+      (let [read-count (read stream buf (buffer-capacity buf))]
+        (if (pos? read-count)
+          (let [result (reduce rrf acc buf)]
+            (cond
+              (reduced? result) (do (return-buffer! buf)
+                                    @result)
+
+              (and (= read-count (buffer-capacity buf))
+                   (< read-count MAX-SCAN-BUFFER-SIZE))
+              (do (return-buffer! buf)
+                  (recur (checkout-buffer (* 2 read-count)) result))
+
+              :else (recur buf result)))
+          (do (return-buffer! buf)
+              acc))))))
+
+
+(defprotocol IFlushableStream
+  (flush [this] "Writes out anything the stream is holding on to"))
+
+(defprotocol IGatheringOutputStream
+  (-write-all [this sources] "Writes the Buffers and Strings (as UTF-8) in sources, in order, gathering
+                              them into as few write requests as possible"))
+
+(def MAX-GATHERED-BUFFERS 64)
+
+(defn- source->buffer [src]
+  (if (string? src)
+    (string->buffer src)
+    src))
+
+(defn gather-batches
+  {:doc "Calls f with vectors of up to MAX-GATHERED-BUFFERS Buffers made from sources, encoding
+         Strings as UTF-8. Helper for implementing -write-all."
+   :added "0.1"}
+  [sources f]
+  (doseq [batch (partition MAX-GATHERED-BUFFERS sources)]
+    (let [batch (vec batch)
+          buffers (transduce (map source->buffer) conj batch)]
+      (f buffers)
+      (dotimes [i (count buffers)]
+        (when (string? (nth batch i))
+          (dispose! (nth buffers i)))))))
+
+(defn write-all
+  {:doc "Writes the Buffers and Strings (as UTF-8) in sources to out, in order. Streams that
+         implement IGatheringOutputStream write them with as few requests as possible."
+   :added "0.1"}
+  [out sources]
+  (if (satisfies? IGatheringOutputStream out)
+    (-write-all out sources)
+    (doseq [src sources]
+      (let [buf (source->buffer src)]
+        (write out buf)
+        (when (string? src)
+          (dispose! buf)))))
+  nil)
+
+(defn- flush-gathered [stream]
+  (let [queued (get-field stream :queued)]
+    (when (pos? (count queued))
+      (set-field! stream :queued [])
+      (set-field! stream :queued-bytes 0)
+      (write-all (get-field stream :downstream) queued)
+      (doseq [buf queued]
+        (return-buffer! buf)))))
+
+(defn- enqueue! [stream buf]
+  (set-field! stream :queued (conj (get-field stream :queued) buf))
+  (set-field! stream :queued-bytes (+ (get-field stream :queued-bytes) (count buf)))
+  (when (or (>= (get-field stream :queued-bytes) (get-field stream :flush-bytes))
+            (>= (count (get-field stream :queued)) MAX-GATHERED-BUFFERS))
+    (flush-gathered stream)))
+
+(deftype GatheringOutputStream [downstream queued queued-bytes flush-bytes]
+  IOutputStream
+  (write [this buffer]
+    (let [owned (checkout-buffer (if (pos? (count buffer))
+                                   (count buffer)
+                                   1))]
+      (buffer-copy! buffer 0 owned 0 (count buffer))
+      (set-buffer-count! owned (count buffer))
+      (enqueue! this owned)))
+  IGatheringOutputStream
+  (-write-all [this sources]
+    (doseq [src sources]
+      (if (string? src)
+        (enqueue! this (string->buffer src))
+        (write this src))))
+  IPrintWriter
+  (-write-str [this s]
+    (enqueue! this (string->buffer s)))
+  IFlushableStream
+  (flush [this]
+    (flush-gathered this))
+  IDisposable
+  (-dispose! [this]
+    (flush-gathered this)))
+
+(defn gathering-output-stream
+  {:doc "Wraps an IOutputStream so that written Buffers and Strings are queued, and handed to it
+         with write-all once flush-bytes are queued, the stream is flushed or it is disposed.
+         It is an IPrintWriter too, bind *out* to it to print into downstream. Disposing it
+         doesn't dispose downstream."
+   :added "0.1"}
+  ([downstream]
+   (gathering-output-stream downstream (* 64 1024)))
+  ([downstream flush-bytes]
+   (->GatheringOutputStream downstream [] 0 flush-bytes)))
+
+(extend flush StdWriter -flush-writer)
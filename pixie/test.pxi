@@ -47,13 +47,12 @@
   (println "Looking for tests...")
   (let [dirs      (distinct (map fs/dir @load-paths))
         pxi-files (->> dirs
-                       (mapcat fs/walk-files)
-                       (filter #(fs/extension? % "pxi"))
-                       (filter #(s/starts-with? (fs/basename %) "test-"))
+                       (mapcat #(into [] (fs/walker % :type :files :glob "test-*.pxi")))
+                       (map fs/abs)
                        (distinct))]
     (foreach [file pxi-files]
              (println "Loading " file)
-             (load-file (fs/abs file)))))
+             (load-file file))))
 
 
 (defmacro assert= [x y]
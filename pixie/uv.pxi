@@ -24,6 +24,7 @@
   (f/defcfn uv_backend_fd)
   (f/defcfn uv_backend_timeout)
   (f/defcfn uv_now)
+  (f/defcfn uv_hrtime)
   (f/defcfn uv_update_time)
   (f/defcfn uv_walk)
 
@@ -157,6 +158,7 @@
     (f/defconst O_APPEND)
     (f/defconst O_ASYNC)
     (f/defconst O_CREAT)
+    (f/defconst O_TRUNC)
 
     (f/defconst S_IRUSR)
     (f/defconst S_IRWXU)
@@ -166,6 +168,8 @@
     ; ERRNO
     (f/defconst UV_E2BIG)
     (f/defconst UV_EACCES)
+    (f/defconst UV_ENOENT)
+    (f/defconst UV_EOF)
 
     (f/defcfn uv_err_name)
 
@@ -185,18 +189,72 @@
     (f/defcfn uv_listen)
     (f/defcfn uv_accept)
     (f/defcfn uv_read_start)
+    (f/defcfn uv_read_stop)
+    (f/defcfn uv_tcp_connect)
+    (f/defcfn uv_tcp_keepalive)
+    (f/defcfn uv_tcp_nodelay)
+
+    (f/defcstruct uv_write_t [])
+    (f/defcstruct uv_connect_t [])
+    (f/defcfn uv_write)
 
     (f/defccallback uv_connection_cb)
+    (f/defccallback uv_alloc_cb)
+    (f/defccallback uv_write_cb)
+    (f/defccallback uv_connect_cb)
+
+
+    ; Processes
+    (f/defcstruct uv_process_t [:pid])
+    (f/defcstruct uv_process_options_t [:exit_cb
+                                        :file
+                                        :args
+                                        :env
+                                        :cwd
+                                        :flags
+                                        :stdio_count
+                                        :stdio
+                                        :uid
+                                        :gid])
+    (f/defcstruct uv_stdio_container_t [:flags
+                                        :data.stream
+                                        :data.fd])
+    (f/defcstruct uv_pipe_t [])
+    (f/defcfn uv_pipe_init)
+    (f/defcfn uv_spawn)
+    (f/defcfn uv_process_kill)
+    (f/defccallback uv_exit_cb)
+
+    (f/defconst UV_IGNORE)
+    (f/defconst UV_CREATE_PIPE)
+    (f/defconst UV_INHERIT_FD)
+    (f/defconst UV_READABLE_PIPE)
+    (f/defconst UV_WRITABLE_PIPE)
+
+
+    ; Filesystem events
+    (f/defcstruct uv_fs_event_t [])
+    (f/defcfn uv_fs_event_init)
+    (f/defcfn uv_fs_event_start)
+    (f/defcfn uv_fs_event_stop)
+    (f/defccallback uv_fs_event_cb)
+    (f/defconst UV_RENAME)
+    (f/defconst UV_CHANGE)
+
+    (f/defcstruct uv_fs_poll_t [])
+    (f/defcfn uv_fs_poll_init)
+    (f/defcfn uv_fs_poll_start)
+    (f/defcfn uv_fs_poll_stop)
+    (f/defccallback uv_fs_poll_cb)
 
     )
 
 
+(def buf-base (pixie.ffi/accessor uv_buf_t :base))
+(def buf-len (pixie.ffi/accessor uv_buf_t :len))
+
 (defn new-fs-buf [size]
-  (let [b (buffer size)
-        bt (uv_buf_t)]
-    (pixie.ffi/set! bt :base b)
-    (pixie.ffi/set! bt :len size)
-    bt))
+  (pixie.ffi/struct uv_buf_t {:base (buffer size) :len size}))
 
 
 (defn throw-on-error [result]
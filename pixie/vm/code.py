@@ -533,6 +533,9 @@ class Namespace(object.Object):
         name = rt.name(sym)
         prev_binding = self._registry.get(name, None)
         if prev_binding is not None:
+            # *out* may still hold output that comes before the warning
+            from pixie.vm.libs.stdio import flush_all
+            flush_all()
             print rt.name(rt.str(rt.wrap(u"Warning: "), sym, rt.wrap(u" already refers to "), prev_binding))
 
         self._registry[name] = var
@@ -915,6 +918,17 @@ def wrap_fn(fn, tp=object.Object):
                     raise
             return as_native_fn(wrapped_fn)
 
+        if argc == 5:
+            def wrapped_fn(self, args):
+                affirm(len(args) == 5, u"Expected 5 arguments to " + fn_name)
+
+                try:
+                    return fn(args[0], args[1], args[2], args[3], args[4])
+                except object.WrappedException as ex:
+                    ex._ex._trace.append(object.NativeCodeInfo(fn_name))
+                    raise
+            return as_native_fn(wrapped_fn)
+
         assert False, "implement more"
 
 
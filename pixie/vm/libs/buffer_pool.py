@@ -0,0 +1,69 @@
+py_object = object
+from pixie.vm.code import as_var, affirm
+from pixie.vm.primitives import nil
+from pixie.vm.libs.ffi import Buffer
+
+## A pool of raw Buffers with power of two capacities. Buffers are only freed when they are
+## disposed, so handing them back here saves a malloc per read loop. Interpreter code runs
+## under the GIL, so the pool needs no lock of its own.
+
+MIN_SHIFT = 6
+MAX_SHIFT = 22
+MAX_POOLED_PER_SIZE = 8
+
+
+def size_class(size):
+    shift = MIN_SHIFT
+    while (1 << shift) < size:
+        shift += 1
+    return shift
+
+
+class BufferPool(py_object):
+    def __init__(self):
+        self._free = [None] * (MAX_SHIFT + 1)
+        for x in range(MAX_SHIFT + 1):
+            self._free[x] = []
+
+    def checkout(self, size):
+        shift = size_class(size)
+        if shift <= MAX_SHIFT:
+            free = self._free[shift]
+            if len(free) > 0:
+                buffer = free.pop()
+                buffer.set_used_size(0)
+                return buffer
+        return Buffer(1 << shift)
+
+    def give_back(self, buffer):
+        shift = size_class(buffer.capacity())
+        if (1 << shift) != buffer.capacity() or shift > MAX_SHIFT:
+            buffer.free_data()
+            return
+        free = self._free[shift]
+        if len(free) < MAX_POOLED_PER_SIZE:
+            free.append(buffer)
+        else:
+            buffer.free_data()
+
+
+pool = BufferPool()
+
+
+@as_var("checkout-buffer")
+def checkout_buffer(size):
+    """(checkout-buffer size)
+       Returns an empty Buffer with a capacity of at least size, rounded up to a power of two.
+       Hand it back with return-buffer! once done with it."""
+    sz = size.int_val()
+    affirm(sz > 0, u"Buffer size must be positive")
+    return pool.checkout(sz)
+
+@as_var("return-buffer!")
+def return_buffer(buffer):
+    """(return-buffer! buffer)
+       Returns a buffer from checkout-buffer to the pool. The buffer must not be used afterwards."""
+    affirm(isinstance(buffer, Buffer), u"Expected a Buffer")
+    assert isinstance(buffer, Buffer)
+    pool.give_back(buffer)
+    return nil
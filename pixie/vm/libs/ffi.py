@@ -9,9 +9,9 @@ import pixie.vm.rt as rt
 from rpython.rtyper.lltypesystem import rffi, lltype, llmemory
 from pixie.vm.primitives import nil, true, false
 from pixie.vm.numbers import Integer, Float
-from pixie.vm.string import String
+from pixie.vm.string import String, Bytes
 from pixie.vm.keyword import Keyword
-from pixie.vm.util import unicode_to_utf8
+from pixie.vm.util import unicode_to_utf8, unicode_from_utf8
 from rpython.rlib import clibffi
 from rpython.rlib.jit_libffi import jit_ffi_call, CIF_DESCRIPTION, CIF_DESCRIPTION_P, \
     FFI_TYPE_P, FFI_TYPE_PP, SIZE_OF_FFI_ARG
@@ -104,18 +104,39 @@ class FFIFn(object.Object):
         self._is_variadic = is_variadic
         self._f_ptr = self._lib.get_fn_ptr(self._name)
         self._cd = CifDescrBuilder(self._arg_types, self._ret_type).rawallocate()
+        # Exchange buffer reused by every call, calls made while it is taken (from a callback
+        # or another thread while this fn is in C) malloc their own
+        self._exb = rffi.cast(rffi.VOIDP, lltype.malloc(rffi.CCHARP.TO, self._cd.exchange_size, flavor="raw"))
+        self._exb_in_use = False
+
+    def take_exb(self):
+        if self._exb_in_use:
+            size = jit.promote(self._cd.exchange_size)
+            return rffi.cast(rffi.VOIDP, lltype.malloc(rffi.CCHARP.TO, size, flavor="raw"))
+        self._exb_in_use = True
+        return self._exb
+
+    def release_exb(self, exb):
+        if exb == self._exb:
+            self._exb_in_use = False
+        else:
+            lltype.free(exb, flavor="raw")
 
     @jit.unroll_safe
-    def prep_exb(self, args):
-        size = jit.promote(self._cd.exchange_size)
-        exb = rffi.cast(rffi.VOIDP, lltype.malloc(rffi.CCHARP.TO, size, flavor="raw"))
-        tokens = [None] * len(args)
+    def prep_exb(self, exb, args):
+        """Packs args into exb, returns the tokens to finalize after the call, or None when
+           there are none."""
+        tokens = None
 
         for i, tp in enumerate(self._arg_types):
             offset_p = rffi.ptradd(exb, jit.promote(self._cd.exchange_args[i]))
-            tokens[i] = tp.ffi_set_value(offset_p, args[i])
+            token = tp.ffi_set_value(offset_p, args[i])
+            if token is not None:
+                if tokens is None:
+                    tokens = [None] * len(args)
+                tokens[i] = token
 
-        return exb, tokens
+        return tokens
 
     def get_ret_val_from_buffer(self, exb):
         offset_p = rffi.ptradd(exb, jit.promote(self._cd.exchange_result_libffi))
@@ -134,20 +155,24 @@ class FFIFn(object.Object):
                 runtime_error(u"Wrong number of args to fn: got " + unicode(str(arity)) +
                     u", expected " + unicode(str(self._arity)))
 
-        exb, tokens = self.prep_exb(args)
-        cd = jit.promote(self._cd)
-        #fp = jit.promote(self._f_ptr)
-        jit_ffi_call(cd,
-                     self._f_ptr,
-                     exb)
-        ret_val = self.get_ret_val_from_buffer(exb)
-
-        for x in range(len(args)):
-            t = tokens[x]
-            if t is not None:
-                t.finalize_token()
+        exb = self.take_exb()
+        try:
+            tokens = self.prep_exb(exb, args)
+            cd = jit.promote(self._cd)
+            #fp = jit.promote(self._f_ptr)
+            jit_ffi_call(cd,
+                         self._f_ptr,
+                         exb)
+            ret_val = self.get_ret_val_from_buffer(exb)
+
+            if tokens is not None:
+                for x in range(len(args)):
+                    t = tokens[x]
+                    if t is not None:
+                        t.finalize_token()
+        finally:
+            self.release_exb(exb)
 
-        lltype.free(exb, flavor="raw")
         keepalive_until_here(args)
         return ret_val
 
@@ -281,6 +306,68 @@ def set_buffer_size(self, size):
     self.set_used_size(size.int_val())
     return self
 
+@as_var("buffer-index-of")
+def buffer_index_of(buffer, start, byte):
+    """(buffer-index-of buffer start byte)
+       Returns the index of the first occurrence of byte in the used part of buffer at or after
+       start, or -1 if there is none."""
+    affirm(isinstance(buffer, Buffer), u"Expected a Buffer")
+    assert isinstance(buffer, Buffer)
+    ch = chr(byte.int_val() & 0xFF)
+    raw = buffer.buffer()
+    idx = start.int_val()
+    affirm(0 <= idx, u"Start index must not be negative")
+    end = buffer.count()
+    while idx < end:
+        if raw[idx] == ch:
+            return rt.wrap(idx)
+        idx += 1
+    return rt.wrap(-1)
+
+c_memmove = rffi.llexternal("memmove", [rffi.VOIDP, rffi.VOIDP, rffi.SIZE_T], rffi.VOIDP,
+                            releasegil=False)
+
+@as_var("buffer-copy!")
+def buffer_copy(src, src_start, dest, dest_start, cnt):
+    """(buffer-copy! src src-start dest dest-start cnt)
+       Copies cnt bytes from src into dest, the ranges may overlap. Does not change the count
+       of dest."""
+    affirm(isinstance(src, Buffer) and isinstance(dest, Buffer), u"Expected Buffers")
+    assert isinstance(src, Buffer) and isinstance(dest, Buffer)
+    s = src_start.int_val()
+    d = dest_start.int_val()
+    n = cnt.int_val()
+    affirm(s >= 0 and n >= 0 and s + n <= src.capacity(), u"Source range out of bounds")
+    affirm(d >= 0 and d + n <= dest.capacity(), u"Destination range out of bounds")
+    c_memmove(rffi.cast(rffi.VOIDP, rffi.ptradd(dest.buffer(), d)),
+              rffi.cast(rffi.VOIDP, rffi.ptradd(src.buffer(), s)),
+              rffi.cast(rffi.SIZE_T, n))
+    return dest
+
+@as_var("buffer->string")
+def buffer_to_string(buffer, start, end):
+    """(buffer->string buffer start end)
+       Decodes the bytes of buffer between start and end as UTF-8."""
+    affirm(isinstance(buffer, Buffer), u"Expected a Buffer")
+    assert isinstance(buffer, Buffer)
+    s = start.int_val()
+    e = end.int_val()
+    affirm(0 <= s and s <= e and e <= buffer.capacity(), u"Buffer range out of bounds")
+    return rt.wrap(unicode_from_utf8(rffi.charpsize2str(rffi.ptradd(buffer.buffer(), s), e - s)))
+
+@as_var("string->buffer")
+def string_to_buffer(s):
+    """(string->buffer s)
+       Encodes s as UTF-8 into a new Buffer that holds exactly those bytes."""
+    affirm(isinstance(s, String), u"Expected a String")
+    utf8 = unicode_to_utf8(rt.name(s))
+    buffer = Buffer(len(utf8))
+    raw = buffer.buffer()
+    for x in range(len(utf8)):
+        raw[x] = utf8[x]
+    buffer.set_used_size(len(utf8))
+    return buffer
+
 def make_itype(name, ctype, llt):
     lltp = lltype.Ptr(lltype.Array(llt, hints={'nolength': True}))
     class GenericCInt(CType):
@@ -363,6 +450,25 @@ class CDouble(CType):
         return clibffi.cast_type_to_ffitype(rffi.DOUBLE)
 CDouble()
 
+class CFloat(CType):
+    def __init__(self):
+        CType.__init__(self, u"pixie.stdlib.CFloat")
+
+    def ffi_get_value(self, ptr):
+        casted = rffi.cast(rffi.FLOATP, ptr)
+        return Float(rffi.cast(rffi.DOUBLE, casted[0]))
+
+    def ffi_set_value(self, ptr, val):
+        casted = rffi.cast(rffi.FLOATP, ptr)
+        casted[0] = rffi.cast(rffi.FLOAT, val.float_val())
+
+    def ffi_size(self):
+        return rffi.sizeof(rffi.FLOAT)
+
+    def ffi_type(self):
+        return clibffi.cast_type_to_ffitype(rffi.FLOAT)
+CFloat()
+
 class CCharP(CType):
     def __init__(self):
         CType.__init__(self, u"pixie.stdlib.CCharP")
@@ -372,15 +478,19 @@ class CCharP(CType):
         if casted[0] == lltype.nullptr(rffi.CCHARP.TO):
             return nil
         else:
-            return String(unicode(rffi.charp2str(casted[0])))
+            return String(unicode_from_utf8(rffi.charp2str(casted[0])))
 
     def ffi_set_value(self, ptr, val):
+        # Strings hand C their cached UTF-8 encoding, which lives as long as the string. C
+        # must not write into it: the encoding is shared by every later call passing the same
+        # string and by bytes, a callee writing into it corrupts them all. Pass a Buffer for
+        # output parameters.
         if isinstance(val, String):
             pnt = rffi.cast(rffi.CCHARPP, ptr)
-            utf8 = unicode_to_utf8(rt.name(val))
-            raw = rffi.str2charp(utf8)
-            pnt[0] = raw
-            return CCharPToken(raw)
+            pnt[0] = val.utf8_bytes().raw()
+        elif isinstance(val, Bytes):
+            pnt = rffi.cast(rffi.CCHARPP, ptr)
+            pnt[0] = val.raw()
         elif isinstance(val, Buffer):
             vpnt = rffi.cast(rffi.VOIDPP, ptr)
             vpnt[0] = val.buffer()
@@ -394,6 +504,8 @@ class CCharP(CType):
             vpnt = rffi.cast(rffi.VOIDPP, ptr)
             vpnt[0] = rffi.cast(rffi.VOIDP, val.raw_data())
         else:
+            from pixie.vm.libs.stdio import flush_all
+            flush_all()
             print val
             affirm(False, u"Cannot encode this type")
 
@@ -405,14 +517,6 @@ class CCharP(CType):
         return clibffi.ffi_type_pointer
 CCharP()
 
-class CCharPToken(Token):
-    def __init__(self, raw):
-        self._raw = raw
-
-    def finalize_token(self):
-        rffi.free_charp(self._raw)
-
-
 
 class CVoid(CType):
     def __init__(self):
@@ -447,6 +551,8 @@ class CVoidP(CType):
         pnt = rffi.cast(rffi.VOIDPP, ptr)
         if isinstance(val, Buffer):
             pnt[0] = val.buffer()
+        elif isinstance(val, Bytes):
+            pnt[0] = rffi.cast(rffi.VOIDP, val.raw())
         elif isinstance(val, VoidP):
             pnt[0] = val.raw_data()
         elif val is nil:
@@ -454,8 +560,14 @@ class CVoidP(CType):
         elif isinstance(val, CStruct):
             pnt[0] = rffi.cast(rffi.VOIDP, val.raw_data())
         else:
-            print val
-            affirm(False, u"Cannot encode this type")
+            from pixie.vm.libs.typed_array import TypedArray
+            if isinstance(val, TypedArray):
+                pnt[0] = val.raw_data()
+            else:
+                from pixie.vm.libs.stdio import flush_all
+                flush_all()
+                print val
+                affirm(False, u"Cannot encode this type")
 
     def ffi_size(self):
         return rffi.sizeof(rffi.VOIDP)
@@ -747,6 +859,80 @@ def c_struct(name, size, spec):
     proto._dispose_BANG_.extend(tp, _dispose_cstruct)
     return tp
 
+class CStructField(object.Object):
+    """A field of a CStruct type, its offset and type looked up once. Invoked with a struct it
+       returns the value of the field, with a struct and a value it sets the field."""
+    _type = object.Type(u"pixie.ffi.CStructField")
+    _immutable_fields_ = ["_struct_type", "_name", "_ctype", "_offset"]
+
+    def type(self):
+        return CStructField._type
+
+    def __init__(self, struct_type, name, ctype, offset):
+        self._struct_type = struct_type
+        self._name = name
+        self._ctype = ctype
+        self._offset = offset
+
+    def field_ptr(self, s):
+        if not isinstance(s, CStruct) or s._type is not self._struct_type:
+            runtime_error(u"Expected a " + self._struct_type._name + u" for field " + rt.name(rt.str(self._name)))
+        assert isinstance(s, CStruct)
+        return rffi.cast(rffi.VOIDP, rffi.ptradd(s._buffer, self._offset))
+
+    def invoke(self, args):
+        self = jit.promote(self)
+        if len(args) == 1:
+            return self._ctype.ffi_get_value(self.field_ptr(args[0]))
+        if len(args) == 2:
+            self._ctype.ffi_set_value(self.field_ptr(args[0]), args[1])
+            return nil
+        runtime_error(u"Wrong number of args to struct field accessor: got " + unicode(str(len(args))) +
+                      u", expected 1 or 2")
+
+@as_var("pixie.ffi", "accessor")
+def accessor(tp, k):
+    """(accessor tp k)
+       Returns an accessor of the field k of the CStruct type tp. (acc s) returns the field of
+       the struct s and (acc s val) sets it, without looking the field up again."""
+    affirm(isinstance(tp, CStructType), u"Expected a CStruct type")
+    assert isinstance(tp, CStructType)
+    (ctype, offset) = tp.get_desc(k)
+    if ctype is None:
+        runtime_error(u"Invalid field name: " + rt.name(rt.str(k)))
+    return CStructField(tp, k, ctype, offset)
+
+@as_var("pixie.ffi", "struct")
+def struct(tp, fields):
+    """(struct tp fields)
+       Returns a new struct of the CStruct type tp with its memory zeroed and the fields in the
+       map fields, of field keywords to values, set."""
+    affirm(isinstance(tp, CStructType), u"Expected a CStruct type")
+    assert isinstance(tp, CStructType)
+    s = CStruct(tp, rffi.cast(rffi.VOIDP, lltype.malloc(rffi.CCHARP.TO, tp._size, flavor="raw", zero=True)))
+    entries = rt.seq(fields)
+    while entries is not nil:
+        entry = rt.first(entries)
+        s.set_val(rt.key(entry), rt.val(entry))
+        entries = rt.next(entries)
+    return s
+
+@as_var("pixie.ffi", "struct-size")
+def struct_size(tp):
+    """(struct-size tp)
+       Returns the size in bytes of the CStruct type tp, for laying out arrays of structs."""
+    affirm(isinstance(tp, CStructType), u"Expected a CStruct type")
+    assert isinstance(tp, CStructType)
+    return rt.wrap(tp._size)
+
+@as_var("pixie.ffi", "c-sizeof")
+def c_sizeof(tp):
+    """(c-sizeof tp)
+       Returns the size in bytes of a value of the CType tp, for laying out arrays with pack!."""
+    affirm(isinstance(tp, CType), u"Expected a CType")
+    assert isinstance(tp, CType)
+    return rt.wrap(tp.ffi_size())
+
 @as_var("pixie.ffi", "cast")
 def c_cast(frm, to):
     """(cast from to)
@@ -0,0 +1,163 @@
+py_object = object
+from pixie.vm.primitives import nil, true, false
+from pixie.vm.code import as_var
+from pixie.vm.keyword import keyword
+from pixie.vm.string import String
+from pixie.vm.cons import Cons
+from pixie.vm.map_entry import MapEntry
+from pixie.vm.custom_types import CustomTypeInstance
+from pixie.vm.persistent_list import PersistentList
+import pixie.vm.persistent_vector as persistent_vector
+import pixie.vm.persistent_hash_map as persistent_hash_map
+import pixie.vm.persistent_hash_set as persistent_hash_set
+import pixie.vm.persistent_queue as persistent_queue
+from pixie.vm.primitive_vector import PrimitiveVector, PrimitiveVectorNode
+import pixie.vm.rt as rt
+
+## Estimates how much memory a value holds on to. The sizes assume a 64-bit build where every
+## object has a one word GC header and every field takes a word, they are meant for comparing
+## values with each other rather than for exact accounting.
+
+WORD = 8
+
+KW_BYTES = keyword(u"bytes")
+KW_OBJECTS = keyword(u"objects")
+KW_SHARED_BYTES = keyword(u"shared-bytes")
+KW_TYPES = keyword(u"types")
+
+
+class Footprint(py_object):
+    def __init__(self, baseline):
+        self._seen = {}
+        self._baseline = baseline
+        self._stack = []
+        self._bytes = 0
+        self._shared_bytes = 0
+        self._objects = 0
+        self._types = {}
+
+    def object_size(self, fields):
+        return WORD * (1 + fields)
+
+    def array_size(self, length, item_size=WORD):
+        return WORD * 2 + item_size * length
+
+    def push(self, obj):
+        if obj is None or obj is nil or obj is true or obj is false:
+            return
+        if obj in self._seen:
+            return
+        self._seen[obj] = True
+        self._stack.append(obj)
+
+    def push_all(self, array):
+        for x in range(len(array)):
+            self.push(array[x])
+        return self.array_size(len(array))
+
+    def walk(self, obj):
+        self.push(obj)
+        while len(self._stack) > 0:
+            obj = self._stack.pop()
+            size = self.visit(obj)
+
+            self._bytes += size
+            self._objects += 1
+            if self._baseline is not None and obj in self._baseline._seen:
+                self._shared_bytes += size
+
+            name = type_name(obj)
+            self._types[name] = self._types.get(name, 0) + 1
+
+    def visit(self, obj):
+        """Returns the size of obj itself, and pushes the objects it refers to."""
+        if isinstance(obj, persistent_vector.PersistentVector):
+            self.push(obj._meta)
+            self.push(obj._root)
+            return self.object_size(5) + self.push_all(obj._tail)
+
+        if isinstance(obj, persistent_vector.Node):
+            return self.object_size(2) + self.push_all(obj._array)
+
+        if isinstance(obj, persistent_hash_map.PersistentHashMap):
+            self.push(obj._meta)
+            self.push(obj._root)
+            return self.object_size(3)
+
+        if isinstance(obj, persistent_hash_map.INode):
+            return self.object_size(3) + self.push_all(obj._array)
+
+        if isinstance(obj, persistent_hash_set.PersistentHashSet):
+            self.push(obj._meta)
+            self.push(obj._root)
+            return self.object_size(3)
+
+        if isinstance(obj, persistent_hash_set.SetINode):
+            return self.object_size(2) + self.push_all(obj._array)
+
+        if isinstance(obj, PersistentList):
+            self.push(obj._first)
+            self.push(obj._next)
+            self.push(obj._meta)
+            return self.object_size(4)
+
+        if isinstance(obj, Cons):
+            self.push(obj._first)
+            self.push(obj._next)
+            self.push(obj._meta)
+            return self.object_size(3)
+
+        if isinstance(obj, MapEntry):
+            self.push(obj._key)
+            self.push(obj._val)
+            return self.object_size(2)
+
+        if isinstance(obj, persistent_queue.PersistentQueue):
+            self.push(obj._meta)
+            self.push(obj._front)
+            self.push(obj._rear)
+            return self.object_size(4)
+
+        if isinstance(obj, PrimitiveVector) or isinstance(obj, PrimitiveVectorNode):
+            return obj.footprint(self)
+
+        if isinstance(obj, String):
+            return self.object_size(1) + self.array_size(len(obj._str), 4)
+
+        if isinstance(obj, CustomTypeInstance):
+            return self.object_size(2) + self.push_all(obj._fields)
+
+        return self.object_size(1)
+
+    def to_map(self):
+        types = persistent_hash_map.EMPTY
+        for name, cnt in self._types.iteritems():
+            types = types.assoc(rt.wrap(name), rt.wrap(cnt))
+
+        return rt.hashmap(KW_BYTES, rt.wrap(self._bytes),
+                          KW_OBJECTS, rt.wrap(self._objects),
+                          KW_SHARED_BYTES, rt.wrap(self._shared_bytes),
+                          KW_TYPES, types)
+
+
+def type_name(obj):
+    # the hashmap nodes share a single Type, tell them apart for the report
+    if isinstance(obj, persistent_hash_map.BitmapIndexedNode):
+        return u"pixie.stdlib.BitmapIndexedNode"
+    if isinstance(obj, persistent_hash_map.ArrayNode):
+        return u"pixie.stdlib.ArrayNode"
+    if isinstance(obj, persistent_hash_map.HashCollisionNode):
+        return u"pixie.stdlib.HashCollisionNode"
+    return obj.type().name()
+
+
+@as_var("pixie.inspect.internal", "footprint")
+def footprint(obj, baseline):
+    base = None
+    if baseline is not nil:
+        base = Footprint(None)
+        base.walk(baseline)
+
+    fp = Footprint(base)
+    fp.walk(obj)
+    return fp.to_map()
@@ -0,0 +1,144 @@
+import os
+import pixie.vm.rt as rt
+from pixie.vm.code import as_var, extend
+from pixie.vm.object import Object, Type, affirm, runtime_error
+import pixie.vm.stdlib as proto
+from pixie.vm.primitives import nil
+from pixie.vm.util import unicode_to_utf8
+from pixie.vm.libs.ffi import VoidP
+from rpython.rlib import rmmap
+from rpython.rtyper.lltypesystem import rffi
+import rpython.rlib.jit as jit
+
+
+class Mapping(object):
+    """The mmap'ed file shared by a MappedFile and all of its slices."""
+    def __init__(self, mmap):
+        self._mmap = mmap
+        self._closed = False
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            if self._mmap is not None:
+                self._mmap.close()
+
+
+class MappedFile(Object):
+    """A read only view of bytes start to start + count of a memory mapped file. Slices share the
+       mapping, disposing any of them unmaps the file."""
+    _type = Type(u"pixie.io.MappedFile")
+
+    def type(self):
+        return MappedFile._type
+
+    def __init__(self, mapping, start, count):
+        self._mapping = mapping
+        self._start = start
+        self._count = count
+
+    def check_open(self):
+        affirm(not self._mapping._closed, u"MappedFile has been disposed")
+
+    def nth_byte(self, idx):
+        affirm(0 <= idx and idx < self._count, u"Index out of bounds")
+        self.check_open()
+        return ord(self._mapping._mmap.data[self._start + idx])
+
+    def slice(self, start, end):
+        affirm(0 <= start and start <= end and end <= self._count, u"Slice out of bounds")
+        return MappedFile(self._mapping, self._start + start, end - start)
+
+    def raw_data(self):
+        self.check_open()
+        if self._mapping._mmap is None:
+            return rffi.cast(rffi.VOIDP, 0)
+        return rffi.cast(rffi.VOIDP, rffi.ptradd(self._mapping._mmap.data, self._start))
+
+
+def map_file(filename):
+    path = unicode_to_utf8(filename)
+    try:
+        fd = os.open(path, os.O_RDONLY, 0)
+    except OSError:
+        runtime_error(u"Couldn't open " + filename)
+        raise
+    try:
+        size = os.fstat(fd).st_size
+        if size == 0:
+            return MappedFile(Mapping(None), 0, 0)
+        try:
+            mmap = rmmap.mmap(fd, 0, access=rmmap.ACCESS_READ)
+        except rmmap.RMMapError:
+            runtime_error(u"Couldn't map " + filename)
+            raise
+        except OSError:
+            runtime_error(u"Couldn't map " + filename)
+            raise
+        return MappedFile(Mapping(mmap), 0, mmap.size)
+    finally:
+        os.close(fd)
+
+
+@as_var("pixie.io.internal", "mmap-file")
+def mmap_file(filename):
+    return map_file(rt.name(filename))
+
+@as_var("pixie.io.internal", "mmap-slice")
+def mmap_slice(self, start, end):
+    affirm(isinstance(self, MappedFile), u"Expected a MappedFile")
+    assert isinstance(self, MappedFile)
+    return self.slice(start.int_val(), end.int_val())
+
+@as_var("pixie.io.internal", "mmap-pointer")
+def mmap_pointer(self):
+    affirm(isinstance(self, MappedFile), u"Expected a MappedFile")
+    assert isinstance(self, MappedFile)
+    return VoidP(self.raw_data())
+
+
+@extend(proto._count, MappedFile)
+def _count(self):
+    assert isinstance(self, MappedFile)
+    return rt.wrap(self._count)
+
+@extend(proto._nth, MappedFile)
+def _nth(self, idx):
+    assert isinstance(self, MappedFile)
+    return rt.wrap(self.nth_byte(idx.int_val()))
+
+@extend(proto._nth_not_found, MappedFile)
+def _nth_not_found(self, idx, not_found):
+    assert isinstance(self, MappedFile)
+    i = idx.int_val()
+    if 0 <= i and i < self._count:
+        return rt.wrap(self.nth_byte(i))
+    return not_found
+
+@extend(proto._dispose_BANG_, MappedFile)
+def _dispose(self):
+    assert isinstance(self, MappedFile)
+    self._mapping.close()
+    return nil
+
+
+_reduce_driver = jit.JitDriver(name="pixie.io.MappedFile_reduce",
+                               greens=["f"],
+                               reds="auto")
+
+@extend(proto._reduce, MappedFile)
+def _reduce(self, f, init):
+    assert isinstance(self, MappedFile)
+    self.check_open()
+    if self._count == 0:
+        return init
+    data = self._mapping._mmap.data
+    x = self._start
+    end = self._start + self._count
+    while x < end:
+        _reduce_driver.jit_merge_point(f=f)
+        init = f.invoke([init, rt.wrap(ord(data[x]))])
+        if rt.reduced_QMARK_(init):
+            return rt.deref(init)
+        x += 1
+    return init
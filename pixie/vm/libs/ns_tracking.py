@@ -0,0 +1,50 @@
+py_object = object
+import pixie.vm.rt as rt
+from pixie.vm.code import as_var
+from pixie.vm.symbol import symbol
+import pixie.vm.persistent_hash_map as persistent_hash_map
+import pixie.vm.persistent_vector as persistent_vector
+
+## Remembers the file every namespace was loaded from and which namespaces it required, so
+## pixie.reload can work out what to reload when a file changes. load-ns records into it.
+
+
+class NSTracker(py_object):
+    def __init__(self):
+        self._files = {}
+        self._requires = {}
+
+    def record_file(self, ns_name, filename):
+        self._files[ns_name] = filename
+
+    def record_require(self, ns_name, required):
+        requires = self._requires.get(ns_name, None)
+        if requires is None:
+            requires = {}
+            self._requires[ns_name] = requires
+        requires[required] = None
+
+
+tracker = NSTracker()
+
+
+@as_var("pixie.reload.internal", "ns-files")
+def ns_files():
+    """(ns-files)
+       Returns a map of the symbols of the namespaces loaded with load-ns to their files."""
+    result = persistent_hash_map.EMPTY
+    for ns_name, filename in tracker._files.iteritems():
+        result = result.assoc(symbol(ns_name), rt.wrap(filename))
+    return result
+
+@as_var("pixie.reload.internal", "ns-requires")
+def ns_requires():
+    """(ns-requires)
+       Returns a map of namespace symbols to vectors of the namespaces they required."""
+    result = persistent_hash_map.EMPTY
+    for ns_name, requires in tracker._requires.iteritems():
+        required = persistent_vector.EMPTY
+        for name in requires:
+            required = required.conj(symbol(name))
+        result = result.assoc(symbol(ns_name), required)
+    return result
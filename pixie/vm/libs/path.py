@@ -1,40 +1,143 @@
+py_object = object
 import pixie.vm.rt as rt
 from pixie.vm.code import as_var, extend
 from pixie.vm.object import Object, Type
+from pixie.vm.keyword import keyword
+from pixie.vm.string import String
 import pixie.vm.stdlib as proto
-from pixie.vm.primitives import true, false
+from pixie.vm.primitives import nil, true, false
+from rpython.rlib import rposix_scandir, rtime
+from rpython.rlib.rarithmetic import intmask
 import os
+import stat
+
+KIND_UNKNOWN = 0
+KIND_FILE = 1
+KIND_DIR = 2
+KIND_OTHER = 3
+
+KW_FILE = keyword(u"file")
+KW_DIR = keyword(u"dir")
+KW_OTHER = keyword(u"other")
+KW_FILES = keyword(u"files")
+KW_DIRS = keyword(u"dirs")
 
 class Path(Object):
+    """A file system path. The absolute form, its components and its hash are worked out once
+       and cached, the path is made absolute against the working directory of that moment."""
     _type = Type(u"pixie.path.Path")
 
     def type(self):
         return Path._type
 
-    def __init__(self, top):
+    def __init__(self, top, kind=KIND_UNKNOWN, abs_path=None):
         self._path = rt.name(top)
+        self._kind = kind
+        self._abs = abs_path
+        self._abs_obj = None
+        self._components = None
+        self._hash_obj = None
 
     # keyword args don't seem to work nicely.
     #def rel_path(self, other):
     #    "Returns the path relative to other path"
     #    return rt.wrap(str(os.path.relpath(self._path, start=other._path)))
 
+    def abs_str(self):
+        if self._abs is None:
+            self._abs = os.path.abspath(str(self._path))
+        return self._abs
+
     def abs_path(self):
         "Returns the absolute path"
-        return rt.wrap(os.path.abspath(str(self._path)))
+        if self._abs_obj is None:
+            self._abs_obj = rt.wrap(self.abs_str())
+        return self._abs_obj
+
+    def components(self):
+        if self._components is None:
+            self._components = [c for c in self.abs_str().split("/") if c != ""]
+        return self._components
 
-    # Basename doesn't play well with pypy...
-    #def basename(self):
-    #    return rt.wrap(rt.name(os.path.basename("a")))
+    def basename(self):
+        components = self.components()
+        if len(components) == 0:
+            return ""
+        return components[len(components) - 1]
+
+    def path_hash(self):
+        if self._hash_obj is None:
+            self._hash_obj = rt._hash(self.abs_path())
+        return self._hash_obj
 
     def exists(self):
-        return true if os.path.exists(str(self._path)) else false
+        return true if stat_cache.lookup(self.abs_str()).exists else false
 
     def is_file(self):
-        return true if os.path.isfile(str(self._path)) else false
+        return true if stat_cache.lookup(self.abs_str()).kind == KIND_FILE else false
 
     def is_dir(self):
-        return true if os.path.isdir(str(self._path)) else false
+        return true if stat_cache.lookup(self.abs_str()).kind == KIND_DIR else false
+
+    def size(self):
+        return stat_cache.lookup(self.abs_str()).size
+
+
+## Stat results can be kept for a TTL so that code asking exists?/file?/size over and over
+## doesn't stat every time. The TTL is 0 (no caching) unless set, pixie.io drops the entry of
+## every file it writes.
+
+MAX_STAT_CACHE_ENTRIES = 4096
+
+class StatEntry(py_object):
+    def __init__(self, exists, kind, size, time):
+        self.exists = exists
+        self.kind = kind
+        self.size = size
+        self.time = time
+
+def stat_entry(path, now):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return StatEntry(False, KIND_UNKNOWN, 0, now)
+    if stat.S_ISREG(st.st_mode):
+        kind = KIND_FILE
+    elif stat.S_ISDIR(st.st_mode):
+        kind = KIND_DIR
+    else:
+        kind = KIND_OTHER
+    return StatEntry(True, kind, intmask(st.st_size), now)
+
+class StatCache(py_object):
+    def __init__(self):
+        self._ttl = 0.0
+        self._entries = {}
+
+    def set_ttl(self, ttl):
+        self._ttl = ttl
+        self._entries.clear()
+
+    def lookup(self, path):
+        if self._ttl <= 0.0:
+            return stat_entry(path, 0.0)
+        now = rtime.time()
+        entry = self._entries.get(path, None)
+        if entry is None or now - entry.time > self._ttl:
+            if len(self._entries) >= MAX_STAT_CACHE_ENTRIES:
+                self._entries.clear()
+            entry = stat_entry(path, now)
+            self._entries[path] = entry
+        return entry
+
+    def invalidate(self, path):
+        if path in self._entries:
+            del self._entries[path]
+
+    def clear(self):
+        self._entries.clear()
+
+stat_cache = StatCache()
 
 @extend(proto._reduce, Path)
 def _reduce(self, f, init):
@@ -52,6 +155,161 @@ def _reduce(self, f, init):
 
     return init
 
+
+## Walking uses the d_type readdir returns for every entry, only symlinks and entries on file
+## systems that don't fill in d_type are stat'ed. Like os.walk, symlinked dirs are returned but
+## not descended into, and dirs that can't be read are skipped.
+
+def list_entries(dirpath):
+    """Returns the (name, d_type) pairs of dirpath, without . and .."""
+    entries = []
+    dirp = rposix_scandir.opendir(dirpath)
+    try:
+        while True:
+            direntp = rposix_scandir.nextentry(dirp)
+            if not direntp:
+                break
+            name = rposix_scandir.get_name_bytes(direntp)
+            if name == "." or name == "..":
+                continue
+            entries.append((name, rposix_scandir.get_known_type(direntp)))
+    finally:
+        rposix_scandir.closedir(dirp)
+    return entries
+
+def stat_kind(path):
+    try:
+        mode = os.stat(path).st_mode
+    except OSError:
+        return KIND_OTHER
+    if stat.S_ISREG(mode):
+        return KIND_FILE
+    if stat.S_ISDIR(mode):
+        return KIND_DIR
+    return KIND_OTHER
+
+def entry_kind(path, d_type):
+    """Returns (kind, descend?) for an entry of a walked directory"""
+    if d_type == rposix_scandir.DT_REG:
+        return (KIND_FILE, False)
+    if d_type == rposix_scandir.DT_DIR:
+        return (KIND_DIR, True)
+    if d_type == rposix_scandir.DT_LNK:
+        return (stat_kind(path), False)
+    if d_type == rposix_scandir.DT_UNKNOWN:
+        try:
+            is_link = stat.S_ISLNK(os.lstat(path).st_mode)
+        except OSError:
+            return (KIND_OTHER, False)
+        kind = stat_kind(path)
+        return (kind, kind == KIND_DIR and not is_link)
+    return (KIND_OTHER, False)
+
+def join_abs(dirabs, name):
+    if dirabs == "/":
+        return "/" + name
+    return dirabs + "/" + name
+
+def glob_match(pattern, name):
+    """Matches name against pattern, where * matches any run of characters and ? any one"""
+    p = 0
+    n = 0
+    star = -1
+    mark = 0
+    while n < len(name):
+        if p < len(pattern) and (pattern[p] == "?" or pattern[p] == name[n]):
+            p += 1
+            n += 1
+        elif p < len(pattern) and pattern[p] == "*":
+            star = p
+            mark = n
+            p += 1
+        elif star != -1:
+            p = star + 1
+            mark += 1
+            n = mark
+        else:
+            return False
+    while p < len(pattern) and pattern[p] == "*":
+        p += 1
+    return p == len(pattern)
+
+
+class PathWalk(Object):
+    """A reducible walk of the entries below a directory, parents before their children."""
+    _type = Type(u"pixie.path.PathWalk")
+
+    def type(self):
+        return PathWalk._type
+
+    def __init__(self, root, root_abs, max_depth, kinds, globs, extensions):
+        self._root = root
+        self._root_abs = root_abs
+        self._max_depth = max_depth
+        self._kinds = kinds
+        self._globs = globs
+        self._extensions = extensions
+
+    def matches(self, name, kind):
+        if self._kinds != KIND_UNKNOWN and kind != self._kinds:
+            return False
+        if len(self._globs) > 0:
+            found = False
+            for pattern in self._globs:
+                if glob_match(pattern, name):
+                    found = True
+                    break
+            if not found:
+                return False
+        if len(self._extensions) > 0:
+            found = False
+            for ext in self._extensions:
+                if name.endswith(ext):
+                    found = True
+                    break
+            if not found:
+                return False
+        return True
+
+@extend(proto._reduce, PathWalk)
+def _walk_reduce(self, f, init):
+    assert isinstance(self, PathWalk)
+    stack = [(self._root, self._root_abs, 0)]
+    while len(stack) > 0:
+        dirpath, dirabs, depth = stack.pop()
+        try:
+            entries = list_entries(dirpath)
+        except OSError:
+            continue
+        subdirs = []
+        for name, d_type in entries:
+            path = dirpath + "/" + name
+            abs_path = join_abs(dirabs, name)
+            kind, descend = entry_kind(path, d_type)
+            if descend and (self._max_depth < 0 or depth + 1 < self._max_depth):
+                subdirs.append((path, abs_path))
+            if self.matches(name, kind):
+                init = f.invoke([init, Path(rt.wrap(path), kind, abs_path)])
+                if rt.reduced_QMARK_(init):
+                    return rt.deref(init)
+        idx = len(subdirs) - 1
+        while idx >= 0:
+            subdir, subdir_abs = subdirs[idx]
+            stack.append((subdir, subdir_abs, depth + 1))
+            idx -= 1
+    return init
+
+def names_of(coll):
+    result = []
+    if coll is nil:
+        return result
+    if isinstance(coll, String):
+        result.append(str(rt.name(coll)))
+        return result
+    for x in range(rt.count(coll)):
+        result.append(str(rt.name(rt.nth(coll, rt.wrap(x)))))
+    return result
+
 # I have named prefixed all names with '-' to deal with the
 # a namespace issue I was having.
 # TODO: remove '-' and update calling functions when issue is fixed.
@@ -88,3 +346,75 @@ def file_QMARK_(self):
 def dir_QMARK_(self):
     assert isinstance(self, Path)
     return self.is_dir()
+
+@as_var("pixie.path", "-walk")
+def walk(self, max_depth, kinds, globs, extensions):
+    """(-walk path max-depth kinds globs extensions)
+       Returns a reducible of the Paths below path, see pixie.fs/walker."""
+    assert isinstance(self, Path)
+    depth = -1 if max_depth is nil else max_depth.int_val()
+    kind = KIND_UNKNOWN
+    if kinds is KW_FILES:
+        kind = KIND_FILE
+    elif kinds is KW_DIRS:
+        kind = KIND_DIR
+    exts = []
+    for ext in names_of(extensions):
+        exts.append(ext if ext.startswith(".") else "." + ext)
+    return PathWalk(str(self._path), self.abs_str(), depth, kind, names_of(globs), exts)
+
+@as_var("pixie.path", "-kind")
+def kind(self):
+    """(-kind path)
+       Returns :file, :dir or :other for Paths returned by -walk, as told by the directory
+       listing, and nil for other Paths."""
+    assert isinstance(self, Path)
+    if self._kind == KIND_FILE:
+        return KW_FILE
+    if self._kind == KIND_DIR:
+        return KW_DIR
+    if self._kind == KIND_OTHER:
+        return KW_OTHER
+    return nil
+
+@as_var("pixie.path", "-basename")
+def basename(self):
+    assert isinstance(self, Path)
+    return rt.wrap(self.basename())
+
+@as_var("pixie.path", "-components")
+def components(self):
+    """(-components path)
+       Returns the names making up the absolute form of path, as a vector."""
+    assert isinstance(self, Path)
+    result = rt.vector()
+    for c in self.components():
+        result = rt.conj(result, rt.wrap(c))
+    return result
+
+@as_var("pixie.path", "-hash")
+def path_hash(self):
+    assert isinstance(self, Path)
+    return self.path_hash()
+
+@as_var("pixie.path", "-size")
+def size(self):
+    assert isinstance(self, Path)
+    return rt.wrap(self.size())
+
+@as_var("pixie.path", "-set-stat-ttl!")
+def set_stat_ttl(ms):
+    """(-set-stat-ttl! ms)
+       Keeps stat results for ms milliseconds, 0 turns the cache off."""
+    stat_cache.set_ttl(ms.int_val() / 1000.0)
+    return nil
+
+@as_var("pixie.path", "-invalidate-stat!")
+def invalidate_stat(path):
+    """(-invalidate-stat! path)
+       Drops the cached stat of the file at path, a String. With nil drops all of them."""
+    if path is nil:
+        stat_cache.clear()
+    else:
+        stat_cache.invalidate(os.path.abspath(str(rt.name(path))))
+    return nil
@@ -154,11 +154,25 @@ class WriteParirFn(NativeFn):
         return nil
 
 
+class WriteKVFn(NativeFn):
+    def __init__(self, wtr):
+        self._wtr = wtr
+
+    def invoke(self, args):
+        write_object(args[1], self._wtr)
+        write_object(args[2], self._wtr)
+
+        return nil
+
+
 def write_map(mp, wtr):
     write_tag(MAP, wtr)
     write_int_raw(rt.count(mp), wtr)
 
-    rt._reduce(mp, WriteParirFn(wtr), nil)
+    if rt.satisfies_QMARK_(rt.IKVReduce.deref(), mp):
+        rt._reduce_kv(mp, WriteKVFn(wtr), nil)
+    else:
+        rt._reduce(mp, WriteParirFn(wtr), nil)
 
 class WriteItem(NativeFn):
     def __init__(self, wtr):
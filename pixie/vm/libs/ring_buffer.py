@@ -1,36 +1,44 @@
-from rpython.rlib.rarithmetic import r_uint
-from pixie.vm.primitives import nil
+from rpython.rlib.rarithmetic import r_uint, intmask
+import rpython.rlib.rthread as rthread
+from pixie.vm.object import Object, Type, affirm
+from pixie.vm.primitives import nil, true, false
+from pixie.vm.code import as_var, extend
+import pixie.vm.stdlib as proto
+import pixie.vm.rt as rt
 
-empty_slot = (nil, nil)
 
 class RingBuffer(object):
     def __init__(self, size):
         assert isinstance(size, r_uint)
-        self._array = [empty_slot] * size
+        self._array = [None] * size
         self._array_len = size
-        self._length = size
+        self._length = r_uint(0)
         self._head = r_uint(0)
         self._tail = r_uint(0)
 
     def pending(self):
-        return self._array_len - self._length
+        return self._length
+
+    def is_full(self):
+        return self._length == self._array_len
 
     def pop(self):
         if not self._length == 0:
             x = self._array[self._tail]
-            self._array[self._tail] = empty_slot
+            self._array[self._tail] = None
             self._tail = (self._tail + 1) % self._array_len
             self._length -= 1
             return x
-        return empty_slot
+        return None
 
     def push(self, x):
+        assert not self.is_full()
         self._array[self._head] = x
         self._head = (self._head + 1) % self._array_len
         self._length += 1
 
     def unbounded_push(self, x):
-        if self._length == 0:
+        if self.is_full():
             self.resize()
         self.push(x)
 
@@ -40,24 +48,15 @@ class RingBuffer(object):
 
         if self._tail < self._head:
             array_copy(self._array, self._tail, new_arr, 0, self._length)
-            self._tail = 0
-            self._head = self._length
-            self._array = new_arr
-            self._array_len = new_arr_size
 
-        elif self._tail > self._head:
+        elif self._length > 0:
             array_copy(self._array, self._tail, new_arr, 0, self._array_len - self._tail)
             array_copy(self._array, 0, new_arr, self._array_len - self._tail, self._head)
-            self._tail = 0
-            self._head = self._length
-            self._array = new_arr
-            self._array_len = new_arr_size
 
-        else:
-            self._tail = 0
-            self._head = 0
-            self._array = new_arr
-            self._array_len = new_arr_size
+        self._tail = r_uint(0)
+        self._head = self._length
+        self._array = new_arr
+        self._array_len = new_arr_size
 
 
 def array_copy(src, src_pos, dest, dest_pos, count):
@@ -65,3 +64,74 @@ def array_copy(src, src_pos, dest, dest_pos, count):
     while x < count:
         dest[dest_pos + x] = src[src_pos + x]
         x += 1
+
+
+class RingBufferObject(Object):
+    """A bounded, mutable FIFO buffer for handing values between threads. All operations
+       take the buffer's lock."""
+    _type = Type(u"pixie.stdlib.RingBuffer")
+
+    def type(self):
+        return RingBufferObject._type
+
+    def __init__(self, size):
+        self._buffer = RingBuffer(size)
+        self._lock = rthread.allocate_lock()
+
+    def offer(self, val):
+        self._lock.acquire(True)
+        try:
+            if self._buffer.is_full():
+                return False
+            self._buffer.push(val)
+            return True
+        finally:
+            self._lock.release()
+
+    def poll(self):
+        self._lock.acquire(True)
+        try:
+            return self._buffer.pop()
+        finally:
+            self._lock.release()
+
+    def count(self):
+        self._lock.acquire(True)
+        try:
+            return self._buffer.pending()
+        finally:
+            self._lock.release()
+
+    def capacity(self):
+        return self._buffer._array_len
+
+
+@as_var("-ring-buffer")
+def _ring_buffer(size):
+    size = size.int_val()
+    affirm(size > 0, u"Ring buffer size must be positive")
+    return RingBufferObject(r_uint(size))
+
+@as_var("-ring-buffer-offer!")
+def _ring_buffer_offer(self, val):
+    affirm(isinstance(self, RingBufferObject), u"Expected a RingBuffer")
+    assert isinstance(self, RingBufferObject)
+    return true if self.offer(val) else false
+
+@as_var("-ring-buffer-poll!")
+def _ring_buffer_poll(self, not_found):
+    affirm(isinstance(self, RingBufferObject), u"Expected a RingBuffer")
+    assert isinstance(self, RingBufferObject)
+    val = self.poll()
+    return not_found if val is None else val
+
+@as_var("-ring-buffer-capacity")
+def _ring_buffer_capacity(self):
+    affirm(isinstance(self, RingBufferObject), u"Expected a RingBuffer")
+    assert isinstance(self, RingBufferObject)
+    return rt.wrap(intmask(self.capacity()))
+
+@extend(proto._count, RingBufferObject)
+def _count(self):
+    assert isinstance(self, RingBufferObject)
+    return rt.wrap(intmask(self.count()))
@@ -0,0 +1,132 @@
+import os
+import errno
+import pixie.vm.rt as rt
+from pixie.vm.code import as_var, extend, intern_var
+from pixie.vm.object import Object, Type, affirm, runtime_error
+from pixie.vm.primitives import nil
+from pixie.vm.keyword import keyword, Keyword
+from pixie.vm.string import String
+from pixie.vm.util import unicode_to_utf8
+import pixie.vm.stdlib as proto
+from rpython.rtyper.lltypesystem import rffi, lltype
+
+MODE_AUTO = -1
+MODE_NONE = 0
+MODE_LINE = 1
+MODE_FULL = 2
+
+DEFAULT_CAPACITY = 8192
+
+KW_NONE = keyword(u"none")
+KW_LINE = keyword(u"line")
+KW_FULL = keyword(u"full")
+
+
+class StdWriter(Object):
+    """Buffers the UTF-8 encoded text written to a file descriptor. Unbuffered writers write
+       right away, line buffered ones once a newline is written and fully buffered ones once
+       capacity bytes are pending. A writer in auto mode is line buffered on a terminal and
+       fully buffered otherwise, decided on the first write."""
+    _type = Type(u"pixie.stdlib.StdWriter")
+
+    def type(self):
+        return StdWriter._type
+
+    def __init__(self, fd, mode):
+        self._fd = fd
+        self._mode = mode
+        self._capacity = DEFAULT_CAPACITY
+        self._pending = []
+        self._pending_bytes = 0
+
+    def set_mode(self, mode, capacity):
+        self.flush()
+        self._mode = mode
+        self._capacity = capacity
+
+    def write(self, data):
+        if not data:
+            return
+        if self._mode == MODE_AUTO:
+            self._mode = MODE_LINE if os.isatty(self._fd) else MODE_FULL
+        self._pending.append(data)
+        self._pending_bytes += len(data)
+        if self._mode == MODE_NONE \
+           or self._pending_bytes >= self._capacity \
+           or (self._mode == MODE_LINE and data.find("\n") >= 0):
+            self.flush()
+
+    def flush(self):
+        if self._pending_bytes == 0:
+            return
+        data = "".join(self._pending)
+        self._pending = []
+        self._pending_bytes = 0
+        written = 0
+        while written < len(data):
+            try:
+                written += os.write(self._fd, data[written:])
+            except OSError as e:
+                if e.errno != errno.EINTR:
+                    runtime_error(u"Couldn't write to file descriptor " + unicode(str(self._fd)))
+                    raise
+
+
+STDOUT = StdWriter(1, MODE_AUTO)
+STDERR = StdWriter(2, MODE_LINE)
+
+OUT = intern_var(u"pixie.stdlib", u"*out*")
+OUT.set_dynamic()
+OUT.set_root(STDOUT)
+
+ERR = intern_var(u"pixie.stdlib", u"*err*")
+ERR.set_dynamic()
+ERR.set_root(STDERR)
+
+
+c_fflush = rffi.llexternal("fflush", [rffi.VOIDP], rffi.INT, releasegil=False)
+
+def flush_all():
+    """Writes out *out* and *err*, then whatever libc is holding for printf and puts."""
+    STDOUT.flush()
+    STDERR.flush()
+    c_fflush(lltype.nullptr(rffi.VOIDP.TO))
+
+
+@extend(proto._write_str, StdWriter)
+def _write_str(w, s):
+    assert isinstance(w, StdWriter)
+    affirm(isinstance(s, String), u"Only Strings can be written to a StdWriter")
+    w.write(unicode_to_utf8(rt.name(s)))
+    return w
+
+@as_var("-flush-writer")
+def _flush_writer(w):
+    affirm(isinstance(w, StdWriter), u"Argument must be a StdWriter")
+    assert isinstance(w, StdWriter)
+    w.flush()
+    return nil
+
+@as_var("-flush-stdio")
+def _flush_stdio():
+    flush_all()
+    return nil
+
+@as_var("set-buffer-mode!")
+def set_buffer_mode(w, mode):
+    """(set-buffer-mode! w mode)
+       Sets how much of the output to w, *out* or *err*, is held before it is written: :line
+       writes after every newline, :full once 8KB are pending and :none writes right away.
+       Anything pending is written first."""
+    affirm(isinstance(w, StdWriter), u"First argument must be a StdWriter")
+    affirm(isinstance(mode, Keyword), u"Mode must be :line, :full or :none")
+    assert isinstance(w, StdWriter)
+    if mode is KW_LINE:
+        w.set_mode(MODE_LINE, DEFAULT_CAPACITY)
+    elif mode is KW_FULL:
+        w.set_mode(MODE_FULL, DEFAULT_CAPACITY)
+    elif mode is KW_NONE:
+        w.set_mode(MODE_NONE, DEFAULT_CAPACITY)
+    else:
+        runtime_error(u"Unknown buffer mode " + rt.name(rt.str(mode)) + u", expected :line, :full or :none")
+    return w
@@ -0,0 +1,389 @@
+py_object = object
+import pixie.vm.rt as rt
+from pixie.vm.object import Object, Type, affirm, runtime_error
+from pixie.vm.code import as_var, extend
+from pixie.vm.numbers import Integer, Float
+from pixie.vm.primitives import nil
+import pixie.vm.stdlib as proto
+from pixie.vm.libs.ffi import CType, c_memmove
+from rpython.rtyper.lltypesystem import rffi, lltype
+from rpython.rlib.rarithmetic import intmask
+
+## Arrays of C numbers outside the GC heap. Elements are read and written through an
+## ElementKind specialized for the C type, so the bulk operations run over the raw memory
+## without boxing each element.
+
+
+def to_float(val):
+    if isinstance(val, Float):
+        return val.float_val()
+    if isinstance(val, Integer):
+        return float(val.int_val())
+    runtime_error(u"Expected a number, got " + rt.name(rt.str(val)))
+    return 0.0
+
+def to_int(val):
+    if isinstance(val, Integer):
+        return val.int_val()
+    runtime_error(u"Expected an integer, got " + rt.name(rt.str(val)))
+    return 0
+
+
+class ElementKind(py_object):
+    """The operations on the elements of one C type, raw pointers point at the first element."""
+    def __init__(self, size):
+        self._size = size
+
+    def size(self):
+        return self._size
+
+    def get(self, raw, idx):
+        raise NotImplementedError()
+
+    def set(self, raw, idx, val):
+        raise NotImplementedError()
+
+    def fill(self, raw, n, val):
+        raise NotImplementedError()
+
+    def sum(self, raw, n):
+        raise NotImplementedError()
+
+    def min(self, raw, n):
+        raise NotImplementedError()
+
+    def max(self, raw, n):
+        raise NotImplementedError()
+
+    def add(self, dest, a, b, n):
+        raise NotImplementedError()
+
+    def mul(self, dest, a, b, n):
+        raise NotImplementedError()
+
+    def dot(self, a, b, n):
+        raise NotImplementedError()
+
+
+def make_kind(llt, is_float):
+    ptr_t = lltype.Ptr(lltype.Array(llt, hints={'nolength': True}))
+
+    def box_acc(acc):
+        if is_float:
+            return Float(acc)
+        else:
+            return Integer(intmask(acc))
+
+    def widen(v):
+        if is_float:
+            return rffi.cast(lltype.Float, v)
+        else:
+            return rffi.cast(lltype.Signed, v)
+
+    def unbox(val):
+        if is_float:
+            return rffi.cast(llt, to_float(val))
+        else:
+            return rffi.cast(llt, to_int(val))
+
+    class Kind(ElementKind):
+        def get(self, raw, idx):
+            return box_acc(widen(rffi.cast(ptr_t, raw)[idx]))
+
+        def set(self, raw, idx, val):
+            rffi.cast(ptr_t, raw)[idx] = unbox(val)
+
+        def fill(self, raw, n, val):
+            arr = rffi.cast(ptr_t, raw)
+            v = unbox(val)
+            for i in range(n):
+                arr[i] = v
+
+        def sum(self, raw, n):
+            arr = rffi.cast(ptr_t, raw)
+            acc = widen(rffi.cast(llt, 0))
+            for i in range(n):
+                acc += widen(arr[i])
+            return box_acc(acc)
+
+        def min(self, raw, n):
+            if n == 0:
+                return nil
+            arr = rffi.cast(ptr_t, raw)
+            acc = widen(arr[0])
+            for i in range(1, n):
+                v = widen(arr[i])
+                if v < acc:
+                    acc = v
+            return box_acc(acc)
+
+        def max(self, raw, n):
+            if n == 0:
+                return nil
+            arr = rffi.cast(ptr_t, raw)
+            acc = widen(arr[0])
+            for i in range(1, n):
+                v = widen(arr[i])
+                if v > acc:
+                    acc = v
+            return box_acc(acc)
+
+        def add(self, dest, a, b, n):
+            d = rffi.cast(ptr_t, dest)
+            x = rffi.cast(ptr_t, a)
+            y = rffi.cast(ptr_t, b)
+            for i in range(n):
+                d[i] = rffi.cast(llt, widen(x[i]) + widen(y[i]))
+
+        def mul(self, dest, a, b, n):
+            d = rffi.cast(ptr_t, dest)
+            x = rffi.cast(ptr_t, a)
+            y = rffi.cast(ptr_t, b)
+            for i in range(n):
+                d[i] = rffi.cast(llt, widen(x[i]) * widen(y[i]))
+
+        def dot(self, a, b, n):
+            x = rffi.cast(ptr_t, a)
+            y = rffi.cast(ptr_t, b)
+            acc = widen(rffi.cast(llt, 0))
+            for i in range(n):
+                acc += widen(x[i]) * widen(y[i])
+            return box_acc(acc)
+
+    return Kind(rffi.sizeof(llt))
+
+# Keyed by the name of the CType
+kinds = {u"pixie.stdlib.CDouble": make_kind(rffi.DOUBLE, True),
+         u"pixie.stdlib.CFloat": make_kind(rffi.FLOAT, True),
+         u"pixie.stdlib.CInt": make_kind(rffi.INT, False),
+         u"pixie.stdlib.CInt8": make_kind(rffi.SIGNEDCHAR, False),
+         u"pixie.stdlib.CUInt8": make_kind(rffi.UCHAR, False),
+         u"pixie.stdlib.CInt16": make_kind(rffi.SHORT, False),
+         u"pixie.stdlib.CUInt16": make_kind(rffi.USHORT, False),
+         u"pixie.stdlib.CInt32": make_kind(rffi.INT, False),
+         u"pixie.stdlib.CUInt32": make_kind(rffi.UINT, False),
+         u"pixie.stdlib.CInt64": make_kind(rffi.LONGLONG, False)}
+
+
+class TypedArray(Object):
+    """A fixed size array of C numbers outside the GC heap, passed to C functions as a pointer
+       to its first element. Slices are views sharing the memory of the array they were taken
+       from, which they keep alive, and only the original array frees it when disposed."""
+    _type = Type(u"pixie.ffi.TypedArray")
+    _immutable_fields_ = ["_ctype", "_kind", "_raw", "_count", "_owner"]
+
+    def type(self):
+        return TypedArray._type
+
+    def __init__(self, ctype, kind, raw, count, owner):
+        self._ctype = ctype
+        self._kind = kind
+        self._raw = raw
+        self._count = count
+        self._owner = owner
+
+    def raw_data(self):
+        return self._raw
+
+    def count(self):
+        return self._count
+
+    def check_index(self, idx):
+        if idx < 0 or idx >= self._count:
+            runtime_error(u"Index " + unicode(str(idx)) + u" out of bounds for a typed array of " +
+                          unicode(str(self._count)))
+
+    def nth(self, idx):
+        self.check_index(idx)
+        return self._kind.get(self._raw, idx)
+
+    def set_nth(self, idx, val):
+        self.check_index(idx)
+        self._kind.set(self._raw, idx, val)
+
+    def free_data(self):
+        if self._owner is None:
+            lltype.free(rffi.cast(rffi.CCHARP, self._raw), flavor="raw")
+
+
+def allocate(ctype, count):
+    affirm(isinstance(ctype, CType), u"Expected a CType")
+    assert isinstance(ctype, CType)
+    kind = kinds.get(ctype._name, None)
+    if kind is None:
+        runtime_error(u"Typed arrays of " + ctype._name + u" are not supported")
+    affirm(count >= 0, u"Typed array size must not be negative")
+    raw = rffi.cast(rffi.VOIDP, lltype.malloc(rffi.CCHARP.TO, count * kind.size(), flavor="raw", zero=True))
+    return TypedArray(ctype, kind, raw, count, None)
+
+def as_typed_array(a):
+    affirm(isinstance(a, TypedArray), u"Expected a typed array")
+    assert isinstance(a, TypedArray)
+    return a
+
+def check_same_type(a, b):
+    if a._ctype is not b._ctype:
+        runtime_error(u"Typed arrays of " + a._ctype._name + u" and " + b._ctype._name + u" can't be mixed")
+
+def check_same_count(a, b):
+    if a.count() != b.count():
+        runtime_error(u"Typed arrays of " + unicode(str(a.count())) + u" and " +
+                      unicode(str(b.count())) + u" elements can't be combined")
+
+
+@as_var("pixie.ffi", "typed-array")
+def typed_array(ctype, size_or_coll):
+    """(typed-array tp size-or-coll)
+       Returns an array of the C number type tp, one of CDouble, CFloat, CInt or the sized C
+       int types, either of size zeroed elements or holding the numbers in coll."""
+    if isinstance(size_or_coll, Integer):
+        return allocate(ctype, size_or_coll.int_val())
+    cnt = rt.count(size_or_coll).int_val()
+    arr = allocate(ctype, cnt)
+    for i in range(cnt):
+        arr.set_nth(i, rt.nth(size_or_coll, rt.wrap(i)))
+    return arr
+
+@as_var("pixie.ffi", "array-set!")
+def array_set(a, idx, val):
+    """(array-set! a idx val)
+       Sets the element of the typed array a at idx to val, returns a."""
+    arr = as_typed_array(a)
+    arr.set_nth(idx.int_val(), val)
+    return arr
+
+@as_var("pixie.ffi", "array-fill!")
+def array_fill(a, val):
+    """(array-fill! a val)
+       Sets every element of the typed array a to val, returns a."""
+    arr = as_typed_array(a)
+    arr._kind.fill(arr.raw_data(), arr.count(), val)
+    return arr
+
+@as_var("pixie.ffi", "array-copy!")
+def array_copy(src, src_start, dest, dest_start, cnt):
+    """(array-copy! src src-start dest dest-start cnt)
+       Copies cnt elements from the typed array src into dest, of the same type. The ranges
+       may overlap. Returns dest."""
+    s_arr = as_typed_array(src)
+    d_arr = as_typed_array(dest)
+    check_same_type(s_arr, d_arr)
+    s = src_start.int_val()
+    d = dest_start.int_val()
+    n = cnt.int_val()
+    affirm(s >= 0 and n >= 0 and s + n <= s_arr.count(), u"Source range out of bounds")
+    affirm(d >= 0 and d + n <= d_arr.count(), u"Destination range out of bounds")
+    size = s_arr._kind.size()
+    c_memmove(rffi.cast(rffi.VOIDP, rffi.ptradd(rffi.cast(rffi.CCHARP, d_arr.raw_data()), d * size)),
+              rffi.cast(rffi.VOIDP, rffi.ptradd(rffi.cast(rffi.CCHARP, s_arr.raw_data()), s * size)),
+              rffi.cast(rffi.SIZE_T, n * size))
+    return d_arr
+
+@as_var("pixie.ffi", "array-slice")
+def array_slice(a, start, end):
+    """(array-slice a start end)
+       Returns a view of the elements of the typed array a from start to end, writes through
+       the view change a. Disposing the view does nothing, a owns the memory."""
+    arr = as_typed_array(a)
+    s = start.int_val()
+    e = end.int_val()
+    affirm(0 <= s and s <= e and e <= arr.count(), u"Slice range out of bounds")
+    owner = arr if arr._owner is None else arr._owner
+    raw = rffi.cast(rffi.VOIDP, rffi.ptradd(rffi.cast(rffi.CCHARP, arr.raw_data()), s * arr._kind.size()))
+    return TypedArray(arr._ctype, arr._kind, raw, e - s, owner)
+
+@as_var("pixie.ffi", "array-sum")
+def array_sum(a):
+    """(array-sum a)
+       Returns the sum of the elements of the typed array a, a Float for CDouble and CFloat
+       arrays, an Integer wrapping around on overflow for int arrays."""
+    arr = as_typed_array(a)
+    return arr._kind.sum(arr.raw_data(), arr.count())
+
+@as_var("pixie.ffi", "array-min")
+def array_min(a):
+    """(array-min a)
+       Returns the smallest element of the typed array a, nil if it is empty."""
+    arr = as_typed_array(a)
+    return arr._kind.min(arr.raw_data(), arr.count())
+
+@as_var("pixie.ffi", "array-max")
+def array_max(a):
+    """(array-max a)
+       Returns the largest element of the typed array a, nil if it is empty."""
+    arr = as_typed_array(a)
+    return arr._kind.max(arr.raw_data(), arr.count())
+
+@as_var("pixie.ffi", "array-add!")
+def array_add(dest, a, b):
+    """(array-add! dest a b)
+       Stores the elementwise sum of the typed arrays a and b in dest, all of the same type and
+       size. dest may be a or b. Returns dest."""
+    d_arr = as_typed_array(dest)
+    a_arr = as_typed_array(a)
+    b_arr = as_typed_array(b)
+    check_same_type(d_arr, a_arr)
+    check_same_type(d_arr, b_arr)
+    check_same_count(d_arr, a_arr)
+    check_same_count(d_arr, b_arr)
+    d_arr._kind.add(d_arr.raw_data(), a_arr.raw_data(), b_arr.raw_data(), d_arr.count())
+    return d_arr
+
+@as_var("pixie.ffi", "array-mul!")
+def array_mul(dest, a, b):
+    """(array-mul! dest a b)
+       Stores the elementwise product of the typed arrays a and b in dest, all of the same type
+       and size. dest may be a or b. Returns dest."""
+    d_arr = as_typed_array(dest)
+    a_arr = as_typed_array(a)
+    b_arr = as_typed_array(b)
+    check_same_type(d_arr, a_arr)
+    check_same_type(d_arr, b_arr)
+    check_same_count(d_arr, a_arr)
+    check_same_count(d_arr, b_arr)
+    d_arr._kind.mul(d_arr.raw_data(), a_arr.raw_data(), b_arr.raw_data(), d_arr.count())
+    return d_arr
+
+@as_var("pixie.ffi", "array-dot")
+def array_dot(a, b):
+    """(array-dot a b)
+       Returns the dot product of the typed arrays a and b, of the same type and size."""
+    a_arr = as_typed_array(a)
+    b_arr = as_typed_array(b)
+    check_same_type(a_arr, b_arr)
+    check_same_count(a_arr, b_arr)
+    return a_arr._kind.dot(a_arr.raw_data(), b_arr.raw_data(), a_arr.count())
+
+
+@extend(proto._count, TypedArray)
+def _count(self):
+    assert isinstance(self, TypedArray)
+    return rt.wrap(self.count())
+
+@extend(proto._nth, TypedArray)
+def _nth(self, idx):
+    assert isinstance(self, TypedArray)
+    return self.nth(idx.int_val())
+
+@extend(proto._nth_not_found, TypedArray)
+def _nth_not_found(self, idx, not_found):
+    assert isinstance(self, TypedArray)
+    i = idx.int_val()
+    if i < 0 or i >= self.count():
+        return not_found
+    return self.nth(i)
+
+@extend(proto._reduce, TypedArray)
+def _reduce(self, f, init):
+    assert isinstance(self, TypedArray)
+    for i in range(self.count()):
+        init = f.invoke([init, self._kind.get(self._raw, i)])
+        if rt.reduced_QMARK_(init):
+            return rt.deref(init)
+    return init
+
+@extend(proto._dispose_BANG_, TypedArray)
+def _dispose(self):
+    assert isinstance(self, TypedArray)
+    self.free_data()
+    return nil
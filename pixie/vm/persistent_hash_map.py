@@ -17,6 +17,10 @@ class Box(py_object):
     def __init__(self):
         self._val = None
 
+class Counter(py_object):
+    def __init__(self):
+        self._val = 0
+
 class PersistentHashMap(object.Object):
     _type = object.Type(u"pixie.stdlib.PersistentHashMap")
 
@@ -65,6 +69,42 @@ class PersistentHashMap(object.Object):
         else:
             return self._root.iter()
 
+    def merge(self, other, f):
+        """Merges the entries of other into this map, walking both tries together. Subtrees
+           shared by both maps are reused as-is. If f is not None it is called with the old
+           and the new value of keys found in both maps, otherwise the value from other wins."""
+        if other._root is None or (f is None and self._root is other._root):
+            return self
+        if self._root is None:
+            return PersistentHashMap(other._cnt, other._root, self._meta)
+
+        added = Counter()
+        new_root = merge_nodes(r_uint(0), self._root, other._root, f, added)
+        if new_root is self._root:
+            return self
+        return PersistentHashMap(self._cnt + r_uint(added._val), new_root, self._meta)
+
+    def retain(self, other, keep_shared):
+        """Returns the entries of this map whose keys are (if keep_shared) or are not
+           (if not keep_shared) found in other."""
+        if self._root is None:
+            return self
+        if other._root is None:
+            return self if not keep_shared else PersistentHashMap(r_uint(0), None, self._meta)
+
+        removed = Counter()
+        new_root = retain_nodes(r_uint(0), self._root, other._root, keep_shared, removed)
+        if new_root is self._root:
+            return self
+        return PersistentHashMap(self._cnt - r_uint(removed._val), new_root, self._meta)
+
+    def keys_subset_of(self, other):
+        if self._cnt > other._cnt:
+            return False
+        if self._root is None or self._root is other._root:
+            return True
+        return subset_nodes(r_uint(0), self._root, other._root)
+
 
 
 
@@ -85,9 +125,15 @@ class INode(object.Object):
     def reduce_inode(self, f, init):
         pass
 
+    def reduce_kv_inode(self, f, init):
+        pass
+
     def without(self, shift, hash, key):
         pass
 
+    def count_inode(self):
+        return 0
+
 def mask(hash, shift):
     return (hash >> shift) & 0x01f
 
@@ -185,6 +231,29 @@ class BitmapIndexedNode(INode):
                 return init
         return init
 
+    def reduce_kv_inode(self, f, init):
+        for x in range(0, len(self._array), 2):
+            key_or_none = self._array[x]
+            val_or_node = self._array[x + 1]
+            if key_or_none is None and val_or_node is not None:
+                init = val_or_node.reduce_kv_inode(f, init)
+            else:
+                init = f.invoke([init, key_or_none, val_or_node])
+            if rt.reduced_QMARK_(init):
+                return init
+        return init
+
+    def count_inode(self):
+        cnt = 0
+        for x in range(0, len(self._array), 2):
+            if self._array[x] is None:
+                node = self._array[x + 1]
+                if node is not None:
+                    cnt += node.count_inode()
+            else:
+                cnt += 1
+        return cnt
+
     def iter(self):
         return BitmapIndexedNodeIterator(self._array)
 
@@ -210,6 +279,8 @@ class BitmapIndexedNode(INode):
             return BitmapIndexedNode(None, self._bitmap ^ bit, remove_pair(self._array, idx))
 
         if rt.eq(key, key_or_none):
+            if self._bitmap == bit:
+                return None
             return BitmapIndexedNode(None, self._bitmap ^ bit, remove_pair(self._array, idx))
 
         return self
@@ -345,6 +416,24 @@ class ArrayNode(INode):
 
         return init
 
+    def reduce_kv_inode(self, f, init):
+        for x in range(len(self._array)):
+            node = self._array[x]
+            if node is not None:
+                init = node.reduce_kv_inode(f, init)
+                if rt.reduced_QMARK_(init):
+                    return init
+
+        return init
+
+    def count_inode(self):
+        cnt = 0
+        for x in range(len(self._array)):
+            node = self._array[x]
+            if node is not None:
+                cnt += node.count_inode()
+        return cnt
+
     def iter(self):
         return ArrayMapIterator(self._array)
 
@@ -437,6 +526,24 @@ class HashCollisionNode(INode):
                 return init
         return init
 
+    def reduce_kv_inode(self, f, init):
+        for x in range(0, len(self._array), 2):
+            key_or_nil = self._array[x]
+            if key_or_nil is None:
+                continue
+
+            init = f.invoke([init, key_or_nil, self._array[x + 1]])
+            if rt.reduced_QMARK_(init):
+                return init
+        return init
+
+    def count_inode(self):
+        cnt = 0
+        for x in range(0, len(self._array), 2):
+            if self._array[x] is not None:
+                cnt += 1
+        return cnt
+
     def iter(self):
         return HashCollisionNodeIterator(self._array)
 
@@ -455,7 +562,7 @@ class HashCollisionNode(INode):
         if idx == -1:
             return self
 
-        if len(self._array) == 1:
+        if len(self._array) == 2:
             return None
 
         return HashCollisionNode(None, self._hash, remove_pair(self._array, r_uint(idx) / 2))
@@ -549,6 +656,261 @@ def remove_pair(array, i):
     list_copy(array, 2 * (i + 1), new_array, 2 * i, len(new_array) - (2 * i))
     return new_array
 
+### structural merging
+
+def node_slot(node, i):
+    """Returns the (key, val_or_node) pair stored at bit position i of a BitmapIndexedNode
+       or ArrayNode, or (None, None) if the slot is empty."""
+    if isinstance(node, ArrayNode):
+        return None, node._array[i]
+    assert isinstance(node, BitmapIndexedNode)
+    bit = r_uint(1) << i
+    if node._bitmap & bit == 0:
+        return None, None
+    idx = node.index(bit)
+    return node._array[2 * idx], node._array[2 * idx + 1]
+
+def slot_count(key, val_or_node):
+    if key is None:
+        assert isinstance(val_or_node, INode)
+        return val_or_node.count_inode()
+    return 1
+
+def slot_contains(shift, key_or_none, val_or_node, key):
+    if key_or_none is None:
+        return val_or_node.find(shift, rt.hash(key) & MASK_32, key, NOT_FOUND) is not NOT_FOUND
+    return rt.eq(key_or_none, key)
+
+def collect_entries(node, keys, vals):
+    array = node._array
+    if isinstance(node, ArrayNode):
+        for x in range(len(array)):
+            if array[x] is not None:
+                collect_entries(array[x], keys, vals)
+        return
+
+    for x in range(0, len(array), 2):
+        key_or_none = array[x]
+        val_or_node = array[x + 1]
+        if key_or_none is not None:
+            keys.append(key_or_none)
+            vals.append(val_or_node)
+        elif val_or_node is not None and not isinstance(node, HashCollisionNode):
+            collect_entries(val_or_node, keys, vals)
+
+def build_node(shift, keys, vals, as_array):
+    """Packs the 32 slots in keys/vals into a BitmapIndexedNode, or into an ArrayNode if
+       there are too many of them or as_array is set."""
+    n = 0
+    for i in range(32):
+        if vals[i] is not None:
+            n += 1
+
+    if n == 0:
+        return None
+
+    if as_array or n > 16:
+        nodes = [None] * 32
+        for i in range(32):
+            if keys[i] is None:
+                nodes[i] = vals[i]
+            else:
+                nodes[i] = BitmapIndexedNode_EMPTY.assoc_inode(shift + 5, rt.hash(keys[i]) & MASK_32,
+                                                               keys[i], vals[i], Box())
+        return ArrayNode(None, n, nodes)
+
+    bitmap = r_uint(0)
+    array = [None] * (2 * n)
+    j = 0
+    for i in range(32):
+        if vals[i] is not None:
+            bitmap |= r_uint(1) << i
+            array[j] = keys[i]
+            array[j + 1] = vals[i]
+            j += 2
+    return BitmapIndexedNode(None, bitmap, array)
+
+def merge_value(f, old_val, new_val):
+    if f is None:
+        return new_val
+    return f.invoke([old_val, new_val])
+
+def assoc_entry(shift, node, key, val, f, added):
+    hash_val = rt.hash(key) & MASK_32
+    if f is not None:
+        existing = node.find(shift, hash_val, key, NOT_FOUND)
+        if existing is not NOT_FOUND:
+            val = f.invoke([existing, val])
+
+    added_leaf = Box()
+    node = node.assoc_inode(shift, hash_val, key, val, added_leaf)
+    if added_leaf._val is not None:
+        added._val += 1
+    return node
+
+def merge_by_assoc(shift, node, other, f, added):
+    keys = []
+    vals = []
+    collect_entries(other, keys, vals)
+    for x in range(len(keys)):
+        node = assoc_entry(shift, node, keys[x], vals[x], f, added)
+    return node
+
+def merge_nodes(shift, a, b, f, added):
+    """Merges node b into node a, both sitting at the given shift. Only the paths that differ
+       are copied, the number of new keys is added to added._val."""
+    if a is b and f is None:
+        return a
+
+    if isinstance(a, HashCollisionNode) or isinstance(b, HashCollisionNode):
+        return merge_by_assoc(shift, a, b, f, added)
+
+    keys = [None] * 32
+    vals = [None] * 32
+    changed = False
+
+    for i in range(32):
+        a_key, a_val = node_slot(a, i)
+        b_key, b_val = node_slot(b, i)
+        key = a_key
+        val = a_val
+
+        if b_val is None:
+            pass
+        elif a_val is None:
+            key = b_key
+            val = b_val
+            added._val += slot_count(b_key, b_val)
+        elif a_key is None and b_key is None:
+            val = merge_nodes(shift + 5, a_val, b_val, f, added)
+        elif a_key is None:
+            val = assoc_entry(shift + 5, a_val, b_key, b_val, f, added)
+        elif b_key is None:
+            # a's entry is folded into b's subtree, b's values win
+            key = None
+            hash_val = rt.hash(a_key) & MASK_32
+            existing = b_val.find(shift + 5, hash_val, a_key, NOT_FOUND)
+            if existing is NOT_FOUND:
+                added._val += b_val.count_inode()
+                val = b_val.assoc_inode(shift + 5, hash_val, a_key, a_val, Box())
+            else:
+                added._val += b_val.count_inode() - 1
+                val = b_val if f is None else b_val.assoc_inode(shift + 5, hash_val, a_key,
+                                                                f.invoke([a_val, existing]), Box())
+        elif rt.eq(a_key, b_key):
+            val = merge_value(f, a_val, b_val)
+        else:
+            key = None
+            val = create_node(shift + 5, a_key, a_val, rt.hash(b_key) & MASK_32, b_key, b_val)
+            added._val += 1
+
+        if key is not a_key or val is not a_val:
+            changed = True
+        keys[i] = key
+        vals[i] = val
+
+    if not changed:
+        return a
+
+    return build_node(shift, keys, vals, isinstance(a, ArrayNode))
+
+def retain_by_lookup(shift, a, b_key, b_val, keep_shared, removed):
+    keys = []
+    vals = []
+    collect_entries(a, keys, vals)
+    node = a
+    for x in range(len(keys)):
+        key = keys[x]
+        if slot_contains(shift, b_key, b_val, key) != keep_shared:
+            node = node.without_inode(shift, rt.hash(key) & MASK_32, key)
+            removed._val += 1
+            if node is None:
+                break
+    return node
+
+def retain_nodes(shift, a, b, keep_shared, removed):
+    """Returns the part of node a whose keys are (keep_shared) or are not (not keep_shared)
+       found in node b. The number of dropped keys is added to removed._val."""
+    if a is b:
+        if keep_shared:
+            return a
+        removed._val += a.count_inode()
+        return None
+
+    if isinstance(a, HashCollisionNode) or isinstance(b, HashCollisionNode):
+        return retain_by_lookup(shift, a, None, b, keep_shared, removed)
+
+    keys = [None] * 32
+    vals = [None] * 32
+    changed = False
+
+    for i in range(32):
+        a_key, a_val = node_slot(a, i)
+        if a_val is None:
+            continue
+
+        b_key, b_val = node_slot(b, i)
+        val = a_val
+
+        if b_val is None:
+            if keep_shared:
+                removed._val += slot_count(a_key, a_val)
+                val = None
+        elif a_key is None and b_key is None:
+            val = retain_nodes(shift + 5, a_val, b_val, keep_shared, removed)
+        elif a_key is None:
+            val = retain_by_lookup(shift + 5, a_val, b_key, b_val, keep_shared, removed)
+        elif slot_contains(shift + 5, b_key, b_val, a_key) != keep_shared:
+            removed._val += 1
+            val = None
+
+        if val is not a_val:
+            changed = True
+        keys[i] = a_key
+        vals[i] = val
+
+    if not changed:
+        return a
+
+    return build_node(shift, keys, vals, False)
+
+def all_contained(shift, a, b_key, b_val):
+    keys = []
+    vals = []
+    collect_entries(a, keys, vals)
+    for x in range(len(keys)):
+        if not slot_contains(shift, b_key, b_val, keys[x]):
+            return False
+    return True
+
+def subset_nodes(shift, a, b):
+    """Returns True if every key of node a is found in node b."""
+    if a is b:
+        return True
+
+    if isinstance(a, HashCollisionNode) or isinstance(b, HashCollisionNode):
+        return all_contained(shift, a, None, b)
+
+    for i in range(32):
+        a_key, a_val = node_slot(a, i)
+        if a_val is None:
+            continue
+
+        b_key, b_val = node_slot(b, i)
+        if b_val is None:
+            return False
+
+        if a_key is None and b_key is None:
+            if not subset_nodes(shift + 5, a_val, b_val):
+                return False
+        elif a_key is None:
+            if not all_contained(shift + 5, a_val, b_key, b_val):
+                return False
+        elif not slot_contains(shift + 5, b_key, b_val, a_key):
+            return False
+
+    return True
+
 ### hook into RT
 
 EMPTY = PersistentHashMap(r_uint(0), None)
@@ -593,6 +955,17 @@ def _reduce(self, f, init):
 
     return val
 
+@extend(proto._reduce_kv, PersistentHashMap)
+def _reduce_kv(self, f, init):
+    assert isinstance(self, PersistentHashMap)
+    if self._root is None:
+        return init
+    val = self._root.reduce_kv_inode(f, init)
+    if rt.reduced_QMARK_(val):
+        return rt.deref(val)
+
+    return val
+
 @extend(proto._assoc, PersistentHashMap)
 def _assoc(self, key, val):
     assert isinstance(self, PersistentHashMap)
@@ -628,3 +1001,11 @@ def _contains_key(self, key):
         return true if self._root.find(r_uint(0), rt.hash(key), key, NOT_FOUND) is not NOT_FOUND else false
     else:
         return false
+
+@as_var("-merge-with")
+def _merge_with(f, a, b):
+    affirm(isinstance(a, PersistentHashMap) and isinstance(b, PersistentHashMap),
+           u"-merge-with requires two hashmaps")
+    assert isinstance(a, PersistentHashMap)
+    assert isinstance(b, PersistentHashMap)
+    return a.merge(b, f)
@@ -1,41 +1,617 @@
 py_object = object
 import pixie.vm.object as object
+from pixie.vm.object import affirm
 from pixie.vm.primitives import nil, true, false
-import pixie.vm.persistent_hash_map as persistent_hash_map
+from pixie.vm.persistent_hash_map import MASK_32, Box, Counter, mask, bitpos, bit_count, list_copy, clone_and_set
 import pixie.vm.stdlib as proto
-from  pixie.vm.code import extend, as_var, intern_var
+from  pixie.vm.code import extend, as_var
+from rpython.rlib.rarithmetic import r_uint
 import pixie.vm.rt as rt
-from pixie.vm.iterator import MapIterator
+from pixie.vm.iterator import NativeIterator, empty_iterator
 
 
-VAR_KEY = intern_var(u"pixie.stdlib", u"key")
-
 class PersistentHashSet(object.Object):
     _type = object.Type(u"pixie.stdlib.PersistentHashSet")
 
     def type(self):
         return PersistentHashSet._type
 
-    def __init__(self, meta, m):
+    def __init__(self, meta, cnt, root):
         self._meta = meta
-        self._map = m
+        self._cnt = cnt
+        self._root = root
 
     def conj(self, v):
-        return PersistentHashSet(self._meta, self._map.assoc(v, v))
+        added_leaf = Box()
+
+        new_root = (SetBitmapIndexedNode_EMPTY if self._root is None else self._root) \
+                   .conj_inode(r_uint(0), rt.hash(v) & MASK_32, v, added_leaf)
+
+        if new_root is self._root:
+            return self
+
+        return PersistentHashSet(self._meta, self._cnt if added_leaf._val is None else self._cnt + 1, new_root)
 
     def disj(self, k):
-        return PersistentHashSet(self._meta, self._map.without(k))
+        if self._root is None:
+            return self
+
+        new_root = self._root.without_inode(r_uint(0), rt.hash(k) & MASK_32, k)
+
+        if new_root is self._root:
+            return self
+        return PersistentHashSet(self._meta, self._cnt - 1, new_root)
+
+    def lookup(self, k):
+        if self._root is None:
+            return None
+        return self._root.lookup(r_uint(0), rt.hash(k) & MASK_32, k)
 
     def meta(self):
         return self._meta
 
     def with_meta(self, meta):
-        return PersistentHashSet(meta, self._map)
+        return PersistentHashSet(meta, self._cnt, self._root)
 
     def iter(self):
-        return MapIterator(VAR_KEY.deref(), self._map.iter())
+        if self._root is None:
+            return empty_iterator
+        return self._root.iter()
+
+    def union(self, other):
+        if other._root is None or self._root is other._root:
+            return self
+        if self._root is None:
+            return PersistentHashSet(self._meta, other._cnt, other._root)
+
+        added = Counter()
+        new_root = union_nodes(r_uint(0), self._root, other._root, added)
+        if new_root is self._root:
+            return self
+        return PersistentHashSet(self._meta, self._cnt + added._val, new_root)
+
+    def retain(self, other, keep_shared):
+        """Returns the elements of this set that are (if keep_shared) or are not
+           (if not keep_shared) found in other."""
+        if self._root is None:
+            return self
+        if other._root is None:
+            return self if not keep_shared else PersistentHashSet(self._meta, 0, None)
+
+        removed = Counter()
+        new_root = retain_nodes(r_uint(0), self._root, other._root, keep_shared, removed)
+        if new_root is self._root:
+            return self
+        return PersistentHashSet(self._meta, self._cnt - removed._val, new_root)
+
+    def is_subset(self, other):
+        if self._cnt > other._cnt:
+            return False
+        if self._root is None or self._root is other._root:
+            return True
+        return subset_nodes(r_uint(0), self._root, other._root)
+
+
+class SetINode(object.Object):
+    """Trie node of a PersistentHashSet. Unlike the hashmap nodes these store only the elements,
+       an array slot holds either an element or a child SetINode."""
+    _type = object.Type(u"pixie.stdlib.SetINode")
+
+    def type(self):
+        return SetINode._type
+
+    def conj_inode(self, shift, hash_val, val, added_leaf):
+        pass
+
+    def lookup(self, shift, hash_val, val):
+        pass
+
+    def without_inode(self, shift, hash_val, val):
+        pass
+
+    def reduce_inode(self, f, init):
+        pass
+
+    def count_inode(self):
+        return 0
+
+    def iter(self):
+        return SetNodeIterator(self._array)
+
+
+class SetBitmapIndexedNode(SetINode):
+    def __init__(self, bitmap, array):
+        self._bitmap = bitmap
+        self._array = array
+
+    def index(self, bit):
+        return bit_count(self._bitmap & (bit - 1))
+
+    def conj_inode(self, shift, hash_val, val, added_leaf):
+        bit = bitpos(hash_val, shift)
+        idx = self.index(bit)
+
+        if (self._bitmap & bit) != 0:
+            val_or_node = self._array[idx]
+
+            if isinstance(val_or_node, SetINode):
+                n = val_or_node.conj_inode(shift + 5, hash_val, val, added_leaf)
+                if n is val_or_node:
+                    return self
+                return SetBitmapIndexedNode(self._bitmap, clone_and_set(self._array, idx, n))
+
+            if rt.eq(val, val_or_node):
+                return self
+
+            added_leaf._val = added_leaf
+            return SetBitmapIndexedNode(self._bitmap,
+                                        clone_and_set(self._array, idx,
+                                                      create_node(shift + 5, val_or_node, hash_val, val)))
+        else:
+            n = bit_count(self._bitmap)
+            if n >= 16:
+                nodes = [None] * 32
+                nodes[mask(hash_val, shift)] = SetBitmapIndexedNode_EMPTY.conj_inode(shift + 5, hash_val, val,
+                                                                                     added_leaf)
+                j = 0
+                for i in range(32):
+                    if (self._bitmap >> i) & 1 != 0:
+                        nodes[i] = as_node(shift, self._array[j])
+                        j += 1
+
+                return SetArrayNode(n + 1, nodes)
+            else:
+                new_array = [None] * (n + 1)
+                list_copy(self._array, 0, new_array, 0, idx)
+                new_array[idx] = val
+                added_leaf._val = added_leaf
+                list_copy(self._array, idx, new_array, idx + 1, n - idx)
+                return SetBitmapIndexedNode(self._bitmap | bit, new_array)
+
+    def lookup(self, shift, hash_val, val):
+        bit = bitpos(hash_val, shift)
+        if (self._bitmap & bit) == 0:
+            return None
+        val_or_node = self._array[self.index(bit)]
+        if isinstance(val_or_node, SetINode):
+            return val_or_node.lookup(shift + 5, hash_val, val)
+        if rt.eq(val, val_or_node):
+            return val_or_node
+        return None
+
+    def without_inode(self, shift, hash_val, val):
+        bit = bitpos(hash_val, shift)
+        if self._bitmap & bit == 0:
+            return self
+
+        idx = self.index(bit)
+        val_or_node = self._array[idx]
+
+        if isinstance(val_or_node, SetINode):
+            n = val_or_node.without_inode(shift + 5, hash_val, val)
+            if n is val_or_node:
+                return self
+            if n is not None:
+                return SetBitmapIndexedNode(self._bitmap, clone_and_set(self._array, idx, n))
+        elif not rt.eq(val, val_or_node):
+            return self
+
+        if self._bitmap == bit:
+            return None
+        return SetBitmapIndexedNode(self._bitmap ^ bit, remove_at(self._array, idx))
+
+    def reduce_inode(self, f, init):
+        for x in range(len(self._array)):
+            val_or_node = self._array[x]
+            if isinstance(val_or_node, SetINode):
+                init = val_or_node.reduce_inode(f, init)
+            else:
+                init = f.invoke([init, val_or_node])
+            if rt.reduced_QMARK_(init):
+                return init
+        return init
+
+    def count_inode(self):
+        cnt = 0
+        for x in range(len(self._array)):
+            val_or_node = self._array[x]
+            if isinstance(val_or_node, SetINode):
+                cnt += val_or_node.count_inode()
+            else:
+                cnt += 1
+        return cnt
+
+SetBitmapIndexedNode_EMPTY = SetBitmapIndexedNode(r_uint(0), [])
+
+
+class SetArrayNode(SetINode):
+    def __init__(self, cnt, array):
+        self._cnt = cnt
+        self._array = array
+
+    def conj_inode(self, shift, hash_val, val, added_leaf):
+        idx = mask(hash_val, shift)
+        node = self._array[idx]
+        if node is None:
+            return SetArrayNode(self._cnt + 1, clone_and_set(self._array, idx,
+                                SetBitmapIndexedNode_EMPTY.conj_inode(shift + 5, hash_val, val, added_leaf)))
+
+        n = node.conj_inode(shift + 5, hash_val, val, added_leaf)
+        if n is node:
+            return self
+        return SetArrayNode(self._cnt, clone_and_set(self._array, idx, n))
+
+    def lookup(self, shift, hash_val, val):
+        node = self._array[mask(hash_val, shift)]
+        if node is None:
+            return None
+        return node.lookup(shift + 5, hash_val, val)
+
+    def without_inode(self, shift, hash_val, val):
+        idx = mask(hash_val, shift)
+        node = self._array[idx]
+        if node is None:
+            return self
+        n = node.without_inode(shift + 5, hash_val, val)
+        if n is node:
+            return self
+        if n is None:
+            if self._cnt <= 8:  # shrink
+                return self.pack(idx)
+            return SetArrayNode(self._cnt - 1, clone_and_set(self._array, idx, n))
+        return SetArrayNode(self._cnt, clone_and_set(self._array, idx, n))
+
+    def pack(self, idx):
+        new_array = [None] * (self._cnt - 1)
+        bitmap = r_uint(0)
+        j = 0
+        for i in range(len(self._array)):
+            if i != idx and self._array[i] is not None:
+                new_array[j] = self._array[i]
+                bitmap |= r_uint(1) << i
+                j += 1
+        return SetBitmapIndexedNode(bitmap, new_array)
+
+    def reduce_inode(self, f, init):
+        for x in range(len(self._array)):
+            node = self._array[x]
+            if node is not None:
+                init = node.reduce_inode(f, init)
+                if rt.reduced_QMARK_(init):
+                    return init
+        return init
+
+    def count_inode(self):
+        cnt = 0
+        for x in range(len(self._array)):
+            node = self._array[x]
+            if node is not None:
+                cnt += node.count_inode()
+        return cnt
+
+
+class SetHashCollisionNode(SetINode):
+    def __init__(self, hash_val, array):
+        self._hash = hash_val
+        self._array = array
+
+    def conj_inode(self, shift, hash_val, val, added_leaf):
+        if hash_val == self._hash:
+            if self.find_index(val) != -1:
+                return self
+
+            count = len(self._array)
+            new_array = [None] * (count + 1)
+            list_copy(self._array, 0, new_array, 0, count)
+            new_array[count] = val
+            added_leaf._val = added_leaf
+            return SetHashCollisionNode(self._hash, new_array)
+
+        return SetBitmapIndexedNode(bitpos(self._hash, shift), [self]) \
+                                   .conj_inode(shift, hash_val, val, added_leaf)
+
+    def lookup(self, shift, hash_val, val):
+        idx = self.find_index(val)
+        if idx == -1:
+            return None
+        return self._array[idx]
+
+    def without_inode(self, shift, hash_val, val):
+        idx = self.find_index(val)
+        if idx == -1:
+            return self
+        if len(self._array) == 1:
+            return None
+        return SetHashCollisionNode(self._hash, remove_at(self._array, idx))
+
+    def reduce_inode(self, f, init):
+        for x in range(len(self._array)):
+            init = f.invoke([init, self._array[x]])
+            if rt.reduced_QMARK_(init):
+                return init
+        return init
+
+    def count_inode(self):
+        return len(self._array)
 
-EMPTY = PersistentHashSet(nil, persistent_hash_map.EMPTY)
+    def find_index(self, val):
+        for x in range(len(self._array)):
+            if rt.eq(val, self._array[x]):
+                return x
+        return -1
+
+
+class SetNodeIterator(NativeIterator):
+    """Walks the slots of a set node, descending into child nodes as it goes."""
+    def __init__(self, array):
+        self._w_array = array
+        self._idx = 0
+        self._w_child = None
+        self._at_end = False
+        self._w_current = nil
+        self.move_next()
+
+    def move_next(self):
+        while True:
+            if self._w_child is not None:
+                self._w_child.move_next()
+                if not self._w_child.at_end():
+                    self._w_current = self._w_child.current()
+                    return self
+                self._w_child = None
+
+            if self._idx == len(self._w_array):
+                self._w_current = nil
+                self._at_end = True
+                return self
+
+            val_or_node = self._w_array[self._idx]
+            self._idx += 1
+
+            if val_or_node is None:
+                continue
+
+            if isinstance(val_or_node, SetINode):
+                child = val_or_node.iter()
+                assert isinstance(child, SetNodeIterator)
+                if child.at_end():
+                    continue
+                self._w_child = child
+                self._w_current = child.current()
+                return self
+
+            self._w_current = val_or_node
+            return self
+
+    def at_end(self):
+        return self._at_end
+
+    def current(self):
+        return self._w_current
+
+
+def create_node(shift, val1, hash2, val2):
+    hash1 = rt.hash(val1) & MASK_32
+    if hash1 == hash2:
+        return SetHashCollisionNode(hash1, [val1, val2])
+    added_leaf = Box()
+    return SetBitmapIndexedNode_EMPTY.conj_inode(shift, hash1, val1, added_leaf) \
+                                     .conj_inode(shift, hash2, val2, added_leaf)
+
+def as_node(shift, val_or_node):
+    """Returns val_or_node as a child node of a node at the given shift."""
+    if val_or_node is None or isinstance(val_or_node, SetINode):
+        return val_or_node
+    return SetBitmapIndexedNode_EMPTY.conj_inode(shift + 5, rt.hash(val_or_node) & MASK_32, val_or_node, Box())
+
+def remove_at(array, i):
+    new_array = [None] * (len(array) - 1)
+    list_copy(array, 0, new_array, 0, i)
+    list_copy(array, i + 1, new_array, i, len(new_array) - i)
+    return new_array
+
+### structural set operations, see the hashmap versions in persistent_hash_map
+
+def node_slot(node, i):
+    if isinstance(node, SetArrayNode):
+        return node._array[i]
+    assert isinstance(node, SetBitmapIndexedNode)
+    bit = r_uint(1) << i
+    if node._bitmap & bit == 0:
+        return None
+    return node._array[node.index(bit)]
+
+def slot_count(val_or_node):
+    if isinstance(val_or_node, SetINode):
+        return val_or_node.count_inode()
+    return 1
+
+def slot_contains(shift, val_or_node, val):
+    if isinstance(val_or_node, SetINode):
+        return val_or_node.lookup(shift, rt.hash(val) & MASK_32, val) is not None
+    return rt.eq(val_or_node, val)
+
+def collect_elements(node, vals):
+    array = node._array
+    for x in range(len(array)):
+        val_or_node = array[x]
+        if isinstance(val_or_node, SetINode):
+            collect_elements(val_or_node, vals)
+        elif val_or_node is not None:
+            vals.append(val_or_node)
+
+def build_node(shift, vals, as_array):
+    n = 0
+    for i in range(32):
+        if vals[i] is not None:
+            n += 1
+
+    if n == 0:
+        return None
+
+    if as_array or n > 16:
+        nodes = [None] * 32
+        for i in range(32):
+            nodes[i] = as_node(shift, vals[i])
+        return SetArrayNode(n, nodes)
+
+    bitmap = r_uint(0)
+    array = [None] * n
+    j = 0
+    for i in range(32):
+        if vals[i] is not None:
+            bitmap |= r_uint(1) << i
+            array[j] = vals[i]
+            j += 1
+    return SetBitmapIndexedNode(bitmap, array)
+
+def conj_counted(shift, node, val, added):
+    added_leaf = Box()
+    node = node.conj_inode(shift, rt.hash(val) & MASK_32, val, added_leaf)
+    if added_leaf._val is not None:
+        added._val += 1
+    return node
+
+def union_nodes(shift, a, b, added):
+    if a is b:
+        return a
+
+    if isinstance(a, SetHashCollisionNode) or isinstance(b, SetHashCollisionNode):
+        vals = []
+        collect_elements(b, vals)
+        for x in range(len(vals)):
+            a = conj_counted(shift, a, vals[x], added)
+        return a
+
+    vals = [None] * 32
+    changed = False
+
+    for i in range(32):
+        a_val = node_slot(a, i)
+        b_val = node_slot(b, i)
+        val = a_val
+
+        if b_val is None:
+            pass
+        elif a_val is None:
+            val = b_val
+            added._val += slot_count(b_val)
+        elif isinstance(a_val, SetINode):
+            if isinstance(b_val, SetINode):
+                val = union_nodes(shift + 5, a_val, b_val, added)
+            else:
+                val = conj_counted(shift + 5, a_val, b_val, added)
+        elif isinstance(b_val, SetINode):
+            added_leaf = Box()
+            val = b_val.conj_inode(shift + 5, rt.hash(a_val) & MASK_32, a_val, added_leaf)
+            added._val += b_val.count_inode() - (0 if added_leaf._val is not None else 1)
+        elif not rt.eq(a_val, b_val):
+            val = create_node(shift + 5, a_val, rt.hash(b_val) & MASK_32, b_val)
+            added._val += 1
+
+        if val is not a_val:
+            changed = True
+        vals[i] = val
+
+    if not changed:
+        return a
+
+    return build_node(shift, vals, isinstance(a, SetArrayNode))
+
+def retain_by_lookup(shift, a, b_val, keep_shared, removed):
+    vals = []
+    collect_elements(a, vals)
+    node = a
+    for x in range(len(vals)):
+        val = vals[x]
+        if slot_contains(shift, b_val, val) != keep_shared:
+            node = node.without_inode(shift, rt.hash(val) & MASK_32, val)
+            removed._val += 1
+            if node is None:
+                break
+    return node
+
+def retain_nodes(shift, a, b, keep_shared, removed):
+    if a is b:
+        if keep_shared:
+            return a
+        removed._val += a.count_inode()
+        return None
+
+    if isinstance(a, SetHashCollisionNode) or isinstance(b, SetHashCollisionNode):
+        return retain_by_lookup(shift, a, b, keep_shared, removed)
+
+    vals = [None] * 32
+    changed = False
+
+    for i in range(32):
+        a_val = node_slot(a, i)
+        if a_val is None:
+            continue
+
+        b_val = node_slot(b, i)
+        val = a_val
+
+        if b_val is None:
+            if keep_shared:
+                removed._val += slot_count(a_val)
+                val = None
+        elif isinstance(a_val, SetINode):
+            if isinstance(b_val, SetINode):
+                val = retain_nodes(shift + 5, a_val, b_val, keep_shared, removed)
+            else:
+                val = retain_by_lookup(shift + 5, a_val, b_val, keep_shared, removed)
+        elif slot_contains(shift + 5, b_val, a_val) != keep_shared:
+            removed._val += 1
+            val = None
+
+        if val is not a_val:
+            changed = True
+        vals[i] = val
+
+    if not changed:
+        return a
+
+    return build_node(shift, vals, False)
+
+def all_contained(shift, a, b_val):
+    vals = []
+    collect_elements(a, vals)
+    for x in range(len(vals)):
+        if not slot_contains(shift, b_val, vals[x]):
+            return False
+    return True
+
+def subset_nodes(shift, a, b):
+    if a is b:
+        return True
+
+    if isinstance(a, SetHashCollisionNode) or isinstance(b, SetHashCollisionNode):
+        return all_contained(shift, a, b)
+
+    for i in range(32):
+        a_val = node_slot(a, i)
+        if a_val is None:
+            continue
+
+        b_val = node_slot(b, i)
+        if b_val is None:
+            return False
+
+        if isinstance(a_val, SetINode):
+            if isinstance(b_val, SetINode):
+                if not subset_nodes(shift + 5, a_val, b_val):
+                    return False
+            elif not all_contained(shift + 5, a_val, b_val):
+                return False
+        elif not slot_contains(shift + 5, b_val, a_val):
+            return False
+
+    return True
+
+### hook into RT
+
+EMPTY = PersistentHashSet(nil, 0, None)
 
 @as_var("set")
 def _create(coll):
@@ -49,17 +625,18 @@ def _create(coll):
 @extend(proto._count, PersistentHashSet)
 def _count(self):
     assert isinstance(self, PersistentHashSet)
-    return rt._count(self._map)
+    return rt.wrap(self._cnt)
 
 @extend(proto._val_at, PersistentHashSet)
 def _val_at(self, key, not_found):
     assert isinstance(self, PersistentHashSet)
-    return rt._val_at(self._map, key, not_found)
+    val = self.lookup(key)
+    return not_found if val is None else val
 
 @extend(proto._contains_key, PersistentHashSet)
 def _contains_key(self, key):
     assert isinstance(self, PersistentHashSet)
-    return rt._contains_key(self._map, key)
+    return true if self.lookup(key) is not None else false
 
 @extend(proto._eq, PersistentHashSet)
 def _eq(self, obj):
@@ -68,15 +645,9 @@ def _eq(self, obj):
         return true
     if not isinstance(obj, PersistentHashSet):
         return false
-    if self._map._cnt != obj._map._cnt:
+    if self._cnt != obj._cnt:
         return false
-
-    seq = rt.seq(obj)
-    while seq is not nil:
-        if rt._contains_key(self, rt.first(seq)) is false:
-            return false
-        seq = rt.next(seq)
-    return true
+    return true if obj.is_subset(self) else false
 
 @extend(proto._conj, PersistentHashSet)
 def _conj(self, v):
@@ -91,7 +662,12 @@ def _disj(self, v):
 @extend(proto._reduce, PersistentHashSet)
 def _reduce(self, f, init):
     assert isinstance(self, PersistentHashSet)
-    return rt._reduce(rt.keys(self._map), f, init)
+    if self._root is None:
+        return init
+    val = self._root.reduce_inode(f, init)
+    if rt.reduced_QMARK_(val):
+        return rt.deref(val)
+    return val
 
 @extend(proto._meta, PersistentHashSet)
 def _meta(self):
@@ -105,4 +681,37 @@ def _with_meta(self, meta):
 
 @extend(proto._iterator, PersistentHashSet)
 def _iterator(self):
+    assert isinstance(self, PersistentHashSet)
     return self.iter()
+
+def _check_sets(a, b):
+    affirm(isinstance(a, PersistentHashSet) and isinstance(b, PersistentHashSet),
+           u"Expected two hash sets")
+
+@as_var("pixie.set.internal", "union")
+def _union(a, b):
+    _check_sets(a, b)
+    assert isinstance(a, PersistentHashSet)
+    assert isinstance(b, PersistentHashSet)
+    return a.union(b)
+
+@as_var("pixie.set.internal", "intersection")
+def _intersection(a, b):
+    _check_sets(a, b)
+    assert isinstance(a, PersistentHashSet)
+    assert isinstance(b, PersistentHashSet)
+    return a.retain(b, True)
+
+@as_var("pixie.set.internal", "difference")
+def _difference(a, b):
+    _check_sets(a, b)
+    assert isinstance(a, PersistentHashSet)
+    assert isinstance(b, PersistentHashSet)
+    return a.retain(b, False)
+
+@as_var("pixie.set.internal", "subset")
+def _subset(a, b):
+    _check_sets(a, b)
+    assert isinstance(a, PersistentHashSet)
+    assert isinstance(b, PersistentHashSet)
+    return true if a.is_subset(b) else false
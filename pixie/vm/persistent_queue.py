@@ -0,0 +1,161 @@
+import pixie.vm.object as object
+from pixie.vm.primitives import nil, true, false
+import pixie.vm.stdlib as proto
+from pixie.vm.code import extend, as_var
+from pixie.vm.persistent_list import PersistentList
+import pixie.vm.persistent_vector as persistent_vector
+import rpython.rlib.jit as jit
+import pixie.vm.rt as rt
+
+
+class PersistentQueue(object.Object):
+    """A FIFO queue. Items are popped from the front seq and conj'ed onto the rear vector, once
+       the front runs out the rear becomes the new front. This makes conj, peek and pop amortized O(1)."""
+    _type = object.Type(u"pixie.stdlib.PersistentQueue")
+
+    def type(self):
+        return PersistentQueue._type
+
+    def __init__(self, meta, cnt, front, rear):
+        self._meta = meta
+        self._cnt = cnt
+        self._front = front
+        self._rear = rear
+
+    def conj(self, val):
+        if self._front is nil:
+            return PersistentQueue(self._meta, self._cnt + 1, PersistentList(val, nil, 1), self._rear)
+        return PersistentQueue(self._meta, self._cnt + 1, self._front, self._rear.conj(val))
+
+    def peek(self):
+        if self._front is nil:
+            return nil
+        return rt._first(self._front)
+
+    def pop(self):
+        if self._front is nil:
+            return self
+
+        front = rt._next(self._front)
+        rear = self._rear
+        if front is nil:
+            front = rt.seq(rear)
+            rear = persistent_vector.EMPTY
+
+        return PersistentQueue(self._meta, self._cnt - 1, front, rear)
+
+    def meta(self):
+        return self._meta
+
+    def with_meta(self, meta):
+        return PersistentQueue(meta, self._cnt, self._front, self._rear)
+
+
+class QueueSeq(object.Object):
+    _type = object.Type(u"pixie.stdlib.QueueSeq")
+
+    def type(self):
+        return QueueSeq._type
+
+    def __init__(self, front, rear):
+        self._front = front
+        self._rear = rear
+
+    def first(self):
+        return rt._first(self._front)
+
+    def next(self):
+        front = rt._next(self._front)
+        if front is nil:
+            return rt.seq(self._rear)
+        return QueueSeq(front, self._rear)
+
+
+EMPTY = PersistentQueue(nil, 0, nil, persistent_vector.EMPTY)
+
+@as_var("queue")
+def queue__args(args):
+    acc = EMPTY
+    for x in range(len(args)):
+        acc = acc.conj(args[x])
+    return acc
+
+@extend(proto._count, PersistentQueue)
+def _count(self):
+    assert isinstance(self, PersistentQueue)
+    return rt.wrap(self._cnt)
+
+@extend(proto._conj, PersistentQueue)
+def _conj(self, val):
+    assert isinstance(self, PersistentQueue)
+    return self.conj(val)
+
+@extend(proto._push, PersistentQueue)
+def _push(self, val):
+    assert isinstance(self, PersistentQueue)
+    return self.conj(val)
+
+@extend(proto._pop, PersistentQueue)
+def _pop(self):
+    assert isinstance(self, PersistentQueue)
+    return self.pop()
+
+@extend(proto._peek, PersistentQueue)
+def _peek(self):
+    assert isinstance(self, PersistentQueue)
+    return self.peek()
+
+@extend(proto._seq, PersistentQueue)
+def _seq(self):
+    assert isinstance(self, PersistentQueue)
+    if self._front is nil:
+        return nil
+    return QueueSeq(self._front, self._rear)
+
+@extend(proto._empty, PersistentQueue)
+def _empty(self):
+    assert isinstance(self, PersistentQueue)
+    return EMPTY.with_meta(self._meta)
+
+@extend(proto._meta, PersistentQueue)
+def _meta(self):
+    assert isinstance(self, PersistentQueue)
+    return self.meta()
+
+@extend(proto._with_meta, PersistentQueue)
+def _with_meta(self, meta):
+    assert isinstance(self, PersistentQueue)
+    return self.with_meta(meta)
+
+
+_reduce_driver = jit.JitDriver(name="pixie.stdlib.PersistentQueue_reduce",
+                               greens=["f"],
+                               reds="auto")
+
+@extend(proto._reduce, PersistentQueue)
+def _reduce(self, f, init):
+    assert isinstance(self, PersistentQueue)
+    s = self._front
+    while s is not nil:
+        _reduce_driver.jit_merge_point(f=f)
+        init = f.invoke([init, rt._first(s)])
+        if rt.reduced_QMARK_(init):
+            return rt.deref(init)
+        s = rt._next(s)
+    return rt._reduce(self._rear, f, init)
+
+
+@extend(proto._first, QueueSeq)
+def _first(self):
+    assert isinstance(self, QueueSeq)
+    return self.first()
+
+@extend(proto._next, QueueSeq)
+def _next(self):
+    assert isinstance(self, QueueSeq)
+    return self.next()
+
+@extend(proto._seq, QueueSeq)
+def _seq(self):
+    assert isinstance(self, QueueSeq)
+    return self
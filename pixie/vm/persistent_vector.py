@@ -495,6 +495,14 @@ def _pop(self):
     return self.pop()
 
 
+@extend(proto._peek, PersistentVector)
+def _peek(self):
+    assert isinstance(self, PersistentVector)
+    if self._cnt == 0:
+        return nil
+    return self.nth(self._cnt - 1)
+
+
 @extend(proto._assoc, PersistentVector)
 def _assoc(self, idx, val):
     assert isinstance(self, PersistentVector)
@@ -537,6 +545,29 @@ def _reduce(self, f, init):
     return init
 
 
+_reduce_kv_driver = jit.JitDriver(name="pixie.stdlib.PersistentVector_reduce_kv",
+                                  greens=["f"],
+                                  reds="auto")
+
+
+@extend(proto._reduce_kv, PersistentVector)
+def _reduce_kv(self, f, init):
+    assert isinstance(self, PersistentVector)
+    i = 0
+    while i < self._cnt:
+        array = self.array_for(i)
+        for j in range(len(array)):
+            _reduce_kv_driver.jit_merge_point(f=f)
+
+            init = f.invoke([init, rt.wrap(i + j), array[j]])
+            if rt.reduced_QMARK_(init):
+                return rt.deref(init)
+
+        step = len(array)
+        i += step
+    return init
+
+
 @as_var("vector")
 def vector__args(args):
     acc = rt._transient(EMPTY)
@@ -0,0 +1,419 @@
+py_object = object
+import pixie.vm.object as object
+from pixie.vm.object import affirm
+from pixie.vm.primitives import nil, true, false
+from pixie.vm.numbers import Integer, Float
+import pixie.vm.numbers as numbers
+from pixie.vm.keyword import keyword
+import pixie.vm.stdlib as proto
+from pixie.vm.code import extend, as_var, intern_var
+import rpython.rlib.jit as jit
+import pixie.vm.rt as rt
+
+## Persistent vectors that keep their elements unboxed. They use the same trie layout as
+## PersistentVector, but the leaves (and the tail) are RPython lists of machine ints, floats
+## or chars. Elements are only boxed when they leave the vector through nth, seq or reduce.
+
+ADD_VAR = intern_var(u"pixie.stdlib", u"+")
+
+
+def unbox_int(obj):
+    affirm(isinstance(obj, Integer), u"vector-of :int can only hold integers")
+    return obj.int_val()
+
+def unbox_double(obj):
+    if isinstance(obj, Integer):
+        return float(obj.int_val())
+    affirm(isinstance(obj, Float), u"vector-of :double can only hold numbers")
+    return obj.float_val()
+
+def unbox_byte(obj):
+    affirm(isinstance(obj, Integer), u"vector-of :byte can only hold integers")
+    v = obj.int_val()
+    affirm(0 <= v <= 255, u"vector-of :byte values must be between 0 and 255")
+    return chr(v)
+
+
+class PrimitiveVector(object.Object):
+    """Common base of the vector-of classes."""
+    def footprint(self, fp):
+        return 0
+
+
+class PrimitiveVectorNode(object.Object):
+    _type = object.Type(u"pixie.stdlib.PrimitiveVectorNode")
+
+    def type(self):
+        return PrimitiveVectorNode._type
+
+    def footprint(self, fp):
+        return 0
+
+
+def make_vector_of(type_name, kind, box, unbox, to_num, is_float, item_size):
+    """Creates a persistent vector class storing its elements unboxed. box/unbox convert between
+       Objects and the stored values, to_num converts a stored value to an int or float.
+       item_size is the number of bytes taken by one stored value."""
+
+    class TrieNode(PrimitiveVectorNode):
+        pass
+
+    class Leaf(TrieNode):
+        def __init__(self, values):
+            self._values = values
+
+        def footprint(self, fp):
+            return fp.object_size(1) + fp.array_size(len(self._values), item_size)
+
+    class Branch(TrieNode):
+        def __init__(self, children=None):
+            self._children = [None] * 32 if children is None else children
+
+        def footprint(self, fp):
+            for x in range(len(self._children)):
+                fp.push(self._children[x])
+            return fp.object_size(1) + fp.array_size(len(self._children))
+
+    EMPTY_BRANCH = Branch()
+
+    def do_assoc(level, node, idx, val):
+        if level == 0:
+            assert isinstance(node, Leaf)
+            values = node._values[:]
+            values[idx & 0x01f] = val
+            return Leaf(values)
+
+        assert isinstance(node, Branch)
+        ret = Branch(node._children[:])
+        subidx = (idx >> level) & 0x01f
+        ret._children[subidx] = do_assoc(level - 5, node._children[subidx], idx, val)
+        return ret
+
+    def new_path(level, node):
+        if level == 0:
+            return node
+        ret = Branch()
+        ret._children[0] = new_path(level - 5, node)
+        return ret
+
+    class VectorOf(PrimitiveVector):
+        _type = object.Type(type_name)
+
+        def type(self):
+            return VectorOf._type
+
+        def __init__(self, meta, cnt, shift, root, tail):
+            self._meta = meta
+            self._cnt = cnt
+            self._shift = shift
+            self._root = root
+            self._tail = tail
+
+        def meta(self):
+            return self._meta
+
+        def with_meta(self, meta):
+            return VectorOf(meta, self._cnt, self._shift, self._root, self._tail)
+
+        def tailoff(self):
+            if self._cnt < 32:
+                return 0
+            return ((self._cnt - 1) >> 5) << 5
+
+        def array_for(self, i):
+            affirm(0 <= i < self._cnt, u"Index out of Range")
+            if i >= self.tailoff():
+                return self._tail
+
+            node = self._root
+            level = self._shift
+            while level > 0:
+                assert isinstance(node, Branch)
+                node = node._children[(i >> level) & 0x01f]
+                level -= 5
+            assert isinstance(node, Leaf)
+            return node._values
+
+        def nth(self, i):
+            return self.array_for(i)[i & 0x01f]
+
+        def conj(self, val):
+            if self._cnt - self.tailoff() < 32:
+                new_tail = self._tail[:]
+                new_tail.append(val)
+                return VectorOf(self._meta, self._cnt + 1, self._shift, self._root, new_tail)
+
+            tail_node = Leaf(self._tail)
+            new_shift = self._shift
+
+            if (self._cnt >> 5) > (1 << self._shift):
+                new_root = Branch()
+                new_root._children[0] = self._root
+                new_root._children[1] = new_path(self._shift, tail_node)
+                new_shift += 5
+            else:
+                new_root = self.push_tail(self._shift, self._root, tail_node)
+
+            return VectorOf(self._meta, self._cnt + 1, new_shift, new_root, [val])
+
+        def push_tail(self, level, parent, tail_node):
+            subidx = ((self._cnt - 1) >> level) & 0x01f
+            assert isinstance(parent, Branch)
+            ret = Branch(parent._children[:])
+
+            if level == 5:
+                node_to_insert = tail_node
+            else:
+                child = parent._children[subidx]
+                if child is not None:
+                    node_to_insert = self.push_tail(level - 5, child, tail_node)
+                else:
+                    node_to_insert = new_path(level - 5, tail_node)
+
+            ret._children[subidx] = node_to_insert
+            return ret
+
+        def pop(self):
+            affirm(self._cnt != 0, u"Can't pop an empty vector")
+
+            if self._cnt == 1:
+                return VectorOf(self._meta, 0, 5, EMPTY_BRANCH, [])
+
+            if self._cnt - self.tailoff() > 1:
+                size = len(self._tail) - 1
+                assert size >= 0  # for translation
+                return VectorOf(self._meta, self._cnt - 1, self._shift, self._root, self._tail[:size])
+
+            new_tail = self.array_for(self._cnt - 2)
+
+            new_root = self.pop_tail(self._shift, self._root)
+            new_shift = self._shift
+            if new_root is None:
+                new_root = EMPTY_BRANCH
+
+            if self._shift > 5 and new_root._children[1] is None:
+                child = new_root._children[0]
+                assert isinstance(child, Branch)
+                new_root = child
+                new_shift -= 5
+
+            return VectorOf(self._meta, self._cnt - 1, new_shift, new_root, new_tail)
+
+        def pop_tail(self, level, node):
+            sub_idx = ((self._cnt - 2) >> level) & 0x01f
+            assert isinstance(node, Branch)
+            if level > 5:
+                new_child = self.pop_tail(level - 5, node._children[sub_idx])
+                if new_child is None and sub_idx == 0:
+                    return None
+                ret = Branch(node._children[:])
+                ret._children[sub_idx] = new_child
+                return ret
+
+            elif sub_idx == 0:
+                return None
+
+            ret = Branch(node._children[:])
+            ret._children[sub_idx] = None
+            return ret
+
+        def assoc_at(self, idx, val):
+            if 0 <= idx < self._cnt:
+                if idx >= self.tailoff():
+                    new_tail = self._tail[:]
+                    new_tail[idx & 0x01f] = val
+                    return VectorOf(self._meta, self._cnt, self._shift, self._root, new_tail)
+                return VectorOf(self._meta, self._cnt, self._shift,
+                                do_assoc(self._shift, self._root, idx, val), self._tail)
+            affirm(idx == self._cnt, u"Index out of Range")
+            return self.conj(val)
+
+        def footprint(self, fp):
+            fp.push(self._meta)
+            fp.push(self._root)
+            return fp.object_size(5) + fp.array_size(len(self._tail), item_size)
+
+        def reduce(self, f, init):
+            i = 0
+            while i < self._cnt:
+                array = self.array_for(i)
+                for j in range(len(array)):
+                    reduce_driver.jit_merge_point(f=f)
+                    init = f.invoke([init, box(array[j])])
+                    if rt.reduced_QMARK_(init):
+                        return rt.deref(init)
+                i += len(array)
+            return init
+
+        def sum(self, init):
+            """Adds the elements without boxing them, returns None if init isn't a plain number."""
+            if isinstance(init, Integer) and not is_float:
+                acc = init.int_val()
+                i = 0
+                while i < self._cnt:
+                    array = self.array_for(i)
+                    for j in range(len(array)):
+                        sum_driver.jit_merge_point()
+                        acc += int(to_num(array[j]))
+                    i += len(array)
+                return rt.wrap(acc)
+
+            if isinstance(init, Integer) or isinstance(init, Float):
+                if isinstance(init, Integer):
+                    facc = float(init.int_val())
+                else:
+                    assert isinstance(init, Float)
+                    facc = init.float_val()
+                i = 0
+                while i < self._cnt:
+                    array = self.array_for(i)
+                    for j in range(len(array)):
+                        float_sum_driver.jit_merge_point()
+                        facc += float(to_num(array[j]))
+                    i += len(array)
+                return rt.wrap(facc)
+
+            return None
+
+    reduce_driver = jit.JitDriver(name=type_name.encode("utf-8") + "_reduce",
+                                  greens=["f"],
+                                  reds="auto")
+    sum_driver = jit.JitDriver(name=type_name.encode("utf-8") + "_sum",
+                               greens=[],
+                               reds="auto")
+    float_sum_driver = jit.JitDriver(name=type_name.encode("utf-8") + "_float_sum",
+                                     greens=[],
+                                     reds="auto")
+
+    VectorOf.__name__ = "VectorOf_" + kind
+    VectorOf.EMPTY = VectorOf(nil, 0, 5, EMPTY_BRANCH, [])
+
+    @extend(proto._count, VectorOf)
+    def _count(self):
+        assert isinstance(self, VectorOf)
+        return rt.wrap(self._cnt)
+
+    @extend(proto._nth, VectorOf)
+    def _nth(self, idx):
+        assert isinstance(self, VectorOf)
+        return box(self.nth(idx.int_val()))
+
+    @extend(proto._nth_not_found, VectorOf)
+    def _nth_not_found(self, idx, not_found):
+        assert isinstance(self, VectorOf)
+        i = idx.int_val()
+        if 0 <= i < self._cnt:
+            return box(self.nth(i))
+        return not_found
+
+    @extend(proto._val_at, VectorOf)
+    def _val_at(self, key, not_found):
+        assert isinstance(self, VectorOf)
+        if isinstance(key, Integer) and 0 <= key.int_val() < self._cnt:
+            return box(self.nth(key.int_val()))
+        return not_found
+
+    @extend(proto._contains_key, VectorOf)
+    def _contains_key(self, key):
+        assert isinstance(self, VectorOf)
+        if not isinstance(key, Integer):
+            return false
+        return true if 0 <= key.int_val() < self._cnt else false
+
+    @extend(proto._conj, VectorOf)
+    def _conj(self, val):
+        assert isinstance(self, VectorOf)
+        return self.conj(unbox(val))
+
+    @extend(proto._push, VectorOf)
+    def _push(self, val):
+        assert isinstance(self, VectorOf)
+        return self.conj(unbox(val))
+
+    @extend(proto._pop, VectorOf)
+    def _pop(self):
+        assert isinstance(self, VectorOf)
+        return self.pop()
+
+    @extend(proto._peek, VectorOf)
+    def _peek(self):
+        assert isinstance(self, VectorOf)
+        if self._cnt == 0:
+            return nil
+        return box(self.nth(self._cnt - 1))
+
+    @extend(proto._assoc, VectorOf)
+    def _assoc(self, idx, val):
+        assert isinstance(self, VectorOf)
+        affirm(isinstance(idx, Integer), u"key must be an integer")
+        return self.assoc_at(idx.int_val(), unbox(val))
+
+    @extend(proto._empty, VectorOf)
+    def _empty(self):
+        assert isinstance(self, VectorOf)
+        return VectorOf.EMPTY.with_meta(self._meta)
+
+    @extend(proto._meta, VectorOf)
+    def _meta(self):
+        assert isinstance(self, VectorOf)
+        return self.meta()
+
+    @extend(proto._with_meta, VectorOf)
+    def _with_meta(self, meta):
+        assert isinstance(self, VectorOf)
+        return self.with_meta(meta)
+
+    @extend(proto._reduce, VectorOf)
+    def _reduce(self, f, init):
+        assert isinstance(self, VectorOf)
+        if self._cnt > 0 and (f is numbers._add or (ADD_VAR.is_defined() and f is ADD_VAR.deref())):
+            result = self.sum(init)
+            if result is not None:
+                return result
+        return self.reduce(f, init)
+
+    @extend(proto._reduce_kv, VectorOf)
+    def _reduce_kv(self, f, init):
+        assert isinstance(self, VectorOf)
+        for i in range(self._cnt):
+            init = f.invoke([init, rt.wrap(i), box(self.nth(i))])
+            if rt.reduced_QMARK_(init):
+                return rt.deref(init)
+        return init
+
+    proto.IVector.add_satisfies(VectorOf._type)
+
+    return VectorOf
+
+
+IntVector = make_vector_of(u"pixie.stdlib.IntVector", "int",
+                           lambda v: rt.wrap(v), unbox_int, lambda v: v, False, 8)
+DoubleVector = make_vector_of(u"pixie.stdlib.DoubleVector", "double",
+                              lambda v: rt.wrap(v), unbox_double, lambda v: v, True, 8)
+ByteVector = make_vector_of(u"pixie.stdlib.ByteVector", "byte",
+                            lambda v: rt.wrap(ord(v)), unbox_byte, lambda v: ord(v), False, 1)
+
+KW_INT = keyword(u"int")
+KW_DOUBLE = keyword(u"double")
+KW_BYTE = keyword(u"byte")
+
+@as_var("vector-of")
+def vector_of__args(args):
+    affirm(len(args) > 0, u"vector-of requires a type keyword")
+    tp = args[0]
+    if tp is KW_INT:
+        acc = IntVector.EMPTY
+        for x in range(1, len(args)):
+            acc = acc.conj(unbox_int(args[x]))
+        return acc
+    if tp is KW_DOUBLE:
+        acc = DoubleVector.EMPTY
+        for x in range(1, len(args)):
+            acc = acc.conj(unbox_double(args[x]))
+        return acc
+    if tp is KW_BYTE:
+        acc = ByteVector.EMPTY
+        for x in range(1, len(args)):
+            acc = acc.conj(unbox_byte(args[x]))
+        return acc
+    affirm(False, u"vector-of expects :int, :double or :byte")
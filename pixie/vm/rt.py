@@ -61,6 +61,8 @@ def init():
     import pixie.vm.persistent_list
     import pixie.vm.persistent_hash_map
     import pixie.vm.persistent_hash_set
+    import pixie.vm.persistent_queue
+    import pixie.vm.primitive_vector
     import pixie.vm.custom_types
     import pixie.vm.map_entry
     import pixie.vm.libs.platform
@@ -68,6 +70,13 @@ def init():
     import pixie.vm.symbol
     import pixie.vm.libs.path
     import pixie.vm.libs.string
+    import pixie.vm.libs.ring_buffer
+    import pixie.vm.libs.footprint
+    import pixie.vm.libs.buffer_pool
+    import pixie.vm.libs.mapped_file
+    import pixie.vm.libs.ns_tracking
+    import pixie.vm.libs.typed_array
+    import pixie.vm.libs.stdio
     import pixie.vm.threads
     import pixie.vm.string_builder
     import pixie.vm.stacklet
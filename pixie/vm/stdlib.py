@@ -25,7 +25,11 @@ defprotocol("pixie.stdlib", "IEmpty", ["-empty"])
 defprotocol("pixie.stdlib", "IObject", ["-hash", "-eq", "-str", "-repr"])
 _eq.set_default_fn(wrap_fn(lambda a, b: false))
 
+defprotocol("pixie.stdlib", "IPrintWriter", ["-write-str"])
+defprotocol("pixie.stdlib", "IPrintable", ["-print-str", "-print-repr"])
+
 defprotocol("pixie.stdlib", "IReduce", ["-reduce"])
+defprotocol("pixie.stdlib", "IKVReduce", ["-reduce-kv"])
 
 defprotocol("pixie.stdlib", "IDeref", ["-deref"])
 
@@ -39,7 +43,7 @@ defprotocol("pixie.stdlib", "ILookup", ["-val-at"])
 
 defprotocol("pixie.stdlib", "IMapEntry", ["-key", "-val"])
 
-defprotocol("pixie.stdlib", "IStack", ["-push", "-pop"])
+defprotocol("pixie.stdlib", "IStack", ["-push", "-pop", "-peek"])
 
 defprotocol("pixie.stdlib", "IFn", ["-invoke"])
 
@@ -110,8 +114,16 @@ def default_str(x):
 def default_hash(x):
     return x.hash()
 
+def default_print_str(x, w):
+    return _write_str.invoke([w, _str.invoke([x])])
+
+def default_print_repr(x, w):
+    return _write_str.invoke([w, _repr.invoke([x])])
+
 _str.set_default_fn(wrap_fn(default_str))
 _repr.set_default_fn(wrap_fn(default_str))
+_print_str.set_default_fn(wrap_fn(default_print_str))
+_print_repr.set_default_fn(wrap_fn(default_print_repr))
 _hash.set_default_fn(wrap_fn(default_hash))
 
 _meta.set_default_fn(wrap_fn(lambda x: nil))
@@ -205,6 +217,10 @@ def __assoc(_, k, v):
 def __reduce(self, f, init):
     return init
 
+@extend(_reduce_kv, nil._type)
+def __reduce_kv(self, f, init):
+    return init
+
 @extend(_val_at, nil._type)
 def __val_at(x, k, not_found):
     return not_found
@@ -373,12 +389,18 @@ def is_undefined(var):
 def load_ns(filename):
     import pixie.vm.string as string
     import pixie.vm.symbol as symbol
+    import pixie.vm.compiler as compiler
+    import pixie.vm.libs.ns_tracking as ns_tracking
     import os.path as path
 
     if isinstance(filename, symbol.Symbol):
         affirm(rt.namespace(filename) is None, u"load-file takes a un-namespaced symbol")
         filename_str = rt.name(filename).replace(u".", u"/") + u".pxi"
 
+        current_ns = compiler.NS_VAR.deref()
+        if isinstance(current_ns, code.Namespace):
+            ns_tracking.tracker.record_require(current_ns._name, rt.name(filename))
+
         loaded_ns = code._ns_registry.get(rt.name(filename), None)
         if loaded_ns is not None:
             return loaded_ns
@@ -399,6 +421,8 @@ def load_ns(filename):
     if f is None:
         affirm(False, u"File '" + rt.name(filename) + u"' does not exist in any directory found in load-paths")
     else:
+        if isinstance(filename, symbol.Symbol):
+            ns_tracking.tracker.record_file(rt.name(filename), unicode(path.abspath(f)))
         rt.load_file(rt.wrap(f))
     return nil
 
@@ -463,15 +487,18 @@ def load_pxic_file(filename):
     from pixie.vm.libs.pxic.reader import Reader, read_obj
     from pixie.vm.reader import eof
     import pixie.vm.compiler as compiler
+    from pixie.vm.libs.stdio import flush_all
     import sys
 
     if not we_are_translated():
+        flush_all()
         print "Loading precompiled file while interpreted, this may take time"
     with compiler.with_ns(u"user"):
         compiler.NS_VAR.deref().include_stdlib()
         rdr = Reader(f)
         while True:
             if not we_are_translated():
+                flush_all()
                 sys.stdout.write(".")
                 sys.stdout.flush()
             o = read_obj(rdr)
@@ -480,6 +507,7 @@ def load_pxic_file(filename):
             o.invoke([])
 
     if not we_are_translated():
+        flush_all()
         print "done"
 
 
@@ -487,9 +515,11 @@ def load_pxic_file(filename):
 def load_reader(rdr):
     import pixie.vm.reader as reader
     import pixie.vm.compiler as compiler
+    from pixie.vm.libs.stdio import flush_all
     import sys
 
     if not we_are_translated():
+        flush_all()
         print "Loading file while interpreted, this may take time"
 
     val = PXIC_WRITER.deref()
@@ -502,6 +532,7 @@ def load_reader(rdr):
         compiler.NS_VAR.deref().include_stdlib()
         while True:
             if not we_are_translated():
+                flush_all()
                 sys.stdout.write(".")
                 sys.stdout.flush()
             form = reader.read(rdr, False)
@@ -515,6 +546,7 @@ def load_reader(rdr):
             compiled.invoke([])
 
     if not we_are_translated():
+        flush_all()
         print "done"
 
     return nil
@@ -666,6 +698,8 @@ def _try_catch(main_fn, catch_fn, final):
             from pixie.vm.string import String
             if isinstance(ex, Exception):
                 if not we_are_translated():
+                    from pixie.vm.libs.stdio import flush_all
+                    flush_all()
                     print "Python Error Info: ", ex.__dict__, ex
                     raise
                 ex = RuntimeException(rt.wrap(u"Some error"))
@@ -765,14 +799,29 @@ def _ici(meta):
 def merge_fn(acc, x):
     return rt._assoc(acc, rt._key(x), rt._val(x))
 
+@wrap_fn
+def merge_kv_fn(acc, k, v):
+    return rt._assoc(acc, k, v)
+
 
 @as_var("merge")
 @jit.unroll_safe
 def _merge__args(args):
+    from pixie.vm.persistent_hash_map import PersistentHashMap
     affirm(len(args) > 0, u"Merge takes at least one arg")
     acc = args[0]
     for x in range(1, len(args)):
-        acc = rt._reduce(args[x], merge_fn, acc)
+        m = args[x]
+        if isinstance(acc, PersistentHashMap) and isinstance(m, PersistentHashMap):
+            acc = acc.merge(m, None)
+        elif rt.satisfies_QMARK_(IVector, m):
+            # a [k v] pair is added as one entry, as conj does
+            affirm(rt.count(m) == 2, u"Vector arguments to merge must be [k v] pairs")
+            acc = rt._assoc(acc, rt.nth(m, rt.wrap(0)), rt.nth(m, rt.wrap(1)))
+        elif rt.satisfies_QMARK_(IKVReduce, m):
+            acc = rt._reduce_kv(m, merge_kv_fn, acc)
+        else:
+            acc = rt._reduce(m, merge_fn, acc)
     return acc
 
 
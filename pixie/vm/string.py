@@ -6,6 +6,10 @@ from pixie.vm.numbers import Integer, _add
 import pixie.vm.stdlib as proto
 import pixie.vm.util as util
 from rpython.rlib.rarithmetic import intmask, r_uint
+from rpython.rlib import rgc
+from rpython.rlib.runicode import str_decode_utf_8
+from rpython.rlib.rstring import UnicodeBuilder
+from rpython.rtyper.lltypesystem import rffi, lltype
 from pixie.vm.libs.pxic.util import add_marshall_handlers
 
 class String(Object):
@@ -17,32 +21,155 @@ class String(Object):
     def __init__(self, s):
         #assert isinstance(s, unicode)
         self._str = s
+        self._utf8 = None
+
+    def utf8_bytes(self):
+        """Returns the UTF-8 encoding of the string as Bytes, encoded the first time it is
+           asked for, usually when the string is passed to C, and kept from then on."""
+        b = self._utf8
+        if b is None:
+            b = Bytes(util.unicode_to_utf8(self._str))
+            self._utf8 = b
+        return b
+
+
+class Bytes(Object):
+    """An immutable byte string, followed by a NUL, in memory outside the GC heap. C functions
+       taking a char* are handed a pointer to it without copying."""
+    _type = Type(u"pixie.stdlib.Bytes")
+    _immutable_fields_ = ["_raw", "_len"]
+
+    def type(self):
+        return Bytes._type
+
+    def __init__(self, s):
+        self._len = len(s)
+        self._raw = rffi.str2charp(s)
+        # the copy is only freed when this object is collected, make the GC count it
+        rgc.add_memory_pressure(self._len + 1)
+
+    @rgc.must_be_light_finalizer
+    def __del__(self):
+        rffi.free_charp(self._raw)
+
+    def raw(self):
+        return self._raw
+
+    def count(self):
+        return self._len
+
+    def as_str(self):
+        return rffi.charpsize2str(self._raw, self._len)
+
+    def nth_byte(self, idx):
+        return ord(self._raw[idx])
+
+    def decode_lenient(self):
+        s = self.as_str()
+        res, _ = str_decode_utf_8(s, len(s), 'replace')
+        return res
+
+
+@as_var("bytes")
+def bytes(x):
+    """(bytes x)
+       Returns the UTF-8 encoding of the string x, or the used bytes of the buffer x, as Bytes.
+       The encoding of a string is kept with it, so asking again allocates nothing."""
+    from pixie.vm.libs.ffi import Buffer
+    if isinstance(x, Bytes):
+        return x
+    if isinstance(x, String):
+        return x.utf8_bytes()
+    if isinstance(x, Buffer):
+        return Bytes(rffi.charpsize2str(x.buffer(), x.count()))
+    affirm(False, u"bytes expects a String, a Buffer or Bytes")
+
+@as_var("bytes->string")
+def bytes_to_string(b):
+    """(bytes->string b)
+       Decodes the Bytes b as UTF-8."""
+    affirm(isinstance(b, Bytes), u"Expected Bytes")
+    assert isinstance(b, Bytes)
+    return rt.wrap(util.unicode_from_utf8(b.as_str()))
+
+@extend(proto._count, Bytes)
+def _bytes_count(self):
+    assert isinstance(self, Bytes)
+    return rt.wrap(self.count())
+
+@extend(proto._nth, Bytes)
+def _bytes_nth(self, idx):
+    assert isinstance(self, Bytes)
+    i = idx.int_val()
+    affirm(0 <= i < self.count(), u"Index out of Range")
+    return rt.wrap(self.nth_byte(i))
+
+@extend(proto._nth_not_found, Bytes)
+def _bytes_nth_not_found(self, idx, not_found):
+    assert isinstance(self, Bytes)
+    i = idx.int_val()
+    if 0 <= i < self.count():
+        return rt.wrap(self.nth_byte(i))
+    return not_found
+
+@extend(proto._eq, Bytes)
+def _bytes_eq(self, v):
+    assert isinstance(self, Bytes)
+    if not isinstance(v, Bytes):
+        return false
+    return true if self.as_str() == v.as_str() else false
+
+@extend(proto._hash, Bytes)
+def _bytes_hash(self):
+    assert isinstance(self, Bytes)
+    return rt.wrap(intmask(util.hash_unencoded_chars(self.decode_lenient())))
+
+@extend(proto._str, Bytes)
+def _bytes_str(self):
+    assert isinstance(self, Bytes)
+    return rt.wrap(self.decode_lenient())
+
+@extend(proto._repr, Bytes)
+def _bytes_repr(self):
+    assert isinstance(self, Bytes)
+    return rt.wrap(u"(bytes " + rt.name(proto._repr.invoke([String(self.decode_lenient())])) + u")")
 
 
 @extend(proto._str, String)
 def _str(x):
     return x
 
+def escape_char(c):
+    if c == u"\"":
+        return u"\\\""
+    elif c == u"\n":
+        return u"\\n"
+    elif c == u"\t":
+        return u"\\t"
+    elif c == u"\b":
+        return u"\\b"
+    elif c == u"\f":
+        return u"\\f"
+    elif c == u"\r":
+        return u"\\r"
+    return None
+
 @extend(proto._repr, String)
 def _repr(self):
-    res = u""
     assert isinstance(self, String)
-    for c in self._str:
-        if c == "\"":
-            res += u"\\\""
-        elif c == "\n":
-            res += u"\\n"
-        elif c == "\t":
-            res += u"\\t"
-        elif c == "\b":
-            res += u"\\b"
-        elif c == "\f":
-            res += u"\\f"
-        elif c == "\r":
-            res += u"\\r"
-        else:
-            res += c
-    return rt.wrap(u"\"" + res + u"\"")
+    s = self._str
+    b = UnicodeBuilder(len(s) + 2)
+    b.append(u"\"")
+    start = 0
+    for i in range(len(s)):
+        escaped = escape_char(s[i])
+        if escaped is not None:
+            b.append_slice(s, start, i)
+            b.append(escaped)
+            start = i + 1
+    b.append_slice(s, start, len(s))
+    b.append(u"\"")
+    return rt.wrap(b.build())
 
 @extend(proto._count, String)
 def _count(self):
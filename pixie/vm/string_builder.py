@@ -1,5 +1,6 @@
 import pixie.vm.rt as rt
-from pixie.vm.object import Object, Type
+from pixie.vm.object import Object, Type, affirm
+from pixie.vm.string import String
 from pixie.vm.code import as_var, extend
 import pixie.vm.stdlib as proto
 
@@ -28,6 +29,13 @@ def _conj(self, val):
 def _persistent(self):
     return rt._str(self)
 
+@extend(proto._write_str, StringBuilder)
+def _write_str(self, s):
+    assert isinstance(self, StringBuilder)
+    affirm(isinstance(s, String), u"Only Strings can be written to a StringBuilder")
+    self.add_str(rt.name(s))
+    return self
+
 @extend(proto._str, StringBuilder)
 def _str(self):
     return rt.wrap(self.to_string())
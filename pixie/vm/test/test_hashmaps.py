@@ -1,5 +1,7 @@
 import pixie.vm.rt as rt
 from pixie.vm.primitives import nil
+from pixie.vm.keyword import keyword
+from pixie.vm.persistent_hash_map import EMPTY, ArrayNode, BitmapIndexedNode
 
 rt.init()
 
@@ -10,3 +12,53 @@ def test_hashmap_create():
     val = rt._val_at(acc, rt.wrap(1), nil)
 
     assert val.int_val() == 2
+
+def keywords(n):
+    return [keyword(u"k" + unicode(str(x))) for x in range(n)]
+
+def hashmap_of(keys):
+    acc = EMPTY
+    for k in keys:
+        acc = acc.assoc(k, k)
+    return acc
+
+def assert_no_empty_nodes(node):
+    if isinstance(node, ArrayNode):
+        for child in node._array:
+            if child is not None:
+                assert_no_empty_nodes(child)
+    elif isinstance(node, BitmapIndexedNode):
+        assert node._bitmap != 0
+        for x in range(0, len(node._array), 2):
+            if node._array[x] is None:
+                assert_no_empty_nodes(node._array[x + 1])
+
+def test_hashmap_without_last_key_drops_node():
+    ks = keywords(40)
+    acc = hashmap_of(ks[:1]).without(ks[0])
+
+    assert acc._cnt == 0
+    assert acc._root is None
+
+    acc = hashmap_of(ks)
+    for k in ks[1:]:
+        acc = acc.without(k)
+        assert_no_empty_nodes(acc._root)
+    assert acc._cnt == 1
+
+def test_hashmap_retain_drops_emptied_nodes():
+    ks = keywords(40)
+    a = hashmap_of(ks)
+
+    acc = a.retain(hashmap_of(ks[1:]), False)
+    assert acc._cnt == 1
+    assert acc.val_at(ks[0], nil) is ks[0]
+    assert_no_empty_nodes(acc._root)
+
+    acc = a.retain(hashmap_of(ks[:1]), True)
+    assert acc._cnt == 1
+    assert_no_empty_nodes(acc._root)
+
+    acc = acc.retain(hashmap_of(ks[:1]), False)
+    assert acc._cnt == 0
+    assert acc._root is None
@@ -0,0 +1,50 @@
+import os
+from pixie.vm.libs.stdio import StdWriter, MODE_NONE, MODE_LINE, MODE_FULL
+
+
+def read_available(fd):
+    os.write(fd[1], "|")
+    data = os.read(fd[0], 65536)
+    assert data.endswith("|")
+    return data[:-1]
+
+def test_full_buffering_holds_until_flush():
+    fd = os.pipe()
+    w = StdWriter(fd[1], MODE_FULL)
+    w.write("one\n")
+    w.write("two")
+    assert read_available(fd) == ""
+    w.flush()
+    assert read_available(fd) == "one\ntwo"
+    w.flush()
+    assert read_available(fd) == ""
+
+def test_full_buffering_writes_at_capacity():
+    fd = os.pipe()
+    w = StdWriter(fd[1], MODE_FULL)
+    w.set_mode(MODE_FULL, 8)
+    w.write("1234")
+    assert read_available(fd) == ""
+    w.write("5678")
+    assert read_available(fd) == "12345678"
+
+def test_line_buffering_writes_on_newline():
+    fd = os.pipe()
+    w = StdWriter(fd[1], MODE_LINE)
+    w.write("partial")
+    assert read_available(fd) == ""
+    w.write(" line\nrest")
+    assert read_available(fd) == "partial line\nrest"
+
+def test_unbuffered_writes_right_away():
+    fd = os.pipe()
+    w = StdWriter(fd[1], MODE_NONE)
+    w.write("a")
+    assert read_available(fd) == "a"
+
+def test_set_mode_flushes_pending():
+    fd = os.pipe()
+    w = StdWriter(fd[1], MODE_FULL)
+    w.write("held")
+    w.set_mode(MODE_LINE, 8192)
+    assert read_available(fd) == "held"
@@ -12,6 +12,7 @@ from pixie.vm.primitives import nil
 from pixie.vm.atom import Atom
 from pixie.vm.persistent_vector import EMPTY as EMPTY_VECTOR
 from pixie.vm.util import unicode_from_utf8, unicode_to_utf8
+import pixie.vm.libs.stdio as stdio
 import sys
 import os
 import os.path as path
@@ -40,6 +41,9 @@ LOAD_PATHS = intern_var(u"pixie.stdlib", u"load-paths")
 LOAD_PATHS.set_root(nil)
 load_path = Var(u"pixie.stdlib", u"internal-load-path")
 
+FFI_CACHE = intern_var(u"pixie.ffi-infer", u"*cache-dir*")
+FFI_CACHE.set_root(nil)
+
 STAR_1 = intern_var(u"pixie.stdlib", u"*1")
 STAR_1.set_root(nil)
 STAR_2 = intern_var(u"pixie.stdlib", u"*2")
@@ -152,6 +156,7 @@ class BatchModeFn(NativeFn):
 
                 rt.load_reader(StringReader(unicode_from_utf8(data)))
             except WrappedException as ex:
+                stdio.flush_all()
                 print "Error: ", ex._ex.__repr__()
                 os._exit(1)
 
@@ -207,6 +212,13 @@ def load_stdlib():
 from pixie.vm.code import intern_var
 run_with_stacklets = intern_var(u"pixie.stacklets", u"run-with-stacklets")
 
+def run_main(fn):
+    try:
+        run_with_stacklets.invoke([fn])
+    finally:
+        # *out* and *err* hold on to output until a newline or a full buffer
+        stdio.flush_all()
+
 def entry_point(args):
     try:
         import pixie.vm.stacklet
@@ -217,6 +229,8 @@ def entry_point(args):
         script_args = []
 
         init_load_path(args[0])
+        # the stdlib loads pixie.uv, which needs the cache before the other options are read
+        init_ffi_cache(args)
         load_stdlib()
         add_to_load_paths(".")
 
@@ -235,12 +249,13 @@ def entry_point(args):
                     print "  -e, --eval=<expr>      evaluate the given expression"
                     print "  -l, --load-path=<path> add <path> to pixie.stdlib/load-paths"
                     print "  -c, --compile=<file>   compile <path> to a .pxic file"
+                    print "  --ffi-cache=<dir>      cache ffi-infer results in <dir>"
                     return 0
                 elif arg == '-e' or arg == '--eval':
                     i += 1
                     if i < len(args):
                         expr = args[i]
-                        run_with_stacklets.invoke([EvalFn(expr)])
+                        run_main(EvalFn(expr))
                         return 0
                     else:
                         print "Expected argument for " + arg
@@ -259,11 +274,17 @@ def entry_point(args):
                     if i < len(args):
                         path = args[i]
                         print "Compiling ", path
-                        run_with_stacklets.invoke([CompileFileFn(path)])
+                        run_main(CompileFileFn(path))
                         exit = True
                     else:
                         print "Expected argument for " + arg
                         return 1
+                elif arg == "--ffi-cache":
+                    # already applied by init_ffi_cache
+                    i += 1
+                    if i >= len(args):
+                        print "Expected argument for " + arg
+                        return 1
                 else:
                     print "Unknown option " + arg
                     return 1
@@ -276,14 +297,28 @@ def entry_point(args):
 
         if not exit:
             if interactive:
-                run_with_stacklets.invoke([ReplFn(args)])
+                run_main(ReplFn(args))
             else:
-                run_with_stacklets.invoke([BatchModeFn(script_args)])
+                run_main(BatchModeFn(script_args))
     except WrappedException as we:
         print we._ex.__repr__()
 
     return 0
 
+OPTIONS_WITH_ARGUMENT = ["-e", "--eval", "-l", "--load-path", "-c", "--compile", "--ffi-cache"]
+
+def init_ffi_cache(args):
+    i = 1
+    while i < len(args):
+        arg = args[i]
+        if not arg.startswith('-') or arg == '-':
+            break
+        if arg == "--ffi-cache" and i + 1 < len(args):
+            FFI_CACHE.set_root(rt.wrap(args[i + 1]))
+        if arg in OPTIONS_WITH_ARGUMENT:
+            i += 1
+        i += 1
+
 def add_to_load_paths(path):
     rt.reset_BANG_(LOAD_PATHS.deref(), rt.conj(rt.deref(LOAD_PATHS.deref()), rt.wrap(path)))
 
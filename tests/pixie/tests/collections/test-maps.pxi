@@ -53,3 +53,38 @@
 
     ;; Should conj sequences of MapEntries
     (t/assert= (conj {} (seq {:a 1 :b 2 :c 3})) {:a 1 :b 2 :c 3})))
+
+(t/deftest map-reduce-kv
+  (let [m {:a 1, :b 2, :c 3}]
+    (t/assert= (reduce-kv (fn [acc k v] (+ acc v)) 0 m) 6)
+    (t/assert= (reduce-kv (fn [acc k v] (assoc acc v k)) {} m) {1 :a, 2 :b, 3 :c})
+    (t/assert= (reduce-kv (fn [acc k v] (reduced k)) nil {:a 1}) :a)
+    (t/assert= (reduce-kv (fn [acc k v] (conj acc [k v])) [] [:x :y]) [[0 :x] [1 :y]])
+    (t/assert= (reduce-kv (fn [acc k v] (inc acc)) 0 nil) 0)))
+
+(t/deftest map-keys-vals-merge
+  (let [m {:a 1, :b 2, :c 3}]
+    (t/assert= (set (keys m)) #{:a :b :c})
+    (t/assert= (set (vals m)) #{1 2 3})
+    (t/assert= (keys (seq m)) (keys m))
+    (t/assert= (keys [(first {:a 1}) (first {:b 2})]) [:a :b])
+    (t/assert= (vals [(first {:a 1}) (first {:b 2})]) [1 2])
+    (t/assert= (keys nil) [])
+    (t/assert= (merge m {:c 4 :d 5}) {:a 1, :b 2, :c 4, :d 5})
+    (t/assert= (merge-with + m {:a 10 :d 5}) {:a 11, :b 2, :c 3, :d 5})
+    (t/assert= (merge m [:c 4] [:d 5]) {:a 1, :b 2, :c 4, :d 5})
+    (t/assert= (merge-with + m [:a 10] [:d 5]) {:a 11, :b 2, :c 3, :d 5})))
+
+(t/deftest map-structural-merge
+  (let [a (reduce #(assoc %1 %2 %2) {} (range 1000))
+        b (reduce #(assoc %1 %2 (- %2)) {} (range 500 1500))
+        m (merge a b)]
+    (t/assert= (count m) 1500)
+    (t/assert= (get m 10) 10)
+    (t/assert= (get m 700) -700)
+    (t/assert= (get m 1400) -1400)
+    (t/assert= (merge a a) a)
+    (t/assert= (merge a {}) a)
+    (t/assert= (merge {} a) a)
+    (t/assert= (merge-with + a b) (reduce #(assoc %1 %2 (if (< %2 500) %2 (if (< %2 1000) 0 (- %2)))) {} (range 1500)))
+    (t/assert= (count (merge (assoc a :x 1) (assoc a :y 2))) 1002)))
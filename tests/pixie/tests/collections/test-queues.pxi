@@ -0,0 +1,57 @@
+(ns collections.test-queues
+  (require pixie.test :as t))
+
+(t/deftest test-queue-conj-peek-pop
+  (let [q (queue 1 2 3)]
+    (t/assert= (count q) 3)
+    (t/assert= (peek q) 1)
+    (t/assert= (peek (pop q)) 2)
+    (t/assert= (peek (pop (pop q))) 3)
+    (t/assert= (count (pop (pop (pop q)))) 0)
+    (t/assert= (peek (queue)) nil)
+    (t/assert= (pop (queue)) (queue))
+    (t/assert= (peek (conj (pop q) 4)) 2)
+    (t/assert= (vec (conj (pop q) 4)) [2 3 4])))
+
+(t/deftest test-queue-fifo
+  (let [q (reduce conj (queue) (range 100))]
+    (t/assert= (count q) 100)
+    (t/assert= (loop [q q acc []]
+                 (if (zero? (count q))
+                   acc
+                   (recur (pop q) (conj acc (peek q)))))
+               (vec (range 100)))
+    (t/assert= (loop [q q n 0]
+                 (if (= n 50)
+                   (vec (reduce conj q (range 100 150)))
+                   (recur (pop q) (inc n))))
+               (vec (range 50 150)))))
+
+(t/deftest test-queue-seq-reduce
+  (let [q (conj (pop (queue 1 2 3)) 4 5)]
+    (t/assert= (seq q) '(2 3 4 5))
+    (t/assert= (seq (queue)) nil)
+    (t/assert= (reduce + 0 q) 14)
+    (t/assert= (reduce (fn [acc x] (if (= x 4) (reduced acc) (+ acc x))) 0 q) 5)
+    (t/assert= q [2 3 4 5])
+    (t/assert= (str q) "#queue [2 3 4 5]")))
+
+(t/deftest test-vector-peek
+  (t/assert= (peek [1 2 3]) 3)
+  (t/assert= (peek []) nil))
+
+(t/deftest test-ring-buffer
+  (let [rb (ring-buffer 3)]
+    (t/assert= (count rb) 0)
+    (t/assert= (ring-buffer-poll! rb) nil)
+    (t/assert= (ring-buffer-poll! rb :empty) :empty)
+    (t/assert= (ring-buffer-offer! rb 1) true)
+    (t/assert= (ring-buffer-offer! rb 2) true)
+    (t/assert= (ring-buffer-offer! rb 3) true)
+    (t/assert= (ring-buffer-full? rb) true)
+    (t/assert= (ring-buffer-offer! rb 4) false)
+    (t/assert= (ring-buffer-poll! rb) 1)
+    (t/assert= (ring-buffer-offer! rb 4) true)
+    (t/assert= (count rb) 3)
+    (t/assert= [(ring-buffer-poll! rb) (ring-buffer-poll! rb) (ring-buffer-poll! rb)] [2 3 4])
+    (t/assert= (count rb) 0)))
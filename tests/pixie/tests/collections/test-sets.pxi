@@ -1,6 +1,7 @@
 (ns collections.test-sets
   (require pixie.test :as t)
-  (require pixie.tests.utils :as u))
+  (require pixie.tests.utils :as u)
+  (require pixie.set :as set))
 
 (def worst-hashers (vec (map u/->WorstHasher)
                         (range 100)))
@@ -36,6 +37,20 @@
   (t/assert= (reduce disj (set (vec (range 10))) (range 10)) #{})
   (t/assert= (reduce disj (set worst-hashers) worst-hashers) #{}))
 
+(t/deftest test-reduce-and-iterate
+  (let [s (set (range 1000))
+        g (set worst-hashers)]
+    (t/assert= (reduce + 0 s) (reduce + 0 (range 1000)))
+    (t/assert= (reduce (fn [acc x] (reduced x)) nil #{:a}) :a)
+    (t/assert= (reduce + 0 #{}) 0)
+    (t/assert= (count (seq s)) 1000)
+    (t/assert= (set (seq s)) s)
+    (t/assert= (set (vec g)) g)
+    (t/assert= (count (into [] g)) 100)
+    (t/assert= (get s 999) 999)
+    (t/assert= (get s 1000) nil)
+    (t/assert= (get g (first worst-hashers)) (first worst-hashers))))
+
 (t/deftest test-eq
   (let [s  #{1 2 3}]
     (t/assert= s s)
@@ -69,3 +84,37 @@
 (t/deftest test-conj
   (t/assert= #{1 2} (conj #{1} 2))
   (t/assert= #{1 2 3 4} (conj #{1} 2 3 4)))
+
+(t/deftest test-union
+  (t/assert= (set/union) #{})
+  (t/assert= (set/union #{1 2}) #{1 2})
+  (t/assert= (set/union #{1 2} #{2 3}) #{1 2 3})
+  (t/assert= (set/union #{1} #{2} #{3}) #{1 2 3})
+  (t/assert= (set/union (set (range 1000)) (set (range 500 1500))) (set (range 1500)))
+  (t/assert= (set/union (set (take 50 worst-hashers)) (set (drop 20 worst-hashers))) (set worst-hashers))
+  (t/assert= (count (set/union (set (range 1000)) (set (range 500 1500)))) 1500))
+
+(t/deftest test-intersection
+  (t/assert= (set/intersection #{1 2 3} #{2 3 4}) #{2 3})
+  (t/assert= (set/intersection #{1 2} #{3 4}) #{})
+  (t/assert= (set/intersection #{1 2 3} #{2 3} #{3}) #{3})
+  (t/assert= (set/intersection (set (range 1000)) (set (range 500 1500))) (set (range 500 1000)))
+  (t/assert= (count (set/intersection (set (range 1000)) (set (range 500 1500)))) 500)
+  (t/assert= (set/intersection (set (take 50 worst-hashers)) (set (drop 20 worst-hashers)))
+             (set (take 30 (drop 20 worst-hashers)))))
+
+(t/deftest test-difference
+  (t/assert= (set/difference #{1 2 3} #{2 3 4}) #{1})
+  (t/assert= (set/difference #{1 2 3} #{2} #{3}) #{1})
+  (t/assert= (set/difference (set (range 1000)) (set (range 500 1500))) (set (range 500)))
+  (t/assert= (count (set/difference (set (range 1000)) (set (range 500 1500)))) 500)
+  (t/assert= (set/difference (set worst-hashers) (set (drop 20 worst-hashers)))
+             (set (take 20 worst-hashers))))
+
+(t/deftest test-subset
+  (t/assert= (set/subset? #{} #{1}) true)
+  (t/assert= (set/subset? #{1 2} #{1 2 3}) true)
+  (t/assert= (set/subset? #{1 4} #{1 2 3}) false)
+  (t/assert= (set/subset? (set (range 100 200)) (set (range 1000))) true)
+  (t/assert= (set/subset? (set (range 100 2000)) (set (range 1000))) false)
+  (t/assert= (set/subset? (set (take 20 worst-hashers)) (set worst-hashers)) true))
@@ -75,3 +75,48 @@
   (t/assert= 2 (count (transient [1 2])))
   (t/assert= 1 (count (pop! (transient [1 2]))))
   (t/assert= 100 (count (reduce conj! (transient []) (range 0 100)))))
+
+(t/deftest vector-of-basics
+  (let [iv (into (vector-of :int) (range 100))
+        dv (vector-of :double 1 2.5 3)
+        bv (vector-of :byte 1 255 0)]
+    (t/assert= (count iv) 100)
+    (t/assert= (nth iv 42) 42)
+    (t/assert= (iv 99) 99)
+    (t/assert= (dv 1) 2.5)
+    (t/assert= iv (vec (range 100)))
+    (t/assert= (vec (range 100)) iv)
+    (t/assert= (seq dv) '(1.0 2.5 3.0))
+    (t/assert= (vec bv) [1 255 0])
+    (t/assert-throws? RuntimeException
+                      "vector-of :byte values must be between 0 and 255"
+                      (vector-of :byte 256))
+    (t/assert-throws? RuntimeException
+                      "vector-of :byte values must be between 0 and 255"
+                      (conj (vector-of :byte) -1))
+    (t/assert= (peek iv) 99)
+    (t/assert= (count (pop iv)) 99)
+    (t/assert= (nth (assoc iv 10 -1) 10) -1)
+    (t/assert= (nth iv 10) 10)
+    (t/assert= (conj (vector-of :int) 1) [1])
+    (t/assert= (str (vector-of :int 1 2)) "[1 2]")
+    (t/assert= (hash (vector-of :int 1 2 3)) (hash [1 2 3]))))
+
+(t/deftest vector-of-reduce
+  (let [iv (into (vector-of :int) (range 1000))
+        dv (into (vector-of :double) (range 10))]
+    (t/assert= (reduce + 0 iv) 499500)
+    (t/assert= (reduce + 0.5 iv) 499500.5)
+    (t/assert= (reduce + 0 dv) 45.0)
+    (t/assert= (reduce + 0 (vector-of :double)) 0)
+    (t/assert= (reduce conj [] (vector-of :int 1 2 3)) [1 2 3])
+    (t/assert= (reduce (fn [acc x] (if (= x 5) (reduced acc) (+ acc x))) 0 iv) 10)))
+
+(t/deftest vector-of-seq
+  (let [iv (into (vector-of :int) (range 100))]
+    (t/assert= (seq (vector-of :int)) nil)
+    (t/assert= (seq iv) (range 100))
+    (t/assert= (first (seq iv)) 0)
+    (t/assert= (first (next (seq iv))) 1)
+    (t/assert= (seq (vector-of :byte 1 255 0)) '(1 255 0))
+    (t/assert= (map inc (vector-of :double 1 2.5)) '(2.0 3.5))))
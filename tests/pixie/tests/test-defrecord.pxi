@@ -48,3 +48,9 @@
            (t/assert (contains? t :one))
            (t/assert (contains? t :two))
            (t/assert (contains? t :three))))
+
+(t/deftest test-reduce-kv
+  (foreach [t [t1 t2 t3]]
+           (t/assert (satisfies? IKVReduce t))
+           (t/assert= (reduce-kv (fn [acc k v] (assoc acc k v)) {} t)
+                      {:one 1, :two 2, :three 3})))
@@ -1,6 +1,9 @@
 (ns pixie.tests.test-ffi
   (require pixie.test :as t)
-  (require pixie.math :as m))
+  (require pixie.math :as m)
+  (require pixie.ffi-infer :as i)
+  (require pixie.io-blocking :as io)
+  (require pixie.string :as s))
 
 
 
@@ -36,6 +39,26 @@
 (t/deftest test-ffi-infer
   (t/assert= 0.5 (m/asin (m/sin 0.5))))
 
+(defn- inferred-eof []
+  ;; (do (def EOF <value>))
+  (nth (second (i/run-infer i/*config* [{:op :const :name "EOF"}])) 2))
+
+(t/deftest test-ffi-infer-cache
+  (let [dir "/tmp/pixie-ffi-cache-test"]
+    (io/run-command (str "rm -rf " dir))
+    (binding [i/*cache-dir* dir
+              i/*config* {:includes ["stdio.h"]}]
+      (t/assert= (i/cache-dir) dir)
+      (t/assert= (inferred-eof) -1)
+      ;; Later loads read the cached entry instead of compiling
+      (let [file (str dir "/" (first (s/split (io/run-command (str "ls " dir)) "\n")))
+            [key result] (read-string (io/slurp file))]
+        (io/spit file (str "[" (pr-str key) "\n" (pr-str [(assoc (first result) :value -2)]) "]"))
+        (t/assert= (inferred-eof) -2)
+        ;; A different configuration is a different entry
+        (binding [i/*config* {:includes ["stdio.h"] :cxx-flags ["-DPIXIE_TEST"]}]
+          (t/assert= (inferred-eof) -1))))))
+
 
 (t/deftest test-ffi-callbacks
   (let [MAX 255
@@ -55,3 +78,74 @@
            (dotimes [x (dec MAX)]
              (t/assert (> (pixie.ffi/unpack buf x CUInt8)
                           (pixie.ffi/unpack buf (inc x) CUInt8)))))))
+
+(def point (pixie.ffi/c-struct :point 16 [[:x CInt64 0] [:y CInt64 8]]))
+(def other (pixie.ffi/c-struct :other 8 [[:x CInt64 0]]))
+
+(t/deftest test-struct-accessors
+  (let [x (pixie.ffi/accessor point :x)
+        y (pixie.ffi/accessor point :y)
+        p (pixie.ffi/struct point {:x 1})]
+    (t/assert= (x p) 1)
+    (t/assert= (y p) 0)
+    (y p 42)
+    (t/assert= (:y p) 42)
+    (pixie.ffi/set! p :x 7)
+    (t/assert= (x p) 7)
+    (t/assert-throws? RuntimeException
+                      "Invalid field name: :z"
+                      (pixie.ffi/accessor point :z))
+    (t/assert-throws? RuntimeException
+                      "Expected a point for field :x"
+                      (x (other)))
+    (dispose! p)))
+
+(t/deftest test-typed-arrays
+  (let [a (pixie.ffi/typed-array CDouble [1 2.5 3 -4])
+        b (pixie.ffi/typed-array CDouble 4)]
+    (t/assert= (count a) 4)
+    (t/assert= (nth a 1) 2.5)
+    (t/assert= (vec a) [1.0 2.5 3.0 -4.0])
+    (t/assert= (pixie.ffi/array-sum a) 2.5)
+    (t/assert= (pixie.ffi/array-min a) -4.0)
+    (t/assert= (pixie.ffi/array-max a) 3.0)
+    (pixie.ffi/array-fill! b 2)
+    (t/assert= (pixie.ffi/array-dot a b) 5.0)
+    (pixie.ffi/array-mul! b a b)
+    (t/assert= (vec b) [2.0 5.0 6.0 -8.0])
+    (pixie.ffi/array-add! b b a)
+    (t/assert= (vec b) [3.0 7.5 9.0 -12.0])
+    (let [s (pixie.ffi/array-slice b 1 3)]
+      (t/assert= (vec s) [7.5 9.0])
+      (pixie.ffi/array-set! s 0 0)
+      (t/assert= (nth b 1) 0.0)
+      (pixie.ffi/array-copy! a 0 s 0 2)
+      (t/assert= (vec b) [3.0 1.0 2.5 -12.0]))
+    (t/assert= (pixie.ffi/array-min (pixie.ffi/typed-array CDouble 0)) nil)
+    (dispose! a)
+    (dispose! b)))
+
+(t/deftest test-typed-arrays-in-c
+  (let [memset (ffi-fn libc "memset" [CVoidP CInt CInt] CVoidP)
+        a (pixie.ffi/typed-array CInt [1 2 3])]
+    (memset a 0 (* 2 (pixie.ffi/c-sizeof CInt)))
+    (t/assert= (vec a) [0 0 3])
+    (t/assert= (pixie.ffi/array-sum a) 3)
+    (t/assert-throws? RuntimeException
+                      "Typed arrays of pixie.stdlib.CInt and pixie.stdlib.CDouble can't be mixed"
+                      (pixie.ffi/array-dot a (pixie.ffi/typed-array CDouble 3)))
+    (dispose! a)))
+
+(t/deftest test-bytes
+  (let [strlen (ffi-fn libc "strlen" [CCharP] CInt)
+        s "héllo"
+        b (bytes s)]
+    (t/assert= (count b) 6)
+    (t/assert= (nth b 1) 195)
+    (t/assert= (bytes->string b) s)
+    (t/assert= (str b) s)
+    (t/assert= (identical? b (bytes s)) true)
+    (t/assert= (= b (bytes (string->buffer s))) true)
+    (t/assert= (strlen b) 6)
+    (dotimes [_ 3]
+      (t/assert= (strlen s) 6))))
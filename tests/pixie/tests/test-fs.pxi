@@ -1,6 +1,9 @@
 (ns pixie.tests.test-fs
   (require pixie.test :as t)
-  (require pixie.fs :as fs))
+  (require pixie.fs :as fs)
+  (require pixie.io :as io)
+  (require pixie.async :as async)
+  (require pixie.stacklets :as st))
 
 (t/deftest test-file-comparisons
   "All these paths are the same"
@@ -105,3 +108,74 @@
     (t/assert= (fs/exists? real-dir)  true)
     (t/assert= (fs/exists? fake-dir)  false)
     (t/assert= (fs/exists? fake-file) false)))
+
+(t/deftest test-walker
+  (let [dir-a "tests/pixie/tests/fs"]
+    (t/assert= (set (into [] (fs/walker (fs/dir dir-a) :type :files :glob "foo.*")))
+               #{(fs/file (str dir-a "/parent/foo.txt"))
+                 (fs/file (str dir-a "/parent/child/foo.txt"))})
+    (t/assert= (set (into [] (fs/walker (fs/dir dir-a) :max-depth 2 :extensions ["txt"])))
+               #{(fs/file (str dir-a "/parent/foo.txt"))
+                 (fs/file (str dir-a "/parent/bar.txt"))})
+    (t/assert= (set (into [] (fs/walker (fs/dir dir-a) :type :dirs)))
+               #{(fs/dir (str dir-a "/parent"))
+                 (fs/dir (str dir-a "/parent/child"))})
+    (t/assert= (count (reduce (fn [acc f]
+                                (if (= (count acc) 2)
+                                  (reduced acc)
+                                  (conj acc f)))
+                              []
+                              (fs/walker (fs/dir dir-a))))
+               2)))
+
+(t/deftest test-extension
+  (t/assert= (fs/extension (fs/file "tests/pixie/tests/fs/parent/foo.txt")) "txt")
+  (t/assert= (fs/extension (fs/file "tests/pixie/tests/fs/parent/no-extension")) "")
+  (t/assert= (fs/extension? (fs/file "tests/pixie/tests/fs/parent/foo.txt") "txt") true))
+
+(t/deftest test-stat-cache
+  (let [name "/tmp/pixie-stat-cache.txt"
+        f (fs/file name)]
+    (fs/set-stat-cache-ttl! 60000)
+    (io/spit name "abc")
+    (t/assert= (fs/exists? f) true)
+    (t/assert= (fs/size f) 3)
+    (io/spit name "abcdef")
+    (t/assert= (fs/size f) 6)
+    (fs/set-stat-cache-ttl! 0)))
+
+(t/deftest test-watch
+  (let [dir "/tmp/pixie-watch"
+        _ (io/run-command (str "rm -rf " dir " && mkdir -p " dir "/sub"))
+        calls (atom 0)
+        later (atom #{})
+        first-call (async/promise)
+        second-call (async/promise)
+        watcher (fs/watch dir
+                          (fn [changed]
+                            (if (= (swap! calls inc) 1)
+                              (first-call changed)
+                              ;; the new dir and the file in it may come in one call or two
+                              (let [seen (swap! later into changed)]
+                                (when (contains? seen (str dir "/new/c.txt"))
+                                  (second-call seen)))))
+                          :debounce 50)]
+    (io/spit (str dir "/a.txt") "a")
+    (io/spit (str dir "/sub/b.txt") "b")
+    (t/assert= (contains? @first-call (str dir "/a.txt")) true)
+    (t/assert= (contains? @first-call (str dir "/sub/b.txt")) true)
+    (io/run-command (str "mkdir " dir "/new"))
+    (io/spit (str dir "/new/c.txt") "c")
+    (t/assert= (contains? @second-call (str dir "/new")) true)
+    (dispose! watcher)))
+
+(t/deftest test-watch-poll
+  (let [dir "/tmp/pixie-watch-poll"
+        _ (io/run-command (str "rm -rf " dir " && mkdir -p " dir))
+        _ (io/spit (str dir "/a.txt") "a")
+        changed (async/promise)
+        watcher (fs/watch dir changed :poll 20 :debounce 20)]
+    (st/sleep 50)
+    (io/spit (str dir "/a.txt") "changed")
+    (t/assert= (contains? @changed (str dir "/a.txt")) true)
+    (dispose! watcher)))
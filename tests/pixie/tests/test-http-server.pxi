@@ -0,0 +1,67 @@
+(ns pixie.tests.test-http-server
+  (require pixie.test :as t)
+  (require pixie.streams :refer :all)
+  (require pixie.net :as net)
+  (require pixie.http.server :as http))
+
+(defn read-string-n [conn n]
+  (let [buf (buffer 4096)]
+    (loop [parts []
+           left n]
+      (if (pos? left)
+        (let [cnt (read conn buf 4096)]
+          (assert (pos? cnt) "Connection closed early")
+          (recur (conj parts (buffer->string buf 0 cnt)) (- left cnt)))
+        (apply str parts)))))
+
+(defn closed? [conn]
+  (zero? (read conn (buffer 16) 16)))
+
+(defn handler [request]
+  {:status 200
+   :headers {"Content-Type" "text/plain"}
+   :body (str (:method request) " " (:uri request) " " (:query request) " " (:body request))})
+
+(t/deftest test-get
+  (let [server (http/serve "127.0.0.1" 40410 handler)
+        conn (net/tcp-connect "127.0.0.1" 40410)
+        expected "HTTP/1.1 200 OK\r\nContent-Type: text/plain\r\nContent-Length: 15\r\n\r\nGET /hello x=1 "]
+    (write-all conn ["GET /hello?x=1 HTTP/1.1\r\nHost: localhost\r\n\r\n"])
+    (t/assert= (read-string-n conn (count expected)) expected)
+    (dispose! conn)
+    (dispose! server)))
+
+(t/deftest test-keep-alive-and-pipelining
+  (let [server (http/serve "127.0.0.1" 40411 handler)
+        conn (net/tcp-connect "127.0.0.1" 40411)
+        first-response "HTTP/1.1 200 OK\r\nContent-Type: text/plain\r\nContent-Length: 8\r\n\r\nGET /a  "
+        second-response "HTTP/1.1 200 OK\r\nContent-Type: text/plain\r\nContent-Length: 12\r\n\r\nPOST /b  abc"
+        last-response "HTTP/1.1 200 OK\r\nContent-Type: text/plain\r\nContent-Length: 8\r\nConnection: close\r\n\r\nGET /c  "]
+    (write-all conn ["GET /a HTTP/1.1\r\n\r\n"
+                     "POST /b HTTP/1.1\r\nContent-Length: 3\r\n\r\nabc"])
+    (t/assert= (read-string-n conn (+ (count first-response) (count second-response)))
+               (str first-response second-response))
+    (write-all conn ["GET /c HTTP/1.1\r\nConnection: close\r\n\r\n"])
+    (t/assert= (read-string-n conn (count last-response)) last-response)
+    (t/assert= (closed? conn) true)
+    (dispose! conn)
+    (dispose! server)))
+
+(t/deftest test-chunked-response
+  (let [server (http/serve "127.0.0.1" 40412 (fn [_] {:body ["hello " "" "world"]}))
+        conn (net/tcp-connect "127.0.0.1" 40412)
+        expected "HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n6\r\nhello \r\n5\r\nworld\r\n0\r\n\r\n"]
+    (write-all conn ["GET / HTTP/1.1\r\n\r\n"])
+    (t/assert= (read-string-n conn (count expected)) expected)
+    (dispose! conn)
+    (dispose! server)))
+
+(t/deftest test-bad-request
+  (let [server (http/serve "127.0.0.1" 40413 handler)
+        conn (net/tcp-connect "127.0.0.1" 40413)
+        expected "HTTP/1.1 400 Bad Request\r\nContent-Type: text/plain\r\nContent-Length: 11\r\nConnection: close\r\n\r\nBad Request"]
+    (write-all conn ["NOT HTTP\r\n\r\n"])
+    (t/assert= (read-string-n conn (count expected)) expected)
+    (t/assert= (closed? conn) true)
+    (dispose! conn)
+    (dispose! server)))
@@ -0,0 +1,33 @@
+(ns pixie.tests.test-inspect
+  (require pixie.test :as t)
+  (require pixie.inspect :as i))
+
+(deftype Pair [left right])
+
+(t/deftest test-footprint-dedups-shared-nodes
+  (let [v (vec (range 1000))
+        single (i/footprint v)
+        twice (i/footprint [v v])]
+    (t/assert (pos? (:bytes single)))
+    (t/assert= (:shared-bytes single) 0)
+    (t/assert (< (:bytes twice) (+ (:bytes single) 200)))
+    (t/assert= (get (:types single) "pixie.stdlib.PersistentVector") 1)))
+
+(t/deftest test-footprint-baseline
+  (let [m (into {} (map (fn [x] [x x]) (range 1000)))
+        m2 (assoc m 5 :changed)
+        fp (i/footprint m2 m)]
+    (t/assert (< (- (:bytes fp) (:shared-bytes fp)) 1000))
+    (t/assert= (:shared-bytes (i/footprint m m)) (:bytes (i/footprint m)))
+    (t/assert= (:shared-bytes (i/footprint m {})) 0)))
+
+(t/deftest test-footprint-strings-and-records
+  (t/assert (< (:bytes (i/footprint "a")) (:bytes (i/footprint "a much longer string"))))
+  (t/assert= (:objects (i/footprint (list 1 2 3))) 6)
+  (let [v (vec (range 100))]
+    (t/assert (< (:bytes (i/footprint (->Pair "a" nil)))
+                 (:bytes (i/footprint (->Pair "a much longer string" nil)))))
+    (t/assert (> (:bytes (i/footprint (->Pair v nil)))
+                 (:bytes (i/footprint v))))
+    (t/assert= (:shared-bytes (i/footprint (->Pair v v) v))
+               (:bytes (i/footprint v)))))
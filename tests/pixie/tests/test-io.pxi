@@ -1,6 +1,7 @@
 (ns pixie.tests.test-io
   (require pixie.test :as t)
-  (require pixie.io :as io))
+  (require pixie.io :as io)
+  (require pixie.streams :as st))
 
 (t/deftest test-file-reduction
   (let [f (io/open-read "tests/pixie/tests/test-io.txt")]
@@ -28,3 +29,114 @@
   (let [val (vec (range 1280))]
     (io/spit "test.tmp" val)
     (t/assert= val (read-string (io/slurp "test.tmp")))))
+
+(t/deftest test-buffered-reader
+  (let [f (io/open-read "tests/pixie/tests/test-lines.txt")
+        r (st/buffered-reader f 4)]
+    (t/assert= (vec (io/line-seq r))
+               ["first" "second line is longer" "" "λ unicode" "last"])
+    (dispose! r)
+    (dispose! f)))
+
+;; An IInputStream that is not an ILineReader, handing out one byte per read
+(deftype ByteSource [bytes idx])
+
+(extend st/read ByteSource
+        (fn [this buf len]
+          (let [idx (get-field this :idx)
+                bytes (get-field this :bytes)]
+            (if (< idx (count bytes))
+              (do (pixie.ffi/pack! buf 0 CUInt8 (nth bytes idx))
+                  (set-buffer-count! buf 1)
+                  (set-field! this :idx (inc idx))
+                  1)
+              (do (set-buffer-count! buf 0)
+                  0)))))
+
+(t/deftest test-read-line-input-stream
+  (let [in (->ByteSource (vec (map int "one\ntwo")) 0)]
+    (t/assert= (io/read-line in) "one")
+    (t/assert= (io/read-line in) "two")
+    (t/assert= (io/read-line in) nil)))
+
+(t/deftest test-buffer-index-of
+  (let [b (string->buffer "a,b")]
+    (t/assert= (buffer-index-of b 0 (int \,)) 1)
+    (t/assert= (buffer-index-of b 2 (int \,)) -1)
+    (t/assert-throws? RuntimeException
+                      "Start index must not be negative"
+                      (buffer-index-of b -1 (int \,)))))
+
+(t/deftest test-slurp-spit-utf8
+  (let [val (apply str "λ → ü " (repeat 20000 "abcdefgh"))]
+    (io/spit "test.tmp" val)
+    (t/assert= val (io/slurp "test.tmp"))
+    (io/spit "test.tmp" "short")
+    (t/assert= "short" (io/slurp "test.tmp"))))
+
+(t/deftest test-buffer-size-option
+  (let [f (io/open-read "tests/pixie/tests/test-io.txt" :buffer-size 8)]
+    (t/assert= (transduce (map identity)
+                          count-rf
+                          f)
+               91)
+    (dispose! f)))
+
+(t/deftest test-buffer-pool
+  (let [b (checkout-buffer 100)]
+    (t/assert= (buffer-capacity b) 128)
+    (t/assert= (count b) 0)
+    (return-buffer! b)))
+
+(t/deftest test-read-ahead-reduction
+  (let [expected (io/slurp "tests/pixie/tests/test-io.txt")]
+    (doseq [depth [1 3]]
+      (let [f (io/open-read "tests/pixie/tests/test-io.txt" :buffer-size 8 :read-ahead depth)]
+        (t/assert= (transduce (map char) string-builder f) expected)
+        (dispose! f)))
+    (let [f (io/open-read "tests/pixie/tests/test-io.txt" :buffer-size 8 :read-ahead 2)]
+      (t/assert= (transduce (take 10) count-rf f) 10)
+      (dispose! f))))
+
+(t/deftest test-mmap-file
+  (let [m (io/mmap-file "tests/pixie/tests/test-io.txt")
+        s (io/mmap-slice m 78 90)]
+    (t/assert= (count m) 91)
+    (t/assert= (transduce (map identity) count-rf m) 91)
+    (t/assert= (apply str (map char s)) "Second line.")
+    (t/assert= (nth s 0) (int \S))
+    (t/assert= (nth m 100 :none) :none)
+    (t/assert= (pixie.ffi/unpack (io/mmap-pointer s) 1 CUInt8) (int \e))
+    (dispose! m)))
+
+(t/deftest test-write-all
+  (let [out (io/open-write "test.tmp")
+        rows (map (fn [i] (str i ",λ\n")) (range 200))]
+    (st/write-all out (cons (string->buffer "header\n") rows))
+    (dispose! out)
+    (t/assert= (io/slurp "test.tmp") (apply str "header\n" rows))))
+
+(t/deftest test-gathering-output-stream
+  (let [out (io/open-write "test.tmp")
+        g (st/gathering-output-stream out 16)]
+    (dotimes [i 100]
+      (st/write-all g [(str i) " "]))
+    (write g (string->buffer "end"))
+    (dispose! g)
+    (dispose! out)
+    (t/assert= (io/slurp "test.tmp")
+               (str (apply str (map (fn [i] (str i " ")) (range 100))) "end"))))
+
+(t/deftest test-list-and-walk-dir
+  (let [dir "tests/pixie/tests/fs/parent"]
+    (t/assert= (set (io/list-dir dir))
+               #{["foo.txt" :file] ["bar.txt" :file] ["child" :dir]})
+    (t/assert= (set (into [] (io/walk-dir dir)))
+               #{[(str dir "/foo.txt") :file]
+                 [(str dir "/bar.txt") :file]
+                 [(str dir "/child") :dir]
+                 [(str dir "/child/foo.txt") :file]
+                 [(str dir "/child/bar.txt") :file]})
+    (t/assert= (count (into [] (io/walk-dir dir :max-depth 1))) 3)
+    (t/assert= (reduce (fn [_ entry] (reduced entry)) nil (io/walk-dir dir :max-depth 1))
+               (first (into [] (io/walk-dir dir :max-depth 1))))))
@@ -0,0 +1,91 @@
+(ns pixie.tests.test-net
+  (require pixie.test :as t)
+  (require pixie.streams :as st :refer :all)
+  (require pixie.async :as async)
+  (require pixie.net :as net))
+
+(defn echo [conn]
+  (let [buf (buffer 4096)]
+    (loop []
+      (when (pos? (read conn buf 4096))
+        (write conn buf)
+        (recur)))))
+
+(defn discard [conn]
+  (let [buf (buffer 4096)]
+    (loop []
+      (when (pos? (read conn buf 4096))
+        (recur)))))
+
+(defn read-string-n [conn n]
+  (let [buf (buffer 4096)]
+    (loop [parts []
+           left n]
+      (if (pos? left)
+        (let [cnt (read conn buf 4096)]
+          (assert (pos? cnt) "Connection closed early")
+          (recur (conj parts (buffer->string buf 0 cnt)) (- left cnt)))
+        (apply str parts)))))
+
+(t/deftest test-echo
+  (let [server (net/tcp-server "127.0.0.1" 40401 echo :backlog 16)
+        conn (net/tcp-connect "127.0.0.1" 40401 :no-delay true :keep-alive 60)]
+    (write conn (string->buffer "hello"))
+    (t/assert= (read-string-n conn 5) "hello")
+    (write-all conn ["hello " "again"])
+    (t/assert= (read-string-n conn 11) "hello again")
+    (dispose! conn)
+    (dispose! server)))
+
+(t/deftest test-many-connections
+  (let [server (net/tcp-server "127.0.0.1" 40402 echo)
+        clients (vec (map (fn [i]
+                            (async/future
+                              (let [conn (net/tcp-connect "127.0.0.1" 40402)
+                                    msg (str "client " i)]
+                                (write conn (string->buffer msg))
+                                (let [result (read-string-n conn (count msg))]
+                                  (dispose! conn)
+                                  result))))
+                          (range 50)))]
+    (t/assert= (vec (map deref clients))
+               (vec (map (fn [i] (str "client " i)) (range 50))))
+    (dispose! server)))
+
+(t/deftest test-large-transfer
+  (let [server (net/tcp-server "127.0.0.1" 40403 echo)
+        conn (net/tcp-connect "127.0.0.1" 40403 :write-high-water (* 64 1024))
+        chunk (string->buffer (apply str (repeat 65536 "a")))
+        total (* 64 65536)
+        writer (async/future
+                 (dotimes [i 64]
+                   (write conn chunk))
+                 (flush conn)
+                 :done)
+        buf (buffer 65536)]
+    (t/assert= (loop [received 0]
+                 (if (< received total)
+                   (let [cnt (read conn buf 65536)]
+                     (assert (= (nth buf 0) (int \a)))
+                     (recur (+ received cnt)))
+                   received))
+               total)
+    (t/assert= @writer :done)
+    (dispose! conn)
+    (dispose! server)))
+
+(t/deftest test-write-parks-until-low-water
+  (let [high-water (* 64 1024)
+        server (net/tcp-server "127.0.0.1" 40404 discard)
+        conn (net/tcp-connect "127.0.0.1" 40404 :write-high-water high-water)
+        chunk (string->buffer (apply str (repeat (quot high-water 4) "a")))
+        parked (atom 0)]
+    (dotimes [i 32]
+      (let [before (get-field conn :pending-bytes)]
+        (write conn chunk)
+        (when (> (+ before (count chunk)) high-water)
+          (swap! parked inc)
+          (t/assert (<= (get-field conn :pending-bytes) (quot high-water 2))))))
+    (t/assert (pos? @parked))
+    (dispose! conn)
+    (dispose! server)))
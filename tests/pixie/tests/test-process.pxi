@@ -0,0 +1,40 @@
+(ns pixie.tests.test-process
+  (require pixie.test :as t)
+  (require pixie.streams :refer :all)
+  (require pixie.async :as async)
+  (require pixie.process :as p))
+
+(t/deftest test-run
+  (t/assert= (p/run ["echo" "hello"]) {:exit 0 :out "hello\n" :err ""})
+  (t/assert= (p/run ["sh" "-c" "echo oops >&2; exit 3"]) {:exit 3 :out "" :err "oops\n"})
+  (t/assert= (:out (p/run ["sh" "-c" "echo $GREETING"] :env {"GREETING" "hi"})) "hi\n")
+  (t/assert= (:out (p/run ["pwd"] :cwd "/")) "/\n"))
+
+(t/deftest test-stdin
+  (let [proc (p/spawn ["cat"] :stderr :ignore)
+        buf (buffer 64)]
+    (write-all (:stdin proc) ["from pixie"])
+    (dispose! (:stdin proc))
+    (t/assert= (read (:stdout proc) buf 64) 10)
+    (t/assert= (buffer->string buf 0 10) "from pixie")
+    (t/assert= (read (:stdout proc) buf 64) 0)
+    (dispose! (:stdout proc))
+    (t/assert= @(:exit proc) 0)))
+
+(t/deftest test-kill
+  (let [proc (p/spawn ["sleep" "10"] :stdin :ignore :stdout :ignore :stderr :ignore)]
+    (p/kill proc)
+    (t/assert= @(:exit proc) (+ 128 p/SIGTERM))
+    (p/kill proc)))
+
+(t/deftest test-many-commands
+  (let [results (vec (map (fn [i]
+                            (async/future (:out (p/run ["echo" (str i)]))))
+                          (range 100)))]
+    (t/assert= (vec (map deref results))
+               (vec (map (fn [i] (str i "\n")) (range 100))))))
+
+(t/deftest test-spawn-failure
+  (t/assert-throws? RuntimeException
+                     "UV Error: ENOENT"
+                     (p/spawn ["/no/such/program"])))
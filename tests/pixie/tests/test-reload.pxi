@@ -0,0 +1,30 @@
+(ns pixie.tests.test-reload
+  (require pixie.test :as t)
+  (require pixie.io :as io)
+  (require pixie.reload :as reload))
+
+(def dir "/tmp/pixie-reload")
+
+(defn write-ns [name requires value]
+  (io/spit (str dir "/pixie-reload-test/" name ".pxi")
+           (str "(ns pixie-reload-test." name " "
+                (apply str (map (fn [r] (str "(require pixie-reload-test." r ")")) requires))
+                ")\n(def value " value ")\n")))
+
+(t/deftest test-reload-files
+  (io/run-command (str "rm -rf " dir " && mkdir -p " dir "/pixie-reload-test"))
+  (let [saved-load-paths @load-paths]
+    (swap! load-paths conj dir)
+    (write-ns "base" [] 1)
+    (write-ns "user" ["base"] "(inc pixie-reload-test.base/value)")
+    (write-ns "other" [] 10)
+    ;; recorded as required by user, which has no file and must not be reloaded
+    (load-ns 'pixie-reload-test.user)
+    (load-ns 'pixie-reload-test.other)
+    (t/assert= @(resolve 'pixie-reload-test.user/value) 2)
+    (write-ns "base" [] 41)
+    (t/assert= (reload/reload-files [(str dir "/pixie-reload-test/base.pxi")])
+               '[pixie-reload-test.base pixie-reload-test.user])
+    (t/assert= @(resolve 'pixie-reload-test.user/value) 42)
+    (t/assert= (reload/reload-files ["/no/such/file.pxi"]) [])
+    (reset! load-paths saved-load-paths)))
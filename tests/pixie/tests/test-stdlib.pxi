@@ -50,7 +50,24 @@
   (t/assert= (-repr {:a 1}) "{:a 1}")
   (t/assert= (-repr (type 3)) "pixie.stdlib.Integer")
 
-  (t/assert= (-repr [1 {:a 1} "hey"]) "[1 {:a 1} \"hey\"]"))
+  (t/assert= (-repr [1 {:a 1} "hey"]) "[1 {:a 1} \"hey\"]")
+  (t/assert= (-repr "a\"b\nc\td") "\"a\\\"b\\nc\\td\"")
+  (t/assert= (-repr "") "\"\""))
+
+(t/deftest test-print-writers
+  (t/assert= (pr-str) "")
+  (t/assert= (pr-str 1 "two" [:three #{4}] (list 5 (map inc [5])))
+             "1 \"two\" [:three #{4}] (5 (6))")
+  (t/assert= (pr-str {:a ["b" {:c nil}]}) "{:a [\"b\" {:c nil}]}")
+  (let [sb (-string-builder)]
+    (binding [*out* sb]
+      (pr [1 "x"])
+      (print " " [1 "x"])
+      (println))
+    (t/assert= (str sb) "[1 \"x\"]  [1 x]\n"))
+  (let [sb (-string-builder)]
+    (-print-repr {:k [(into (vector-of :int) [1 2])]} sb)
+    (t/assert= (str sb) "{:k [[1 2]]}")))
 
 (t/deftest test-nth
   ;; works if the index is found
@@ -408,3 +425,21 @@
 (t/deftest test-frequencies
   (t/assert= (frequencies [1 2 3 4 3 2 1])
              {1 2, 2 2, 3 2, 4 1}))
+
+(t/deftest test-std-writers
+  (t/assert= (type *out*) StdWriter)
+  (t/assert= (type *err*) StdWriter)
+  (t/assert= (set-buffer-mode! *err* :none) *err*)
+  (t/assert= (set-buffer-mode! *err* :line) *err*)
+  (t/assert-throws? RuntimeException
+                    "Unknown buffer mode :sometimes, expected :line, :full or :none"
+                    (set-buffer-mode! *err* :sometimes))
+  (t/assert= (print) nil)
+  (t/assert= (flush-out) nil)
+  (let [sb (-string-builder)]
+    (binding [*out* sb]
+      (t/assert= (print "a" 1 :b) nil)
+      (t/assert= (println "c" [2 "d"]) nil)
+      (println)
+      (prn "e" \x))
+    (t/assert= (str sb) "a 1 :bc [2 d]\n\n\"e\" \\x\n")))